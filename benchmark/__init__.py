@@ -0,0 +1,24 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Benchmarks for Darkwing's ingest code.
+
+Each module in this package is a standalone script that generates synthetic scan data
+and reports throughput, e.g.:
+
+    $ python -m benchmark.parser_engines --hosts 5000
+"""
@@ -0,0 +1,102 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Benchmark how long a bulk insert of host documents blocks the thread that runs it.
+
+Before sending an insert, the driver encodes every document to BSON. For plain dicts
+that is real work; for documents that were encoded ahead of time with
+:func:`darkwing.nmap.documents.raw_host_document` it is just a copy of their bytes.
+This measures the driver's encoding step for one batch of each kind, i.e. the time
+that moves off the database write path and into the conversion worker.
+
+It also measures reading the ``_id`` and the scan summary back out of raw documents,
+which decodes them on the thread that runs the insert. The conversion worker returns
+the IDs and summary alongside the raw documents, computing the summary from the dicts,
+so that the write path never does this.
+
+    $ python -m benchmark.bson_encode
+"""
+
+import argparse
+
+import bson
+
+from bson.raw_bson import RawBSONDocument
+
+from darkwing.database.host import hosts_summary
+from darkwing.nmap.documents import encode_document, host_document
+from darkwing.nmap.parser import Host as NmapHost, NmapXmlParser
+
+from .synthetic import nmap_scan, timer
+
+
+def measure(docs, rounds: int) -> float:
+    """ Return the best time to encode ``docs`` out of several rounds. """
+    best = float("inf")
+    for _ in range(rounds):
+        with timer() as elapsed:
+            for doc in docs:
+                bson.encode(doc)
+        best = min(best, elapsed[0])
+    return best
+
+
+def measure_reads(raw_docs, read, rounds: int) -> float:
+    """ Return the best time to call ``read`` on freshly wrapped raw documents. """
+    best = float("inf")
+    for _ in range(rounds):
+        # A raw document caches what it decodes, so start from fresh ones.
+        fresh = [RawBSONDocument(doc.raw) for doc in raw_docs]
+        with timer() as elapsed:
+            read(fresh)
+        best = min(best, elapsed[0])
+    return best
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--hosts", type=int, default=10000)
+    arg_parser.add_argument("--ports", type=int, default=20)
+    arg_parser.add_argument("--rounds", type=int, default=3)
+    args = arg_parser.parse_args()
+
+    parser = NmapXmlParser()
+    parser.feed(nmap_scan(args.hosts, args.ports))
+    events = [e for e in parser.events() if isinstance(e, NmapHost)]
+    docs = [host_document(e) for e in events]
+    for doc in docs:
+        doc["_id"] = bson.ObjectId()
+
+    with timer() as elapsed:
+        raw_docs = [encode_document(dict(doc)) for doc in docs]
+    print(f"{len(docs)} hosts, pre-encoding in the worker: {elapsed[0] * 1e3:.1f} ms")
+
+    plain = measure(docs, args.rounds)
+    raw = measure(raw_docs, args.rounds)
+    print(f"  driver encoding, dict docs: {plain * 1e3:8.1f} ms")
+    print(f"  driver encoding, raw docs:  {raw * 1e3:8.1f} ms")
+    ids = measure_reads(raw_docs, lambda ds: [d["_id"] for d in ds], args.rounds)
+    print(f"  reading IDs from raw docs:  {ids * 1e3:8.1f} ms")
+    summary = measure_reads(raw_docs, hosts_summary, args.rounds)
+    print(f"  summarizing raw docs:       {summary * 1e3:8.1f} ms")
+    with timer() as elapsed:
+        hosts_summary(docs)
+    print(f"  summarizing dicts:          {elapsed[0] * 1e3:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
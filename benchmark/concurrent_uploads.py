@@ -0,0 +1,78 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Benchmark concurrent uploads parsed in threads versus in a ParsePool.
+
+Several uploads are ingested at the same time, first with the threaded pipeline and
+then with a pool of worker processes. Database writes are replaced with a no-op so that
+only parsing and conversion are measured. Threads share one core because the parser
+holds the GIL, so their throughput should stay flat as uploads are added, while the
+pool's throughput should grow with the number of cores.
+
+    $ python -m benchmark.concurrent_uploads --uploads 4 --workers 4
+"""
+
+import argparse
+from base64 import b64encode
+import os
+
+import trio
+
+from darkwing.ingest.pipeline import ingest_base64
+from darkwing.ingest.workers import ParsePool
+
+from .ingest_pipeline import fake_scan_db
+from .synthetic import nmap_scan, timer
+
+
+async def run_uploads(data: str, uploads: int, pool) -> float:
+    """ Ingest ``uploads`` copies of ``data`` concurrently and return the time taken. """
+    with timer() as elapsed:
+        async with trio.open_nursery() as nursery:
+            for _ in range(uploads):
+                nursery.start_soon(lambda: ingest_base64(None, data, pool=pool))
+    return elapsed[0]
+
+
+async def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--hosts", type=int, default=5000)
+    arg_parser.add_argument("--ports", type=int, default=20)
+    arg_parser.add_argument("--uploads", type=int, default=4)
+    arg_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = arg_parser.parse_args()
+
+    fake_scan_db(0)
+    data = b64encode(nmap_scan(args.hosts, args.ports)).decode("ascii")
+    total = args.hosts * args.uploads
+    print(f"{args.uploads} uploads of {args.hosts} hosts, {args.workers} workers")
+
+    elapsed = await run_uploads(data, args.uploads, None)
+    print(f"  threads: {total / elapsed:8.0f} hosts/sec")
+
+    pool = ParsePool(args.workers)
+    try:
+        # Warm up the pool so that process start-up is not measured.
+        await run_uploads(data, 1, pool)
+        elapsed = await run_uploads(data, args.uploads, pool)
+        print(f"     pool: {total / elapsed:8.0f} hosts/sec")
+    finally:
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    trio.run(main)
@@ -0,0 +1,77 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Benchmark converting parsed nmap hosts into MongoDB documents.
+
+The same parser events are converted by two paths, so that parsing is not included in
+the measurement:
+
+* model: :func:`darkwing.nmap.loader.convert_host` followed by the ``ScanDb``
+  serializer, which builds :mod:`darkwing.model` objects and then dicts.
+* direct: :func:`darkwing.nmap.documents.host_document`, which builds the dicts
+  straight from the parser events.
+
+    $ python -m benchmark.document_convert
+"""
+
+import argparse
+
+from darkwing.database.scan import _host_to_dict
+from darkwing.nmap.documents import host_document
+from darkwing.nmap.loader import convert_host
+from darkwing.nmap.parser import Host as NmapHost, NmapXmlParser
+
+from .synthetic import nmap_scan, timer
+
+
+def model_path(event):
+    return _host_to_dict(convert_host(event))
+
+
+def measure(convert, events, rounds: int) -> float:
+    """ Return the best time to convert all of ``events`` out of several rounds. """
+    best = float("inf")
+    for _ in range(rounds):
+        with timer() as elapsed:
+            for event in events:
+                convert(event)
+        best = min(best, elapsed[0])
+    return best
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--hosts", type=int, default=5000)
+    arg_parser.add_argument("--ports", type=int, default=20)
+    arg_parser.add_argument("--rounds", type=int, default=3)
+    args = arg_parser.parse_args()
+
+    parser = NmapXmlParser()
+    parser.feed(nmap_scan(args.hosts, args.ports))
+    events = [e for e in parser.events() if isinstance(e, NmapHost)]
+    ports = sum(len(e.ports) for e in events)
+    print(f"{len(events)} hosts, {ports} ports")
+
+    model = measure(model_path, events, args.rounds)
+    direct = measure(host_document, events, args.rounds)
+    print(f"   model: {len(events) / model:9.0f} hosts/sec")
+    print(f"  direct: {len(events) / direct:9.0f} hosts/sec")
+    print(f" speedup: {model / direct:9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
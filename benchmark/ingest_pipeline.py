@@ -0,0 +1,107 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Benchmark the staged upload pipeline against the sequential upload path.
+
+No database is needed: ``ScanDb`` writes are replaced by a sleep that simulates the
+round trip of an insert, so that the benchmark shows how much parsing and conversion
+overlap with waiting on the database, and what the per-stage statistics look like
+when the writer is the bottleneck (long write latency) or the parser is (short).
+
+    $ python -m benchmark.ingest_pipeline
+"""
+
+import argparse
+from base64 import b64decode, b64encode
+
+import trio
+
+from darkwing.database.scan import ScanDb
+from darkwing.ingest.pipeline import ingest_base64
+from darkwing.nmap.documents import raw_host_document
+from darkwing.nmap.loader import iter_scan
+
+from .synthetic import nmap_scan, timer
+
+
+def fake_scan_db(latency_per_host: float):
+    """ Replace the ScanDb methods that ingest uses with sleeps and no-ops. """
+
+    async def start_scan(db, scan, source=None):
+        return "0" * 24
+
+    async def find_scan_by_hash(db, content_hash):
+        # Every upload is new, i.e. content hashes are never duplicates.
+        return None
+
+    async def insert_host_documents(db, scan_id, docs, host_ids=None, summary=None):
+        await trio.sleep(latency_per_host * len(docs))
+
+    async def finish_scan(db, scan_id, completed, content_hash=None):
+        pass
+
+    async def delete_scan(db, scan_id, host_ids=()):
+        pass
+
+    ScanDb.start_scan = start_scan
+    ScanDb.find_scan_by_hash = find_scan_by_hash
+    ScanDb.insert_host_documents = insert_host_documents
+    ScanDb.finish_scan = finish_scan
+    ScanDb.delete_scan = delete_scan
+
+
+async def sequential(data: str, batch_size: int):
+    """ Decode, parse and convert everything, then write it. """
+    scan, batches = iter_scan(
+        b64decode(data), batch_size=batch_size, convert=raw_host_document
+    )
+    batches = list(batches)
+    scan_id = await ScanDb.start_scan(None, scan)
+    for batch in batches:
+        await ScanDb.insert_host_documents(None, scan_id, batch)
+    await ScanDb.finish_scan(None, scan_id, scan.completed)
+
+
+async def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--hosts", type=int, default=10000)
+    arg_parser.add_argument("--ports", type=int, default=20)
+    arg_parser.add_argument("--batch-size", type=int, default=1000)
+    args = arg_parser.parse_args()
+
+    data = b64encode(nmap_scan(args.hosts, args.ports)).decode("ascii")
+    print(f"{args.hosts} hosts, {len(data) / 1e6:.1f} MB of base64")
+    for latency in (10e-6, 100e-6):
+        fake_scan_db(latency)
+        print(f"simulated insert latency {latency * 1e6:.0f} µs/host")
+        with timer() as elapsed:
+            await sequential(data, args.batch_size)
+        print(f"  sequential: {elapsed[0]:6.2f} sec")
+        with timer() as elapsed:
+            _, stats = await ingest_base64(None, data, batch_size=args.batch_size)
+        print(f"   pipelined: {elapsed[0]:6.2f} sec")
+        for stage in (stats.parse, stats.convert, stats.write):
+            print(
+                f"    {stage.name:>7}: busy {stage.busy:5.2f} sec  "
+                f"blocked {stage.blocked:5.2f} sec  "
+                f"{stage.throughput:8.0f} hosts/sec  "
+                f"queue mean {stage.queue_mean:4.1f} max {stage.queue_max}"
+            )
+
+
+if __name__ == "__main__":
+    trio.run(main)
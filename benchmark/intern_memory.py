@@ -0,0 +1,61 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Measure the memory saved by the nmap parser's string interning pool.
+
+A synthetic /16 scan is parsed twice, with and without interning, and the memory
+retained by the resulting Host events is compared. The loader's models and the
+database documents reuse the same string objects, so they share the savings.
+
+    $ python -m benchmark.intern_memory --hosts 65536 --ports 5
+"""
+
+import argparse
+
+from darkwing.nmap.parser import NmapXmlParser
+
+from .parser_memory import retained_bytes
+from .synthetic import nmap_scan
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--hosts", type=int, default=65536)
+    arg_parser.add_argument("--ports", type=int, default=5)
+    arg_parser.add_argument("--engine", default="sax", choices=NmapXmlParser.ENGINES)
+    args = arg_parser.parse_args()
+
+    data = nmap_scan(args.hosts, args.ports)
+    print(
+        f"Synthetic scan: {args.hosts} hosts, {args.ports} ports per host, "
+        f"{len(data) / 1e6:.1f} MB ({args.engine} engine)"
+    )
+    results = dict()
+    for label, limit in (("no interning", 0), ("interning", 4096)):
+        hosts, retained = retained_bytes(data, engine=args.engine, intern_limit=limit)
+        results[label] = retained
+        print(
+            f"  {label:>12}: {retained / 1e6:8.1f} MB, {retained / hosts:6.0f} B/host"
+        )
+    saved = results["no interning"] - results["interning"]
+    print(
+        f"  {'saved':>12}: {saved / 1e6:8.1f} MB ({saved / results['no interning']:.0%})"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Measure masscan ingest throughput for the XML and JSON formats.
+
+    $ python -m benchmark.masscan_ingest --records 1000000 --hosts 200000
+"""
+
+import argparse
+import os
+import tempfile
+
+from darkwing.masscan.loader import DEFAULT_WINDOW, iter_masscan
+
+from .synthetic import masscan_json, masscan_xml, timer
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--records", type=int, default=500000)
+    arg_parser.add_argument("--hosts", type=int, default=100000)
+    arg_parser.add_argument("--window", type=int, default=DEFAULT_WINDOW)
+    args = arg_parser.parse_args()
+
+    print(f"{args.records} records over {args.hosts} hosts, window={args.window}")
+    for name, generate in (("json", masscan_json), ("xml", masscan_xml)):
+        with tempfile.NamedTemporaryFile(suffix=f".{name}") as file:
+            file.write(generate(args.records, args.hosts))
+            file.flush()
+            size = os.path.getsize(file.name)
+            with timer() as elapsed:
+                _, hosts = iter_masscan(file.name, args.window)
+                host_count = sum(1 for _ in hosts)
+            print(
+                f"  {name:>4}: {args.records / elapsed[0]:10,.0f} records/sec "
+                f"{host_count / elapsed[0]:10,.0f} hosts/sec "
+                f"{size / elapsed[0] / 1e6:6.1f} MB/sec ({host_count} hosts emitted)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Measure how parallel parsing of a single scan file scales with worker processes.
+
+    $ python -m benchmark.parallel_parse --hosts 50000 --workers 1 2 4 8
+"""
+
+import argparse
+import os
+import tempfile
+
+from darkwing.nmap.loader import load_path
+from darkwing.nmap.parallel import load_scan_parallel
+
+from .synthetic import nmap_scan, timer
+
+
+def main():
+    cpus = os.cpu_count() or 1
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--hosts", type=int, default=20000)
+    arg_parser.add_argument("--ports", type=int, default=20)
+    arg_parser.add_argument("--engine", default="lxml")
+    arg_parser.add_argument(
+        "--workers", type=int, nargs="+", default=sorted({1, 2, cpus // 2 or 1, cpus}),
+    )
+    args = arg_parser.parse_args()
+
+    with tempfile.NamedTemporaryFile(suffix=".xml") as file:
+        file.write(nmap_scan(args.hosts, args.ports))
+        file.flush()
+        size = os.path.getsize(file.name)
+        print(f"Synthetic scan: {args.hosts} hosts, {size / 1e6:.1f} MB, {cpus} CPUs")
+
+        with timer() as elapsed:
+            scan = load_path(file.name, engine=args.engine)
+        serial = elapsed[0]
+        print(f"   serial: {len(scan.hosts) / serial:10,.0f} hosts/sec")
+
+        for workers in args.workers:
+            with timer() as elapsed:
+                scan = load_scan_parallel(file.name, workers, engine=args.engine)
+            assert len(scan.hosts) == args.hosts
+            print(
+                f"{workers:>3} proc: {len(scan.hosts) / elapsed[0]:10,.0f} hosts/sec "
+                f"({serial / elapsed[0]:.2f}x)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Microbenchmark for the nmap parser's element dispatch and text capture.
+
+Two synthetic workloads are parsed with each engine, both by the current parser and by
+a copy of the original dispatch code (``getattr`` per element and ``str +=`` text
+capture), so that the speedup is measured on every run:
+
+* element-heavy: many hosts with many small <port> elements and no text.
+* text-heavy: NSE <elem> bodies with thousands of lines, which the XML engines deliver
+  to the parser as thousands of separate text pieces.
+
+    $ python -m benchmark.parser_dispatch
+"""
+
+import argparse
+import random
+
+from darkwing.nmap.parser import NmapXmlParser
+
+from .synthetic import chunks, nmap_footer, nmap_header, nmap_scan, timer
+
+
+class LegacyDispatchParser(NmapXmlParser):
+    """ The parser with its original dispatch and text capture code. """
+
+    def startElement(self, name, attrs):
+        try:
+            callback = getattr(self, f"_start_{name}")
+        except AttributeError:
+            return
+        callback(attrs)
+
+    def endElement(self, name):
+        try:
+            callback = getattr(self, f"_stop_{name}")
+        except AttributeError:
+            return
+        callback()
+
+    def characters(self, content):
+        if self._capture_text is not None:
+            self._capture_text += content
+
+    def start_text_capture(self):
+        self._capture_text = ""
+
+    def stop_text_capture(self):
+        text = self._capture_text
+        self._capture_text = None
+        return text
+
+
+def text_heavy_scan(hosts: int, lines: int, seed: int = 0) -> bytes:
+    """ Generate a scan where each host has a script with a very long <elem> body. """
+    rng = random.Random(seed)
+    parts = [nmap_header()]
+    for index in range(hosts):
+        body = "\n".join(
+            f"{rng.getrandbits(64):016x} &amp; {index}" for _ in range(lines)
+        )
+        parts.append(
+            '<host starttime="1587479712" endtime="1587479772">'
+            '<status state="up" reason="syn-ack" reason_ttl="0" />'
+            f'<address addr="10.0.{index // 256 % 256}.{index % 256}" '
+            'addrtype="ipv4" /><ports><port protocol="tcp" portid="443">'
+            '<state state="open" reason="syn-ack" reason_ttl="0" />'
+            '<service name="https" method="table" conf="3" />'
+            '<script id="ssl-cert" output="">'
+            f'<elem key="pem">{body}</elem>'
+            "</script></port></ports></host>\n"
+        )
+    parts.append(nmap_footer())
+    return "".join(parts).encode("utf8")
+
+
+def measure(parser_class, engine: str, data: bytes, rounds: int) -> float:
+    """ Return the best time to parse ``data`` out of several rounds. """
+    best = float("inf")
+    for _ in range(rounds):
+        with timer() as elapsed:
+            parser = parser_class(engine)
+            for chunk in chunks(data):
+                parser.feed(chunk)
+                for _ in parser.events():
+                    pass
+        best = min(best, elapsed[0])
+    return best
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--hosts", type=int, default=2000)
+    arg_parser.add_argument("--ports", type=int, default=50)
+    arg_parser.add_argument("--text-hosts", type=int, default=20)
+    arg_parser.add_argument("--text-lines", type=int, default=20000)
+    arg_parser.add_argument("--rounds", type=int, default=3)
+    args = arg_parser.parse_args()
+
+    workloads = [
+        ("element-heavy", nmap_scan(args.hosts, args.ports, cpes=False, scripts=False)),
+        ("text-heavy", text_heavy_scan(args.text_hosts, args.text_lines)),
+    ]
+    for name, data in workloads:
+        print(f"{name} ({len(data) / 1e6:.1f} MB)")
+        for engine in NmapXmlParser.ENGINES:
+            legacy = measure(LegacyDispatchParser, engine, data, args.rounds)
+            current = measure(NmapXmlParser, engine, data, args.rounds)
+            print(
+                f"  {engine:>6}: legacy {len(data) / legacy / 1e6:7.1f} MB/sec  "
+                f"current {len(data) / current / 1e6:7.1f} MB/sec  "
+                f"speedup {legacy / current:5.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
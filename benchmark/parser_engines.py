@@ -0,0 +1,65 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Compare the throughput of the nmap parser's XML engines.
+
+    $ python -m benchmark.parser_engines --hosts 5000 --ports 20
+"""
+
+import argparse
+
+from darkwing.nmap.parser import Host, NmapXmlParser
+
+from .synthetic import chunks, nmap_scan, timer
+
+
+def parse(data: bytes, engine: str) -> int:
+    """ Parse a document and return the number of hosts. """
+    parser = NmapXmlParser(engine)
+    hosts = 0
+    for chunk in chunks(data):
+        parser.feed(chunk)
+        for event in parser.events():
+            if isinstance(event, Host):
+                hosts += 1
+    return hosts
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--hosts", type=int, default=5000)
+    arg_parser.add_argument("--ports", type=int, default=20)
+    arg_parser.add_argument("--rounds", type=int, default=3)
+    args = arg_parser.parse_args()
+
+    data = nmap_scan(args.hosts, args.ports)
+    print(f"Synthetic scan: {args.hosts} hosts, {len(data) / 1e6:.1f} MB")
+    for engine in NmapXmlParser.ENGINES:
+        best = float("inf")
+        for _ in range(args.rounds):
+            with timer() as elapsed:
+                hosts = parse(data, engine)
+            best = min(best, elapsed[0])
+        assert hosts == args.hosts
+        print(
+            f"{engine:>6}: {hosts / best:10,.0f} hosts/sec "
+            f"{len(data) / best / 1e6:8.1f} MB/sec"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Measure the memory retained by the nmap parser's event objects.
+
+Bytes per host are measured on hosts without ports, and bytes per port are derived
+from the difference between scans with and without ports.
+
+    $ python -m benchmark.parser_memory --hosts 5000 --ports 50
+"""
+
+import argparse
+import gc
+import tracemalloc
+import typing
+
+from darkwing.nmap.parser import Host, NmapXmlParser
+
+from .synthetic import chunks, nmap_scan
+
+
+def retained_bytes(data: bytes, **parser_options) -> typing.Tuple[int, int]:
+    """
+    Parse ``data``, keep every Host event, and return the number of hosts and the
+    number of bytes that they occupy.
+
+    :param parser_options: Keyword arguments for :class:`NmapXmlParser`.
+    """
+    gc.collect()
+    tracemalloc.start()
+    parser = NmapXmlParser(**parser_options)
+    hosts = list()
+    for chunk in chunks(data):
+        parser.feed(chunk)
+        hosts.extend(e for e in parser.events() if isinstance(e, Host))
+    del parser
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(hosts), current
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--hosts", type=int, default=5000)
+    arg_parser.add_argument("--ports", type=int, default=50)
+    arg_parser.add_argument("--engine", default="sax", choices=NmapXmlParser.ENGINES)
+    args = arg_parser.parse_args()
+
+    # Scripts and CPEs are excluded so that the port measurement reflects the
+    # per-port objects rather than the size of the synthetic text.
+    options = dict(cpes=False, scripts=False)
+    bare = nmap_scan(args.hosts, 0, **options)
+    full = nmap_scan(args.hosts, args.ports, **options)
+    hosts, bare_bytes = retained_bytes(bare, engine=args.engine)
+    _, full_bytes = retained_bytes(full, engine=args.engine)
+    ports = hosts * args.ports
+    print(f"{hosts} hosts, {ports} ports ({args.engine} engine)")
+    print(f"  bytes per host (no ports): {bare_bytes / hosts:8.0f}")
+    print(f"  bytes per port:            {(full_bytes - bare_bytes) / ports:8.0f}")
+    print(f"  total retained:            {full_bytes / 1e6:8.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
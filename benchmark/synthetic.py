@@ -0,0 +1,198 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+from contextlib import contextmanager
+from ipaddress import IPv4Address
+import random
+import time
+import typing
+
+SERVICES = [
+    ("ssh", "OpenSSH", "7.4"),
+    ("http", "nginx", "1.16.1"),
+    ("https", "Apache httpd", "2.4.41"),
+    ("domain", "dnsmasq", "2.75"),
+    ("msrpc", None, None),
+    ("microsoft-ds", None, None),
+    ("rdp", None, None),
+]
+
+PORT_STATES = [
+    ("open", "syn-ack"),
+    ("closed", "reset"),
+    ("filtered", "no-response"),
+]
+
+
+def nmap_header(started: int = 1587479712) -> str:
+    """ The XML that nmap writes before the first <host>. """
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        "<!DOCTYPE nmaprun>\n"
+        f'<nmaprun scanner="nmap" args="nmap -sV -oX bench.xml 10.0.0.0/8" '
+        f'start="{started}" version="7.80" xmloutputversion="1.04">\n'
+        '<scaninfo type="syn" protocol="tcp" numservices="1000" services="1-1000" />\n'
+        '<verbose level="0" />\n'
+        '<debugging level="0" />\n'
+    )
+
+
+def nmap_footer(finished: int = 1587481087) -> str:
+    """ The XML that nmap writes after the last </host>. """
+    return (
+        f'<runstats><finished time="{finished}" timestr="" elapsed="1375" '
+        f'summary="Nmap done" exit="success" />\n'
+        '<hosts up="1" down="0" total="1" /></runstats>\n'
+        "</nmaprun>\n"
+    )
+
+
+def nmap_host(
+    address: IPv4Address,
+    ports: int,
+    rng: random.Random,
+    state: str = "up",
+    cpes: bool = True,
+    scripts: bool = True,
+    started: int = 1587479712,
+) -> str:
+    """ Generate one synthetic <host> element. """
+    parts = [
+        f'<host starttime="{started}" endtime="{started + 60}">'
+        f'<status state="{state}" reason="syn-ack" reason_ttl="0" />'
+        f'<address addr="{address}" addrtype="ipv4" />'
+        f'<hostnames><hostname name="host-{int(address)}.example.com" type="PTR" />'
+        "</hostnames><ports>"
+    ]
+    if state == "up":
+        for portid in rng.sample(range(1, 65536), ports):
+            port_state, reason = rng.choice(PORT_STATES)
+            name, product, version = rng.choice(SERVICES)
+            parts.append(
+                f'<port protocol="tcp" portid="{portid}">'
+                f'<state state="{port_state}" reason="{reason}" reason_ttl="0" />'
+            )
+            if product:
+                parts.append(
+                    f'<service name="{name}" product="{product}" version="{version}" '
+                    'method="probed" conf="10">'
+                )
+                if cpes:
+                    parts.append(f"<cpe>cpe:/a:{product.lower()}:{version}</cpe>")
+                parts.append("</service>")
+            else:
+                parts.append(f'<service name="{name}" method="table" conf="3" />')
+            if scripts and port_state == "open" and product:
+                parts.append(
+                    f'<script id="banner" output="{product} {version}">'
+                    f'<elem key="product">{product}</elem>'
+                    f'<elem key="version">{version}</elem>'
+                    "</script>"
+                )
+            parts.append("</port>")
+    parts.append("</ports></host>\n")
+    return "".join(parts)
+
+
+def nmap_scan(
+    hosts: int, ports: int = 10, down_ratio: float = 0.0, seed: int = 0, **kwargs,
+) -> bytes:
+    """
+    Generate a complete synthetic nmap XML document.
+
+    :param hosts: The number of <host> elements to generate.
+    :param ports: The number of <port> elements in each host that is up.
+    :param down_ratio: The fraction of hosts that are down.
+    :param seed: Seed for the random number generator, so that output is repeatable.
+    :param kwargs: Passed through to :func:`nmap_host`.
+    """
+    rng = random.Random(seed)
+    base = int(IPv4Address("10.0.0.0"))
+    parts = [nmap_header()]
+    for index in range(hosts):
+        state = "down" if rng.random() < down_ratio else "up"
+        parts.append(nmap_host(IPv4Address(base + index), ports, rng, state, **kwargs))
+    parts.append(nmap_footer())
+    return "".join(parts).encode("utf8")
+
+
+def masscan_records(
+    records: int, hosts: int, seed: int = 0
+) -> typing.Iterator[typing.Tuple[str, int, int]]:
+    """
+    Generate (address, timestamp, port) tuples in masscan's randomized order.
+
+    :param records: The number of records to generate.
+    :param hosts: The number of distinct addresses that the records are spread over.
+    """
+    rng = random.Random(seed)
+    base = int(IPv4Address("10.0.0.0"))
+    timestamp = 1587479712
+    for index in range(records):
+        if index % 1000 == 0:
+            timestamp += 1
+        address = IPv4Address(base + rng.randrange(hosts))
+        yield str(address), timestamp, rng.randrange(1, 65536)
+
+
+def masscan_json(records: int, hosts: int, seed: int = 0) -> bytes:
+    """ Generate masscan ``-oJ`` output. """
+    lines = ["["]
+    for address, timestamp, port in masscan_records(records, hosts, seed):
+        lines.append(
+            f'{{   "ip": "{address}",   "timestamp": "{timestamp}", "ports": '
+            f'[ {{"port": {port}, "proto": "tcp", "status": "open", '
+            f'"reason": "syn-ack", "ttl": 64}} ] }},'
+        )
+    lines.append("]\n")
+    return "\n".join(lines).encode("utf8")
+
+
+def masscan_xml(records: int, hosts: int, seed: int = 0) -> bytes:
+    """ Generate masscan ``-oX`` output. """
+    parts = [
+        '<?xml version="1.0"?>\n'
+        '<nmaprun scanner="masscan" start="1587479712" version="1.0-BETA" '
+        'xmloutputversion="1.03">\n<scaninfo type="syn" protocol="tcp" />\n'
+    ]
+    for address, timestamp, port in masscan_records(records, hosts, seed):
+        parts.append(
+            f'<host endtime="{timestamp}"><address addr="{address}" addrtype="ipv4"/>'
+            f'<ports><port protocol="tcp" portid="{port}"><state state="open" '
+            'reason="syn-ack" reason_ttl="64"/></port></ports></host>\n'
+        )
+    parts.append('<runstats><finished time="1587489712" /></runstats></nmaprun>\n')
+    return "".join(parts).encode("utf8")
+
+
+def chunks(data: bytes, size: int = 65536) -> typing.Iterator[bytes]:
+    """ Split data into fixed-size chunks. """
+    for offset in range(0, len(data), size):
+        yield data[offset : offset + size]
+
+
+@contextmanager
+def timer() -> typing.Iterator[typing.List[float]]:
+    """
+    A context manager that measures elapsed time.
+
+    The yielded list contains the elapsed seconds after the block exits.
+    """
+    elapsed: typing.List[float] = list()
+    start = time.perf_counter()
+    yield elapsed
+    elapsed.append(time.perf_counter() - start)
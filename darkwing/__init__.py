@@ -15,6 +15,7 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from functools import wraps
+import os
 import pathlib
 import trio
 import typing
@@ -57,9 +58,24 @@ class AppConfig:
 
     def __init__(self):
         self.mongo_host = None
+        self.parse_workers = 0
+        self.spool_dir = None
+        self.spool_workers = 1
+        self.count_cache_ttl = 60.0
+        self.estimated_counts = False
 
     @classmethod
     def from_env(cls, env: typing.Mapping[str, str]):
         config = cls()
         config.mongo_host = env["DARKWING_MONGO_HOST"]
+        if "DARKWING_PARSE_WORKERS" in env:
+            config.parse_workers = int(env["DARKWING_PARSE_WORKERS"])
+        else:
+            config.parse_workers = os.cpu_count() or 1
+        config.spool_dir = env.get("DARKWING_SPOOL_DIR") or None
+        if "DARKWING_SPOOL_WORKERS" in env:
+            config.spool_workers = int(env["DARKWING_SPOOL_WORKERS"])
+        if "DARKWING_COUNT_CACHE_TTL" in env:
+            config.count_cache_ttl = float(env["DARKWING_COUNT_CACHE_TTL"])
+        config.estimated_counts = env.get("DARKWING_ESTIMATED_COUNTS") == "1"
         return config
@@ -194,6 +194,83 @@ def get_args():
         help="Write logs to the specified file (in addition to the console log).",
         default=str(default_log),
     )
+
+    # Without a command, Darkwing runs the server.
+    commands = arg_parser.add_subparsers(dest="command", metavar="COMMAND")
+    follow_parser = commands.add_parser(
+        "follow",
+        help="Ingest an nmap XML file while the scan is still running.",
+        description="Ingest an nmap XML file (-oX) while the scan is still running. "
+        "Hosts are added to the database as soon as nmap writes them.",
+    )
+    follow_parser.add_argument("path", help="The nmap XML file to follow.")
+    follow_parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=1.0,
+        metavar="SECONDS",
+        help="How often to check the file for new data (default: 1.0)",
+    )
+    follow_parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        metavar="SECONDS",
+        help="Stop following if the file does not grow for this long, and mark the "
+        "scan as incomplete (default: wait forever)",
+    )
+    import_parser = commands.add_parser(
+        "import",
+        help="Bulk import nmap XML files.",
+        description="Bulk import nmap XML files, e.g. to backfill archived scans. "
+        "Files may be compressed with gzip, bzip2, or xz.",
+    )
+    import_parser.add_argument(
+        "paths",
+        nargs="+",
+        metavar="PATH",
+        help="A scan file, a directory to search for scan files, a tar archive, or a "
+        "glob pattern.",
+    )
+    import_parser.add_argument(
+        "--workers",
+        type=int,
+        metavar="N",
+        help="The number of worker processes for parsing (default: "
+        "DARKWING_PARSE_WORKERS, or the number of CPUs)",
+    )
+    import_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1000,
+        metavar="HOSTS",
+        help="The number of hosts to insert at a time (default: 1000)",
+    )
+    backfill_parser = commands.add_parser(
+        "backfill",
+        help="Add address keys to hosts stored by older versions.",
+        description="Add the address keys that filtering hosts by network relies on "
+        "to hosts that were stored before they existed. Re-importing those scans does "
+        "not add them, because a scan that was already imported is skipped.",
+    )
+    backfill_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1000,
+        metavar="HOSTS",
+        help="The number of hosts to update at a time (default: 1000)",
+    )
+    indexes_parser = commands.add_parser(
+        "indexes",
+        help="Report index usage and unindexed queries.",
+        description="Create any missing indexes, then report how often each index "
+        "has been used and which recent queries scanned a whole collection.",
+    )
+    indexes_parser.add_argument(
+        "--profile",
+        choices=("on", "off"),
+        help="Turn on the database profiler to record queries that scan a whole "
+        "collection, or turn it off.",
+    )
     return arg_parser.parse_args()
 
 
@@ -202,7 +279,7 @@ def main():
     args = get_args()
     configure_logging(args.log_level, args.log_file)
 
-    if args.reload and os.getenv("WATCHDOG_RUNNING") is None:
+    if args.command is None and args.reload and os.getenv("WATCHDOG_RUNNING") is None:
         reloader = Reloader()
         reloader.run()
     else:
@@ -25,6 +25,18 @@ import trio_asyncio
 
 from . import AppConfig
 from .database import connect_db
+from .database.counts import count_cache
+from .database.host import HostDb
+from .database.indexes import (
+    collection_scans,
+    ensure_indexes,
+    index_usage,
+    set_profiling,
+)
+from .ingest.archive import import_scans
+from .ingest.follow import follow_scan
+from .ingest.spool import Spool
+from .ingest.workers import ParsePool
 
 from .server import DispatchContext, run_server
 
@@ -71,15 +83,80 @@ class Bootstrap:
         :returns: This function runs until cancelled.
         """
         config = AppConfig.from_env(os.environ)
+        workers = config.parse_workers
+        if self._args.command == "import" and self._args.workers is not None:
+            workers = self._args.workers
+        parse_pool = None
+        if workers > 0:
+            parse_pool = ParsePool(workers)
+        try:
+            await self._run(config, parse_pool)
+        finally:
+            if parse_pool:
+                parse_pool.shutdown()
+
+    async def _run(self, config, parse_pool: typing.Optional[ParsePool]):
+        """ Run the command selected on the command line. """
         async with trio_asyncio.open_loop() as loop:
             async with trio.open_nursery() as nursery:
                 nursery.start_soon(self._sigterm_receiver)
 
                 # Set up database.
                 db = connect_db(config.mongo_host)
+                await ensure_indexes(db)
+
+                if self._args.command == "follow":
+                    await follow_scan(
+                        db,
+                        trio.Path(self._args.path),
+                        self._args.poll_interval,
+                        idle_timeout=self._args.idle_timeout,
+                    )
+                    nursery.cancel_scope.cancel()
+                    return
+
+                if self._args.command == "indexes":
+                    await self._report_indexes(db)
+                    nursery.cancel_scope.cancel()
+                    return
+
+                if self._args.command == "backfill":
+                    updated = await HostDb.backfill_address_keys(
+                        db, self._args.batch_size
+                    )
+                    print(f"Added address keys to {updated} hosts")
+                    nursery.cancel_scope.cancel()
+                    return
+
+                if self._args.command == "import":
+                    stats = await import_scans(
+                        db, self._args.paths, parse_pool, self._args.batch_size
+                    )
+                    print(
+                        f"Imported {stats.files} files ({stats.failed} failed, "
+                        f"{stats.skipped} already imported) with "
+                        f"{stats.hosts} hosts in {stats.elapsed:.1f} sec: "
+                        f"{stats.files_per_sec:.1f} files/sec, "
+                        f"{stats.hosts_per_sec:.0f} hosts/sec"
+                    )
+                    nursery.cancel_scope.cancel()
+                    return
+
+                # Cache the totals shown in paginated listings.
+                count_cache.ttl = config.count_cache_ttl
+                count_cache.estimated = config.estimated_counts
+
+                # Set up the upload spool.
+                spool = None
+                if config.spool_dir:
+                    spool = Spool(config.spool_dir, config.spool_workers)
+                    await nursery.start(spool.run, db, parse_pool)
+                    logger.info("Spooling uploads to %s", config.spool_dir)
 
                 # Set up server.
-                context = DispatchContext(config=config, db=db)
+                context = DispatchContext(
+                    config=config, db=db, parse_pool=parse_pool, spool=spool
+                )
                 server = await nursery.start(
                     run_server, self._args.ip, self._args.port, context
                 )
@@ -89,6 +166,26 @@ class Bootstrap:
                     server.port,
                 )
 
+    async def _report_indexes(self, db):
+        """ Print index usage and the queries that are not supported by an index. """
+        if self._args.profile is not None:
+            await set_profiling(db, self._args.profile == "on")
+        print("Index usage since the database server started:")
+        for usage in await index_usage(db):
+            note = "" if usage.registered else " (not registered)"
+            print(f"  {usage.collection}.{usage.name}: {usage.ops} ops{note}")
+        scans = await collection_scans(db)
+        if scans is None:
+            print("The profiler is off: use --profile on to find unindexed queries.")
+        elif not scans:
+            print("No unindexed queries have been recorded.")
+        else:
+            print("Recent unindexed queries (collection scans):")
+            for entry in scans:
+                print(
+                    f"  {entry['ts']} {entry['ns']} {entry['op']}: {entry['command']}"
+                )
+
     async def _sigterm_receiver(self):
         """
         This task handles SIGTERM signals.
@@ -0,0 +1,68 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Helpers for storing IP addresses in a form that MongoDB can index and range scan.
+
+Each address is stored as a 16 byte, big endian binary key. IPv4 addresses are
+stored in their IPv4-mapped IPv6 form (``::ffff:a.b.c.d``), so both families share
+one key space and a CIDR network is always a single contiguous range of keys.
+"""
+
+from ipaddress import IPv4Address, IPv6Address, ip_address, ip_network
+import typing
+
+import bson
+
+
+IPAddress = typing.Union[IPv4Address, IPv6Address]
+
+
+def address_key(address: typing.Union[str, IPAddress]) -> bson.Binary:
+    """ Convert an IP address to its 16 byte database key. """
+    if isinstance(address, str):
+        address = ip_address(address)
+    if isinstance(address, IPv4Address):
+        address = IPv6Address(b"\x00" * 10 + b"\xff\xff" + address.packed)
+    return bson.Binary(address.packed)
+
+
+def key_address(key: bytes) -> IPAddress:
+    """ Convert a 16 byte database key back into an IP address. """
+    address = IPv6Address(bytes(key))
+    return address.ipv4_mapped or address
+
+
+def network_range(network: str) -> typing.Tuple[bson.Binary, bson.Binary]:
+    """
+    Return the lowest and highest database keys inside a CIDR network.
+
+    :raises ValueError: if ``network`` is not a valid CIDR network.
+    """
+    net = ip_network(network, strict=False)
+    return address_key(net.network_address), address_key(net.broadcast_address)
+
+
+def network_query(network: str) -> dict:
+    """
+    Build a host query that matches any host with an address inside ``network``.
+
+    ``$elemMatch`` keeps both bounds on the same array element, which lets MongoDB
+    turn the query into a single bounded scan of the multikey ``address_keys``
+    index.
+    """
+    low, high = network_range(network)
+    return {"address_keys": {"$elemMatch": {"$gte": low, "$lte": high}}}
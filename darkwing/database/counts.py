@@ -0,0 +1,125 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+from collections import OrderedDict
+import logging
+import time
+import typing
+
+import bson
+
+if typing.TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorCollection
+
+
+logger = logging.getLogger(__name__)
+
+
+class CountCache:
+    """
+    Caches the number of documents that match a query, so that paginated listings do
+    not count a whole collection on every page.
+
+    When this process inserts or deletes documents, it adjusts the unfiltered count for
+    that collection and drops the filtered counts. Other processes, such as a bulk
+    import, can also change the collections, so every cached count expires after
+    ``ttl`` seconds.
+
+    Each distinct filter, e.g. each network that a client filters hosts by, is a
+    separate entry. Expired entries are dropped when a count is fetched, and at most
+    ``max_size`` entries are kept, so the cache does not grow with the number of
+    filters that clients send.
+    """
+
+    def __init__(
+        self, ttl: float = 60.0, estimated: bool = False, max_size: int = 1000
+    ):
+        """
+        Constructor.
+
+        :param ttl: How many seconds a count is cached for. 0 disables the cache.
+        :param estimated: If True, unfiltered counts are read from the collection's
+            metadata with ``estimated_document_count()`` rather than counted. This is
+            fast even on a cold cache, but it can be off after an unclean shutdown.
+        :param max_size: The maximum number of cached counts. The oldest counts are
+            dropped first.
+        """
+        self.ttl = ttl
+        self.estimated = estimated
+        self.max_size = max_size
+        # Maps (collection name, BSON query) to (count, time fetched), in the order the
+        # counts were stored, so the oldest are at the front.
+        self._counts: typing.OrderedDict[
+            typing.Tuple[str, bytes], typing.Tuple[int, float]
+        ]
+        self._counts = OrderedDict()
+
+    async def count(
+        self, collection: AsyncIOMotorCollection, query: typing.Mapping[str, typing.Any]
+    ) -> int:
+        """ Return the number of documents in ``collection`` that match ``query``. """
+        key = (collection.name, bson.encode(query))
+        cached = self._counts.get(key)
+        now = time.monotonic()
+        if cached is not None and now - cached[1] < self.ttl:
+            return cached[0]
+        if not query and self.estimated:
+            count = await collection.estimated_document_count()
+        else:
+            count = await collection.count_documents(query)
+        self._store(key, count, now)
+        return count
+
+    def add(self, collection_name: str, delta: int):
+        """
+        Record that ``delta`` documents were inserted into a collection, or deleted if
+        ``delta`` is negative.
+        """
+        if not delta:
+            return
+        unfiltered = (collection_name, _EMPTY_QUERY)
+        for key in [key for key in self._counts if key[0] == collection_name]:
+            if key == unfiltered:
+                count, fetched = self._counts[key]
+                self._counts[key] = (max(0, count + delta), fetched)
+            else:
+                del self._counts[key]
+
+    def _store(self, key: typing.Tuple[str, bytes], count: int, fetched: float):
+        """ Cache a count, dropping expired counts and, if full, the oldest. """
+        self._counts.pop(key, None)
+        if self.ttl <= 0:
+            return
+        while self._counts:
+            oldest_key, (_, oldest_fetched) = next(iter(self._counts.items()))
+            expired = fetched - oldest_fetched >= self.ttl
+            if not expired and len(self._counts) < self.max_size:
+                break
+            del self._counts[oldest_key]
+        self._counts[key] = (count, fetched)
+
+    def invalidate(self, collection_name: typing.Optional[str] = None):
+        """ Drop the cached counts for one collection, or for all of them. """
+        for key in list(self._counts):
+            if collection_name is None or key[0] == collection_name:
+                del self._counts[key]
+
+
+_EMPTY_QUERY = bson.encode({})
+
+# The cache used by the database layer, which is configured by the bootstrap.
+count_cache = CountCache()
@@ -18,7 +18,7 @@ from __future__ import annotations
 from dataclasses import dataclass
 from datetime import datetime
 from enum import Enum
-from ipaddress import IPv4Address, IPv6Address
+from ipaddress import IPv4Address, IPv6Address, ip_address
 from trio_asyncio import aio_as_trio
 import typing
 
@@ -27,6 +27,48 @@ from motor.motor_asyncio import AsyncIOMotorClient
 import pymongo
 
 from ..model.page import PageRequest, PageResult
+from .address import address_key, network_query
+from .counts import count_cache
+from .pagination import encode_token, keyset_query, sort_spec
+
+
+# The number of service names kept in a host's summary.
+SUMMARY_SERVICES = 5
+
+# The columns that hosts can be sorted by, and the fields that they sort on. Each
+# field has an index in darkwing.database.indexes, with _id as a tiebreaker.
+HOST_SORT_FIELDS = {
+    "started": "started",
+    "completed": "completed",
+    "open_ports": "summary.open_ports",
+    "filtered_ports": "summary.filtered_ports",
+}
+
+# The most hosts that HostDb.get_hosts() reads at once, which bounds the size of the
+# query and of the response.
+MAX_GET_HOSTS = 1000
+
+# The fields that HostDb.get_hosts() can select. The host ID is always included.
+HOST_FIELDS = (
+    "started",
+    "completed",
+    "state",
+    "state_reason",
+    "addresses",
+    "hostnames",
+    "ports",
+)
+
+# The fields that are needed to build a HostListItem.
+_LIST_PROJECTION = {
+    "started": True,
+    "completed": True,
+    "state": True,
+    "state_reason": True,
+    "addresses": True,
+    "hostnames": True,
+    "summary": True,
+}
 
 
 class HostPortTransport(Enum):
@@ -93,16 +135,33 @@ class Host:
 
     @staticmethod
     def from_db(doc):
+        # Fields that were not selected by HostDb.get_hosts() are left empty.
         return Host(
             str(doc["_id"]),
-            doc["started"],
-            doc["completed"],
-            doc["state"],
-            doc["state_reason"],
-            # TODO IPV6 support
-            [IPv4Address(addr) for addr in doc["addresses"]],
-            doc["hostnames"],
-            [HostPort.from_db(p) for p in doc["ports"]],
+            doc.get("started"),
+            doc.get("completed"),
+            doc.get("state"),
+            doc.get("state_reason"),
+            [ip_address(addr) for addr in doc.get("addresses", [])],
+            doc.get("hostnames", []),
+            [HostPort.from_db(p) for p in doc.get("ports", [])],
+        )
+
+
+@dataclass
+class HostSummary:
+    open_ports: int
+    closed_ports: int
+    filtered_ports: int
+    services: typing.List[str]
+
+    @staticmethod
+    def from_db(doc):
+        return HostSummary(
+            doc["open_ports"],
+            doc["closed_ports"],
+            doc["filtered_ports"],
+            doc["services"],
         )
 
 
@@ -115,6 +174,8 @@ class HostListItem:
     state_reason: str
     addresses: typing.List[typing.Union[IPv4Address, IPv6Address]]
     hostnames: typing.List[str]
+    # Hosts that were ingested before summaries were added do not have one.
+    summary: typing.Optional[HostSummary]
 
     @staticmethod
     def from_db(doc):
@@ -124,26 +185,120 @@ class HostListItem:
             doc["completed"],
             doc["state"],
             doc["state_reason"],
-            # TODO IPV6 support
-            [IPv4Address(addr) for addr in doc["addresses"]],
+            [ip_address(addr) for addr in doc["addresses"]],
             doc["hostnames"],
+            HostSummary.from_db(doc["summary"]) if "summary" in doc else None,
         )
 
 
+def host_summary(port_docs: typing.List[dict]) -> dict:
+    """
+    Summarize a host's port documents, so that host listings can show port counts
+    and services without reading every port.
+
+    :returns: A document with the number of ports in each state and the most common
+        services on open ports.
+    """
+    # This runs for every host that is ingested, so it avoids Counter and enum lookups.
+    open_ports = closed_ports = filtered_ports = 0
+    services: typing.Dict[str, int] = dict()
+    for port in port_docs:
+        state = port["state"]
+        if state == "OPEN":
+            open_ports += 1
+            name = port["service"]["name"]
+            if name:
+                services[name] = services.get(name, 0) + 1
+        elif state == "FILTERED":
+            filtered_ports += 1
+        elif state == "CLOSED":
+            closed_ports += 1
+    top_services = sorted(services, key=services.__getitem__, reverse=True)
+    return {
+        "open_ports": open_ports,
+        "closed_ports": closed_ports,
+        "filtered_ports": filtered_ports,
+        "services": top_services[:SUMMARY_SERVICES],
+    }
+
+
+def hosts_summary(host_docs: typing.Iterable[typing.Mapping[str, typing.Any]]) -> dict:
+    """
+    Summarize a batch of host documents, so that their counts can be added to the
+    summary of the scan that they belong to.
+
+    Unlike :func:`host_summary`, the services are all of the distinct services on open
+    ports. This reads every port, so it should run where the documents are still dicts,
+    e.g. in a conversion worker: reading a field of a raw BSON document decodes it.
+
+    :returns: A document with the number of hosts up and down, the number of open
+        ports, and the sorted service names.
+    """
+    hosts_up = hosts_down = open_ports = 0
+    services: typing.Set[str] = set()
+    for doc in host_docs:
+        state = doc["state"]
+        if state == "UP":
+            hosts_up += 1
+        elif state == "DOWN":
+            hosts_down += 1
+        for port in doc["ports"]:
+            if port["state"] == "OPEN":
+                open_ports += 1
+                name = port["service"]["name"]
+                if name:
+                    services.add(name)
+    return {
+        "hosts_up": hosts_up,
+        "hosts_down": hosts_down,
+        "open_ports": open_ports,
+        "services": sorted(services),
+    }
+
+
 class HostDb:
     @staticmethod
     @aio_as_trio
-    async def list_hosts(db: AsyncIOMotorClient, page: PageRequest) -> PageResult:
-        """ List hosts. """
-        skip = page.page_number * page.items_per_page
-        sort_dir = pymongo.ASCENDING if page.sort_ascending else pymongo.DESCENDING
-        total = await db.darkwing.host.count_documents({})
-        # TODO project the fields we actually use, e.g. no ports
-        cursor = db.darkwing.host.find(skip=skip, limit=page.items_per_page)
+    async def list_hosts(
+        db: AsyncIOMotorClient, page: PageRequest, network: typing.Optional[str] = None,
+    ) -> PageResult:
+        """
+        List hosts.
+
+        Only the fields in a :class:`HostListItem` are read, not the ports. Hosts are
+        sorted by one of the :data:`HOST_SORT_FIELDS`, or in insertion order if the
+        page's sort column is not one of them. If the page has an ``after`` token, the
+        hosts are read with a range query on the sort index instead of skipping.
+
+        :param network: If set, only list hosts that have an address inside this
+            CIDR network, e.g. ``10.20.0.0/16`` or ``2001:db8::/32``.
+        :raises ValueError: If the page's token is not valid for this sort order.
+        """
+        sort = sort_spec(HOST_SORT_FIELDS, page.sort_column, page.sort_ascending)
+        query = network_query(network) if network else {}
+        total = await count_cache.count(db.darkwing.host, query)
+        if page.after:
+            skip = 0
+            after = keyset_query(sort, page.after)
+            page_query = {"$and": [query, after]} if query else after
+        else:
+            skip = page.page_number * page.items_per_page
+            page_query = query
+        cursor = db.darkwing.host.find(
+            page_query,
+            projection=_LIST_PROJECTION,
+            sort=sort,
+            skip=skip,
+            limit=page.items_per_page,
+        )
         hosts: typing.List[HostListItem] = list()
+        doc = None
         async for doc in cursor:
             hosts.append(HostListItem.from_db(doc))
-        return PageResult(total, hosts)
+        next_token = None
+        if doc is not None and len(hosts) == page.items_per_page:
+            next_token = encode_token(sort, doc)
+        return PageResult(total, hosts, next_token)
 
     @staticmethod
     @aio_as_trio
@@ -151,3 +306,62 @@ class HostDb:
         """ Get a scan document. """
         doc = await db.darkwing.host.find_one({"_id": bson.ObjectId(id_)})
         return Host.from_db(doc)
+
+    @staticmethod
+    @aio_as_trio
+    async def get_hosts(
+        db: AsyncIOMotorClient,
+        ids: typing.Sequence[str],
+        fields: typing.Optional[typing.Sequence[str]] = None,
+    ) -> typing.List[typing.Optional[Host]]:
+        """
+        Get multiple hosts with a single query.
+
+        :param fields: If set, only read these of the :data:`HOST_FIELDS`, e.g. leave
+            out ``ports`` to skip the largest part of each document.
+        :returns: The hosts in the same order as ``ids``, with None for each ID that
+            does not exist.
+        :raises ValueError: If there are more than :data:`MAX_GET_HOSTS` IDs.
+        """
+        if len(ids) > MAX_GET_HOSTS:
+            raise ValueError(f"Cannot get more than {MAX_GET_HOSTS} hosts at once")
+        object_ids = [bson.ObjectId(id_) for id_ in ids]
+        projection = {field: True for field in fields} if fields is not None else None
+        cursor = db.darkwing.host.find(
+            {"_id": {"$in": list(set(object_ids))}}, projection=projection
+        )
+        hosts = dict()
+        async for doc in cursor:
+            hosts[doc["_id"]] = Host.from_db(doc)
+        return [hosts.get(object_id) for object_id in object_ids]
+
+    @staticmethod
+    @aio_as_trio
+    async def backfill_address_keys(
+        db: AsyncIOMotorClient, batch_size: int = 1000
+    ) -> int:
+        """
+        Add ``address_keys`` to hosts that were stored before the field existed, so
+        that filtering by network finds them. Hosts that already have keys are
+        skipped, so this is safe to run more than once.
+
+        :returns: The number of hosts that were updated.
+        """
+        cursor = db.darkwing.host.find(
+            {"address_keys": {"$exists": False}}, projection={"addresses": True}
+        )
+        updated = 0
+        updates = list()
+        async for doc in cursor:
+            keys = [address_key(address) for address in doc.get("addresses", [])]
+            updates.append(
+                pymongo.UpdateOne({"_id": doc["_id"]}, {"$set": {"address_keys": keys}})
+            )
+            if len(updates) >= batch_size:
+                await db.darkwing.host.bulk_write(updates, ordered=False)
+                updated += len(updates)
+                updates = list()
+        if updates:
+            await db.darkwing.host.bulk_write(updates, ordered=False)
+            updated += len(updates)
+        return updated
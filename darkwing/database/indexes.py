@@ -0,0 +1,200 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+The indexes on Darkwing's collections.
+
+Every index that a query relies on is declared in :data:`INDEXES`, and
+:func:`ensure_indexes` creates any that are missing when Darkwing starts. When you add
+a query that filters or sorts on a new field, add an index for it here.
+"""
+
+from __future__ import annotations
+from dataclasses import dataclass
+from datetime import datetime
+import itertools
+import logging
+from operator import attrgetter
+from trio_asyncio import aio_as_trio
+import typing
+
+from motor.motor_asyncio import AsyncIOMotorClient
+import pymongo
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    """ An index that should exist on one of Darkwing's collections. """
+
+    collection: str
+    keys: typing.Tuple[typing.Tuple[str, int], ...]
+    unique: bool = False
+    sparse: bool = False
+
+    @property
+    def name(self) -> str:
+        """ The index's name, which follows MongoDB's default naming scheme. """
+        return "_".join(f"{field}_{direction}" for field, direction in self.keys)
+
+    def to_model(self) -> pymongo.IndexModel:
+        return pymongo.IndexModel(
+            list(self.keys), name=self.name, unique=self.unique, sparse=self.sparse
+        )
+
+
+INDEXES = (
+    # Sorting scan listings, see SCAN_SORT_FIELDS in darkwing.database.scan.
+    IndexSpec("scan", (("started", pymongo.ASCENDING), ("_id", pymongo.ASCENDING))),
+    IndexSpec("scan", (("completed", pymongo.ASCENDING), ("_id", pymongo.ASCENDING))),
+    # Only scans that were ingested with a content hash are deduplicated.
+    IndexSpec("scan", (("content_hash", pymongo.ASCENDING),), unique=True, sparse=True),
+    # Checkpointed scans are identified by their source.
+    IndexSpec("scan", (("source", pymongo.ASCENDING),), unique=True, sparse=True),
+    # Find the scans that a host belongs to.
+    IndexSpec("scan", (("hosts", pymongo.ASCENDING),)),
+    # Network filters, see darkwing.database.address.network_query().
+    IndexSpec("host", (("address_keys", pymongo.ASCENDING),)),
+    # Exact lookups by address or hostname.
+    IndexSpec("host", (("addresses", pymongo.ASCENDING),)),
+    IndexSpec("host", (("hostnames", pymongo.ASCENDING),)),
+    # Sorting host listings, see HOST_SORT_FIELDS in darkwing.database.host.
+    IndexSpec("host", (("started", pymongo.ASCENDING), ("_id", pymongo.ASCENDING))),
+    IndexSpec("host", (("completed", pymongo.ASCENDING), ("_id", pymongo.ASCENDING))),
+    IndexSpec(
+        "host", (("summary.open_ports", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)),
+    ),
+    IndexSpec(
+        "host",
+        (("summary.filtered_ports", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)),
+    ),
+    # Find hosts with a given port open (or closed, filtered, etc.)
+    IndexSpec(
+        "host",
+        (("ports.number", pymongo.ASCENDING), ("ports.state", pymongo.ASCENDING)),
+    ),
+)
+
+
+@dataclass
+class IndexUsage:
+    """ How often an index has been used, according to the server. """
+
+    collection: str
+    name: str
+    ops: int
+    since: typing.Optional[datetime]
+    registered: bool
+
+
+@aio_as_trio
+async def ensure_indexes(
+    db: AsyncIOMotorClient, specs: typing.Iterable[IndexSpec] = INDEXES
+) -> typing.List[str]:
+    """
+    Create any of the registered indexes that do not exist yet.
+
+    Indexes that exist but are not registered are left alone, but a warning is logged
+    for each one, since an index that no query uses only slows down writes.
+
+    :returns: The names of the indexes that were created, as ``collection.name``.
+    """
+    created: typing.List[str] = list()
+    by_collection = attrgetter("collection")
+    for collection, group in itertools.groupby(
+        sorted(specs, key=by_collection), key=by_collection
+    ):
+        group_specs = list(group)
+        existing = await db.darkwing[collection].index_information()
+        missing = [spec for spec in group_specs if spec.name not in existing]
+        if missing:
+            await db.darkwing[collection].create_indexes(
+                [spec.to_model() for spec in missing]
+            )
+            created.extend(f"{collection}.{spec.name}" for spec in missing)
+        registered = {spec.name for spec in group_specs}
+        for name in existing:
+            if name != "_id_" and name not in registered:
+                logger.warning("Index %s.%s is not registered", collection, name)
+    for name in created:
+        logger.info("Created index %s", name)
+    return created
+
+
+@aio_as_trio
+async def index_usage(
+    db: AsyncIOMotorClient, specs: typing.Iterable[IndexSpec] = INDEXES
+) -> typing.List[IndexUsage]:
+    """
+    Report how often each index on Darkwing's collections has been used since the
+    server started. An index with no operations is a candidate for removal.
+    """
+    registered = {(spec.collection, spec.name) for spec in specs}
+    collections = sorted({collection for collection, _ in registered})
+    usage = list()
+    for collection in collections:
+        cursor = db.darkwing[collection].aggregate([{"$indexStats": {}}])
+        async for doc in cursor:
+            usage.append(
+                IndexUsage(
+                    collection,
+                    doc["name"],
+                    doc["accesses"]["ops"],
+                    doc["accesses"].get("since"),
+                    doc["name"] == "_id_" or (collection, doc["name"]) in registered,
+                )
+            )
+    usage.sort(key=lambda u: (u.collection, u.name))
+    return usage
+
+
+@aio_as_trio
+async def set_profiling(db: AsyncIOMotorClient, enabled: bool) -> None:
+    """
+    Turn the database profiler on or off. When it is on, the server records every query
+    on the ``darkwing`` database that scans a whole collection, so that
+    :func:`collection_scans` can report it.
+    """
+    if enabled:
+        await db.darkwing.command({"profile": 1, "filter": {"planSummary": "COLLSCAN"}})
+    else:
+        await db.darkwing.command({"profile": 0})
+
+
+@aio_as_trio
+async def collection_scans(
+    db: AsyncIOMotorClient, limit: int = 20
+) -> typing.Optional[typing.List[dict]]:
+    """
+    Return the most recent queries that scanned a whole collection, i.e. that no index
+    supports, as recorded by the profiler.
+
+    :returns: A list of profiler entries, newest first, or None if the profiler is off.
+    """
+    status = await db.darkwing.command({"profile": -1})
+    if status["was"] == 0:
+        return None
+    cursor = (
+        db.darkwing.system.profile.find(
+            {"planSummary": "COLLSCAN"},
+            projection={"ts": True, "ns": True, "op": True, "command": True},
+        )
+        .sort("ts", pymongo.DESCENDING)
+        .limit(limit)
+    )
+    return [doc async for doc in cursor]
@@ -0,0 +1,106 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Keyset pagination.
+
+Skipping to page N makes the server walk past every document on the pages before it,
+so deep pages get slower as a collection grows. Instead, a page can carry a token that
+holds the sort key of the last document on it, and the next page is read with a range
+query that starts after that key. With an index on the sort key (plus ``_id`` as a
+tiebreaker, so that keys are unique) every page costs the same.
+"""
+
+import base64
+import binascii
+import typing
+
+import bson
+import bson.errors
+import pymongo
+
+
+Sort = typing.List[typing.Tuple[str, int]]
+
+
+def sort_spec(fields: typing.Mapping[str, str], column: str, ascending: bool) -> Sort:
+    """
+    Return the sort for a listing.
+
+    :param fields: Maps the columns that can be sorted on to document fields.
+    :param column: The requested column. If it is not in ``fields``, documents are
+        sorted by ``_id``, i.e. in insertion order.
+    """
+    direction = pymongo.ASCENDING if ascending else pymongo.DESCENDING
+    sort = [("_id", direction)]
+    if column in fields:
+        sort.insert(0, (fields[column], direction))
+    return sort
+
+
+def encode_token(sort: Sort, doc: typing.Mapping[str, typing.Any]) -> str:
+    """ Return a token for the page that follows ``doc``. """
+    values = [_get_field(doc, field) for field, _ in sort]
+    data = bson.encode({"sort": [list(key) for key in sort], "values": values})
+    return base64.urlsafe_b64encode(data).decode("ascii")
+
+
+def keyset_query(sort: Sort, token: str) -> dict:
+    """
+    Return a query that matches the documents after a token, in ``sort`` order.
+
+    The query handles null and missing sort fields, which MongoDB sorts before every
+    other value.
+
+    :raises ValueError: If the token is malformed or was made for a different sort.
+    """
+    try:
+        doc = bson.decode(base64.urlsafe_b64decode(token.encode("ascii")))
+    except (binascii.Error, bson.errors.BSONError, UnicodeEncodeError):
+        raise ValueError("Invalid page token")
+    if doc.get("sort") != [list(key) for key in sort]:
+        raise ValueError("Page token does not match the sort order")
+    values = doc.get("values")
+    if not isinstance(values, list) or len(values) != len(sort):
+        raise ValueError("Invalid page token")
+    if len(sort) == 1:
+        return {"_id": {_after_op(sort[0][1]): values[0]}}
+    (field, direction), (_, id_direction) = sort
+    value, id_ = values
+    op = _after_op(direction)
+    tied = {field: value, "_id": {_after_op(id_direction): id_}}
+    if value is None:
+        if direction == pymongo.ASCENDING:
+            return {"$or": [tied, {field: {"$ne": None}}]}
+        return tied
+    after = [tied, {field: {op: value}}]
+    if direction == pymongo.DESCENDING:
+        after.append({field: None})
+    return {"$or": after}
+
+
+def _after_op(direction: int) -> str:
+    return "$gt" if direction == pymongo.ASCENDING else "$lt"
+
+
+def _get_field(doc: typing.Mapping[str, typing.Any], field: str) -> typing.Any:
+    """ Get a field by its dotted path, or None if it is missing. """
+    value: typing.Any = doc
+    for name in field.split("."):
+        if not isinstance(value, typing.Mapping):
+            return None
+        value = value.get(name)
+    return value
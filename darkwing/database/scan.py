@@ -23,11 +23,23 @@ import typing
 import bson
 from motor.motor_asyncio import AsyncIOMotorClient
 from pymaybe import maybe
-import pymongo
+import pymongo.errors
 
-from ..model.host import Port
-from ..model.scan import HostScan
+from ..model.host import Host, Port
+from ..model.scan import HostScan, ScanProgress
 from ..model.page import PageRequest, PageResult
+from .address import address_key
+from .counts import count_cache
+from .host import host_summary, hosts_summary
+from .pagination import encode_token, keyset_query, sort_spec
+
+
+# The columns that scans can be sorted by, and the fields that they sort on. Each
+# field has an index in darkwing.database.indexes, with _id as a tiebreaker.
+SCAN_SORT_FIELDS = {
+    "started": "started",
+    "completed": "completed",
+}
 
 
 @dataclass
@@ -39,9 +51,15 @@ class ScanListItem:
     started: typing.Optional[datetime]
     completed: typing.Optional[datetime]
     host_count: int
+    # Scans that were stored before summaries were added only have a host count.
+    hosts_up: typing.Optional[int]
+    hosts_down: typing.Optional[int]
+    open_ports: typing.Optional[int]
+    services: typing.Optional[typing.List[str]]
 
     @staticmethod
     def from_db(doc):
+        summary = doc.get("summary", {})
         return ScanListItem(
             str(doc["_id"]),
             doc["scanner"],
@@ -49,69 +67,382 @@ class ScanListItem:
             doc["command_line"],
             doc["started"],
             doc["completed"],
-            # TODO project host_count
-            len(doc["hosts"]),
+            doc["host_count"],
+            summary.get("hosts_up"),
+            summary.get("hosts_down"),
+            summary.get("open_ports"),
+            summary.get("services"),
         )
 
 
+# The fields that are needed to build a ScanListItem, as an aggregation stage. The host
+# IDs are left out, because a large scan has hundreds of thousands of them.
+_LIST_PROJECTION = {
+    "scanner": True,
+    "scanner_version": True,
+    "command_line": True,
+    "started": True,
+    "completed": True,
+    "summary": True,
+    # Older scans do not have a summary, so count their hosts on the server.
+    "host_count": {"$ifNull": ["$summary.host_count", {"$size": "$hosts"}]},
+}
+
+
+@dataclass
+class Checkpoint:
+    """
+    The progress of a checkpointed ingest, see :meth:`ScanDb.start_scan`.
+
+    ``offset`` is the position in the source up to which every host has been committed
+    to the scan, and ``hosts`` is the number of hosts committed.
+    """
+
+    scan_id: str
+    offset: int
+    hosts: int
+
+
+class DuplicateScanError(Exception):
+    """ Raised when a scan with the same content hash has already been stored. """
+
+    def __init__(self, scan_id: str):
+        super().__init__(f"This scan has already been stored: {scan_id}")
+        self.scan_id = scan_id
+
+
 class ScanDb:
     @staticmethod
     @aio_as_trio
-    async def insert_scan(db: AsyncIOMotorClient, scan: HostScan) -> bson.ObjectId:
+    async def insert_scan(
+        db: AsyncIOMotorClient, scan: HostScan, batch_size: int = 1000
+    ) -> str:
         """
         Insert a new scan document and new host documents.
+
+        The scan document is inserted first and hosts are added to it in batches, so
+        an interrupted insert leaves a partial scan rather than orphaned hosts.
+        """
+        scan_doc = _scan_to_dict(scan)
+        result = await db.darkwing.scan.insert_one(scan_doc)
+        count_cache.add("scan", 1)
+        scan_id = str(result.inserted_id)
+        for offset in range(0, len(scan.hosts), batch_size):
+            batch = scan.hosts[offset : offset + batch_size]
+            await _insert_host_docs(db, scan_id, [_host_to_dict(h) for h in batch])
+        return scan_id
+
+    @staticmethod
+    @aio_as_trio
+    async def start_scan(
+        db: AsyncIOMotorClient, scan: HostScan, source: typing.Optional[str] = None,
+    ) -> str:
+        """
+        Insert a scan document without any hosts, so that hosts can be added
+        incrementally with :meth:`insert_hosts`.
+
+        If ``source`` is given, the scan is checkpointed: hosts are added with
+        :meth:`stage_host_documents` and :meth:`commit_checkpoint`, and if the ingest is
+        interrupted it can pick up where it left off, see :meth:`resume_checkpoint`.
+
+        :param source: A string that identifies where the scan came from, such as a
+            file's path, size, and modification time.
+        :raises DuplicateScanError: If a scan from the same source already exists.
+        """
+        scan_doc = _scan_to_dict(scan)
+        if source is not None:
+            scan_doc["source"] = source
+            scan_doc["checkpoint"] = {"offset": 0, "hosts": 0, "staged": []}
+        try:
+            result = await db.darkwing.scan.insert_one(scan_doc)
+        except pymongo.errors.DuplicateKeyError:
+            existing = await db.darkwing.scan.find_one(
+                {"source": source}, projection={"_id": True}
+            )
+            if existing is None:
+                raise
+            raise DuplicateScanError(str(existing["_id"]))
+        count_cache.add("scan", 1)
+        return str(result.inserted_id)
+
+    @staticmethod
+    @aio_as_trio
+    async def find_scan_by_source(
+        db: AsyncIOMotorClient, source: str
+    ) -> typing.Optional[str]:
+        """ Return the ID of the finished scan from this source, if there is one. """
+        doc = await db.darkwing.scan.find_one(
+            {"source": source, "checkpoint": {"$exists": False}},
+            projection={"_id": True},
+        )
+        return str(doc["_id"]) if doc else None
+
+    @staticmethod
+    @aio_as_trio
+    async def find_scan_by_hash(
+        db: AsyncIOMotorClient, content_hash: str
+    ) -> typing.Optional[str]:
+        """
+        Return the ID of the finished scan with this content hash, if there is one,
+        see :meth:`finish_scan`.
+        """
+        doc = await db.darkwing.scan.find_one(
+            {"content_hash": content_hash}, projection={"_id": True}
+        )
+        return str(doc["_id"]) if doc else None
+
+    @staticmethod
+    @aio_as_trio
+    async def resume_checkpoint(
+        db: AsyncIOMotorClient, source: str
+    ) -> typing.Optional[Checkpoint]:
         """
-        host_docs: typing.List[dict] = list()
-        if scan.hosts:
-            # TODO batch inserts
-            for host in scan.hosts:
-                host_docs.append(
-                    {
-                        "started": host.started,
-                        "completed": host.completed,
-                        "state": maybe(host.state).name.or_else(None),
-                        "state_reason": host.state_reason,
-                        "addresses": [str(a) for a in host.addresses],
-                        "hostnames": list(host.hostnames),
-                        "ports": [_port_to_dict(p) for p in host.ports],
+        Find an unfinished checkpointed scan from this source, e.g. after the process
+        was killed while ingesting it.
+
+        Hosts that were staged but not committed are deleted, so the scan contains
+        exactly the hosts up to the checkpoint's offset.
+        """
+        doc = await db.darkwing.scan.find_one(
+            {"source": source, "checkpoint": {"$exists": True}},
+            projection={"checkpoint": True},
+        )
+        if doc is None:
+            return None
+        checkpoint = doc["checkpoint"]
+        if checkpoint["staged"]:
+            result = await db.darkwing.host.delete_many(
+                {"_id": {"$in": checkpoint["staged"]}}
+            )
+            count_cache.add("host", -result.deleted_count)
+            await db.darkwing.scan.update_one(
+                {"_id": doc["_id"]}, {"$set": {"checkpoint.staged": []}}
+            )
+        return Checkpoint(str(doc["_id"]), checkpoint["offset"], checkpoint["hosts"])
+
+    @staticmethod
+    @aio_as_trio
+    async def insert_hosts(
+        db: AsyncIOMotorClient, scan_id: str, hosts: typing.List[Host]
+    ) -> typing.List[bson.ObjectId]:
+        """ Insert hosts and add them to an existing scan. """
+        return await _insert_host_docs(db, scan_id, [_host_to_dict(h) for h in hosts])
+
+    @staticmethod
+    @aio_as_trio
+    async def insert_host_documents(
+        db: AsyncIOMotorClient,
+        scan_id: str,
+        host_docs: typing.List[typing.Mapping[str, typing.Any]],
+        host_ids: typing.Optional[typing.List[bson.ObjectId]] = None,
+        summary: typing.Optional[dict] = None,
+    ) -> typing.List[bson.ObjectId]:
+        """
+        Insert prebuilt host documents, e.g. from :mod:`darkwing.nmap.documents`, and
+        add them to an existing scan.
+
+        The IDs and summary are read from the documents if they are not given. They
+        should be given for raw documents, because reading a raw document decodes it.
+
+        :param host_ids: The documents' IDs, see
+            :func:`darkwing.nmap.documents.encode_hosts`.
+        :param summary: The documents' summary, see
+            :func:`darkwing.database.host.hosts_summary`.
+        """
+        return await _insert_host_docs(db, scan_id, host_docs, host_ids, summary)
+
+    @staticmethod
+    @aio_as_trio
+    async def stage_host_documents(
+        db: AsyncIOMotorClient,
+        scan_id: str,
+        host_docs: typing.List[typing.Mapping[str, typing.Any]],
+        host_ids: typing.List[bson.ObjectId],
+    ):
+        """
+        Insert host documents for a checkpointed scan. They are not part of the scan
+        until :meth:`commit_checkpoint` is called.
+
+        The documents must already have IDs, which are passed in ``host_ids``, see
+        :func:`darkwing.nmap.documents.encode_hosts`. The IDs are recorded before the
+        hosts are inserted, so that an interrupted insert can be undone.
+        """
+        if host_ids:
+            await db.darkwing.scan.update_one(
+                {"_id": bson.ObjectId(scan_id)},
+                {"$push": {"checkpoint.staged": {"$each": host_ids}}},
+            )
+            await db.darkwing.host.insert_many(host_docs)
+            count_cache.add("host", len(host_docs))
+
+    @staticmethod
+    @aio_as_trio
+    async def commit_checkpoint(
+        db: AsyncIOMotorClient,
+        scan_id: str,
+        host_ids: typing.List[bson.ObjectId],
+        summary: dict,
+        offset: int,
+    ):
+        """
+        Add staged hosts to a checkpointed scan and record how far into the source the
+        ingest has got. This is a single atomic update.
+
+        :param summary: The staged hosts' summary, see
+            :func:`darkwing.database.host.hosts_summary`.
+        """
+        update = _add_hosts_update(host_ids, summary)
+        update["$set"] = {"checkpoint.offset": offset, "checkpoint.staged": []}
+        update["$inc"]["checkpoint.hosts"] = len(host_ids)
+        await db.darkwing.scan.update_one({"_id": bson.ObjectId(scan_id)}, update)
+
+    @staticmethod
+    @aio_as_trio
+    async def update_progress(
+        db: AsyncIOMotorClient, scan_id: str, progress: ScanProgress
+    ):
+        """ Record the progress of a scan that is still running. """
+        await db.darkwing.scan.update_one(
+            {"_id": bson.ObjectId(scan_id)},
+            {
+                "$set": {
+                    "progress": {
+                        "task": progress.task,
+                        "time": progress.time,
+                        "percent": progress.percent,
+                        "remaining": progress.remaining,
+                        "est_completion": progress.est_completion,
                     }
-                )
+                }
+            },
+        )
 
-            result = await db.darkwing.host.insert_many(host_docs)
-            host_ids = result.inserted_ids
-        else:
-            host_ids = list()
-
-        scan_doc = {
-            "scanner": scan.scanner,
-            "scanner_version": scan.scanner_version,
-            "command_line": scan.command_line,
-            "started": scan.started,
-            "completed": scan.completed,
-            "hosts": host_ids,
-        }
-        result = await db.darkwing.scan.insert_one(scan_doc)
-        scan_id = result.inserted_id
-        return str(scan_id)
+    @staticmethod
+    @aio_as_trio
+    async def finish_scan(
+        db: AsyncIOMotorClient,
+        scan_id: str,
+        completed: typing.Optional[datetime],
+        content_hash: typing.Optional[str] = None,
+    ):
+        """
+        Mark a scan that was started with :meth:`start_scan` as completed.
+
+        :param content_hash: The SHA-256 hex digest of the scan file, if known. Only
+            finished scans have a hash, so a scan that failed part way through does
+            not stop the same file from being ingested again.
+        :raises DuplicateScanError: If another scan with the same hash has already
+            been finished. This scan is left unfinished, see :meth:`delete_scan`.
+        """
+        update: typing.Dict[str, typing.Any] = {"completed": completed}
+        if content_hash is not None:
+            update["content_hash"] = content_hash
+        try:
+            await db.darkwing.scan.update_one(
+                {"_id": bson.ObjectId(scan_id)},
+                {"$set": update, "$unset": {"progress": "", "checkpoint": ""}},
+            )
+        except pymongo.errors.DuplicateKeyError:
+            existing = await db.darkwing.scan.find_one(
+                {"content_hash": content_hash}, projection={"_id": True}
+            )
+            if existing is None:
+                raise
+            raise DuplicateScanError(str(existing["_id"]))
 
+    @staticmethod
     @aio_as_trio
-    async def list_scans(db: AsyncIOMotorClient, page: PageRequest) -> PageResult:
-        """ List scans. """
-        skip = page.page_number * page.items_per_page
-        sort_dir = pymongo.ASCENDING if page.sort_ascending else pymongo.DESCENDING
-        total = await db.darkwing.scan.count_documents({})
-        cursor = db.darkwing.scan.find(skip=skip, limit=page.items_per_page).sort(
-            [(page.sort_column, sort_dir)]
+    async def delete_scan(
+        db: AsyncIOMotorClient,
+        scan_id: str,
+        host_ids: typing.Iterable[bson.ObjectId] = (),
+        batch_size: int = 10000,
+    ):
+        """
+        Delete a scan and its hosts, e.g. after its ingest failed.
+
+        :param host_ids: Hosts that may have been inserted but not added to the scan
+            yet, e.g. the batch that was being written when the ingest failed.
+        :param batch_size: The number of hosts to delete at a time.
+        """
+        doc = await db.darkwing.scan.find_one(
+            {"_id": bson.ObjectId(scan_id)},
+            projection={"hosts": True, "checkpoint.staged": True},
+        )
+        ids = list(host_ids)
+        if doc is not None:
+            ids.extend(doc.get("hosts", []))
+            ids.extend(doc.get("checkpoint", {}).get("staged", []))
+        for offset in range(0, len(ids), batch_size):
+            result = await db.darkwing.host.delete_many(
+                {"_id": {"$in": ids[offset : offset + batch_size]}}
+            )
+            count_cache.add("host", -result.deleted_count)
+        result = await db.darkwing.scan.delete_one({"_id": bson.ObjectId(scan_id)})
+        count_cache.add("scan", -result.deleted_count)
+
+    @staticmethod
+    @aio_as_trio
+    async def abandon_scan(db: AsyncIOMotorClient, scan_id: str):
+        """
+        Mark a scan that was started with :meth:`start_scan` as incomplete, e.g. because
+        the scanner stopped before it finished. The hosts that were inserted are kept.
+        """
+        await db.darkwing.scan.update_one(
+            {"_id": bson.ObjectId(scan_id)},
+            {"$set": {"incomplete": True}, "$unset": {"progress": ""}},
         )
+
+    @staticmethod
+    @aio_as_trio
+    async def list_scans(db: AsyncIOMotorClient, page: PageRequest) -> PageResult:
+        """
+        List scans.
+
+        Scans are sorted by one of the :data:`SCAN_SORT_FIELDS`, or in insertion order
+        if the page's sort column is not one of them. If the page has an ``after``
+        token, the scans are read with a range query on the sort index instead of
+        skipping.
+
+        :raises ValueError: If the page's token is not valid for this sort order.
+        """
+        sort = sort_spec(SCAN_SORT_FIELDS, page.sort_column, page.sort_ascending)
+        total = await count_cache.count(db.darkwing.scan, {})
+        sort_stage = {"$sort": dict(sort)}
+        pipeline: typing.List[dict]
+        if page.after:
+            pipeline = [{"$match": keyset_query(sort, page.after)}, sort_stage]
+        else:
+            skip = page.page_number * page.items_per_page
+            pipeline = [sort_stage, {"$skip": skip}]
+        pipeline.append({"$limit": page.items_per_page})
+        pipeline.append({"$project": _LIST_PROJECTION})
+        cursor = db.darkwing.scan.aggregate(pipeline)
         scans: typing.List[ScanListItem] = list()
+        doc = None
         async for doc in cursor:
             scans.append(ScanListItem.from_db(doc))
-        return PageResult(total, scans)
+        next_token = None
+        if doc is not None and len(scans) == page.items_per_page:
+            next_token = encode_token(sort, doc)
+        return PageResult(total, scans, next_token)
 
+    @staticmethod
     @aio_as_trio
     async def get_scan(db: AsyncIOMotorClient, id_: bson.ObjectId) -> dict:
         """ Get scan details. """
-        doc = await db.darkwing.scan.find_one({"_id": bson.ObjectId(id_)})
+        cursor = db.darkwing.scan.aggregate(
+            [
+                {"$match": {"_id": bson.ObjectId(id_)}},
+                {"$project": dict(_LIST_PROJECTION, progress=True, incomplete=True)},
+            ]
+        )
+        docs = await cursor.to_list(length=1)
+        if not docs:
+            # TODO clean up
+            raise Exception("Scan not found")
+        doc = docs[0]
+        summary = doc.get("summary", {})
         return {
             "scan_id": str(doc["_id"]),
             "scanner": doc["scanner"],
@@ -119,10 +450,100 @@ class ScanDb:
             "command_line": doc["command_line"],
             "started": maybe(doc["started"]).isoformat().or_else(None),
             "completed": maybe(doc["completed"]).isoformat().or_else(None),
-            "host_count": len(doc["hosts"]),
+            "host_count": doc["host_count"],
+            "hosts_up": summary.get("hosts_up"),
+            "hosts_down": summary.get("hosts_down"),
+            "open_ports": summary.get("open_ports"),
+            "services": summary.get("services"),
+            "progress": _progress_to_json(doc.get("progress")),
+            "incomplete": doc.get("incomplete", False),
         }
 
 
+async def _insert_host_docs(
+    db: AsyncIOMotorClient,
+    scan_id: str,
+    host_docs: typing.List[typing.Mapping[str, typing.Any]],
+    host_ids: typing.Optional[typing.List[bson.ObjectId]] = None,
+    summary: typing.Optional[dict] = None,
+) -> typing.List[bson.ObjectId]:
+    if not host_docs:
+        return list()
+    await db.darkwing.host.insert_many(host_docs)
+    count_cache.add("host", len(host_docs))
+    if host_ids is None:
+        # The driver adds an _id to each dict it inserts, but it leaves raw BSON
+        # documents out of inserted_ids, so read the IDs from the documents themselves.
+        host_ids = [doc["_id"] for doc in host_docs]
+    if summary is None:
+        summary = hosts_summary(host_docs)
+    update = _add_hosts_update(host_ids, summary)
+    await db.darkwing.scan.update_one({"_id": bson.ObjectId(scan_id)}, update)
+    return host_ids
+
+
+def _add_hosts_update(host_ids: typing.List[bson.ObjectId], summary: dict) -> dict:
+    """
+    Build an update that adds hosts to a scan and adds their summary, see
+    :func:`darkwing.database.host.hosts_summary`, to the scan's summary.
+    """
+    return {
+        "$push": {"hosts": {"$each": host_ids}},
+        "$inc": {
+            "summary.host_count": len(host_ids),
+            "summary.hosts_up": summary["hosts_up"],
+            "summary.hosts_down": summary["hosts_down"],
+            "summary.open_ports": summary["open_ports"],
+        },
+        "$addToSet": {"summary.services": {"$each": summary["services"]}},
+    }
+
+
+def _scan_to_dict(scan: HostScan) -> dict:
+    return {
+        "scanner": scan.scanner,
+        "scanner_version": scan.scanner_version,
+        "command_line": scan.command_line,
+        "started": scan.started,
+        "completed": scan.completed,
+        "hosts": [],
+        "summary": {
+            "host_count": 0,
+            "hosts_up": 0,
+            "hosts_down": 0,
+            "open_ports": 0,
+            "services": [],
+        },
+    }
+
+
+def _host_to_dict(host: Host) -> dict:
+    ports = [_port_to_dict(p) for p in host.ports]
+    return {
+        "started": host.started,
+        "completed": host.completed,
+        "state": maybe(host.state).name.or_else(None),
+        "state_reason": host.state_reason,
+        "addresses": [str(a) for a in host.addresses],
+        "address_keys": [address_key(a) for a in host.addresses],
+        "hostnames": list(host.hostnames),
+        "ports": ports,
+        "summary": host_summary(ports),
+    }
+
+
+def _progress_to_json(progress: typing.Optional[dict]) -> typing.Optional[dict]:
+    if progress is None:
+        return None
+    return {
+        "task": progress["task"],
+        "time": maybe(progress["time"]).isoformat().or_else(None),
+        "percent": progress["percent"],
+        "remaining": progress["remaining"],
+        "est_completion": maybe(progress["est_completion"]).isoformat().or_else(None),
+    }
+
+
 def _port_to_dict(port: Port) -> dict:
     svc = port.service
     return {
@@ -0,0 +1,204 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+from dataclasses import dataclass
+import glob
+import logging
+import os
+import tarfile
+import time
+import typing
+
+import trio
+
+from ..nmap.loader import DEFAULT_BATCH_SIZE
+from ..nmap.stream import open_bytes, open_scan
+from .pipeline import DEFAULT_PIECE_SIZE, DEFAULT_QUEUE_SIZE, run_pool_pipeline
+from .workers import ParsePool
+
+if typing.TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+
+logger = logging.getLogger(__name__)
+
+# Files with these suffixes are imported when a directory or archive is scanned.
+SCAN_SUFFIXES = (".xml", ".xml.gz", ".xml.bz2", ".xml.xz")
+
+
+@dataclass
+class ImportStats:
+    """ Counters for a bulk import. """
+
+    files: int = 0
+    failed: int = 0
+    skipped: int = 0
+    hosts: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def files_per_sec(self) -> float:
+        return self.files / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def hosts_per_sec(self) -> float:
+        return self.hosts / self.elapsed if self.elapsed else 0.0
+
+
+def iter_sources(
+    paths: typing.Iterable[str],
+) -> typing.Iterator[typing.Tuple[str, typing.Union[str, bytes]]]:
+    """
+    Find the scan files named by ``paths``.
+
+    Each path may be a scan file, a directory that is searched recursively, a tar
+    archive (optionally compressed), or a glob pattern that matches any of those.
+
+    :returns: An iterator of (name, source) pairs, where ``source`` is either the path
+        to a file or, for a tar archive member, the member's contents.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for dir_path, dir_names, file_names in os.walk(path):
+                dir_names.sort()
+                for file_name in sorted(file_names):
+                    if file_name.endswith(SCAN_SUFFIXES):
+                        file_path = os.path.join(dir_path, file_name)
+                        yield file_path, file_path
+        elif os.path.isfile(path):
+            if not path.endswith(SCAN_SUFFIXES) and tarfile.is_tarfile(path):
+                yield from _iter_tar(path)
+            else:
+                yield path, path
+        elif any(c in path for c in "*?["):
+            yield from iter_sources(sorted(glob.glob(path, recursive=True)))
+        else:
+            raise FileNotFoundError(f"No such file or directory: {path}")
+
+
+def _iter_tar(path: str) -> typing.Iterator[typing.Tuple[str, bytes]]:
+    """ Read scan files from a tar archive in a single streaming pass. """
+    with tarfile.open(path, "r|*") as archive:
+        for member in archive:
+            if member.isfile() and member.name.endswith(SCAN_SUFFIXES):
+                file = archive.extractfile(member)
+                if file is not None:
+                    yield f"{path}:{member.name}", file.read()
+
+
+async def import_scans(
+    db: AsyncIOMotorClient,
+    paths: typing.Iterable[str],
+    pool: typing.Optional[ParsePool] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    piece_size: int = DEFAULT_PIECE_SIZE,
+) -> ImportStats:
+    """
+    Bulk import scan files, e.g. to backfill archived scans.
+
+    Several files are imported at a time, and each file is split into pieces that are
+    parsed and converted in ``pool`` while earlier pieces are inserted into the
+    database, see :func:`run_pool_pipeline`. A file that fails to load is logged and
+    skipped.
+
+    Imports are checkpointed, so if an import is interrupted, running it again skips
+    the files that were already imported and resumes partially imported files from
+    their last checkpoint. A file is identified by its path, size, and modification
+    time.
+
+    :param db: The database client.
+    :param paths: Files, directories, tar archives, or glob patterns, see
+        :func:`iter_sources`.
+    :param pool: Worker processes for parsing. If None, files are parsed in threads.
+    :param batch_size: The number of hosts in each insert.
+    :param piece_size: The approximate number of bytes of XML in each parse job.
+    """
+    stats = ImportStats()
+    start = time.perf_counter()
+    sources = iter_sources(paths)
+    seen: typing.Set[str] = set()
+    # Keep every worker busy, but do not read more files into memory than that.
+    slots = trio.Semaphore(pool.workers if pool else 1)
+
+    async def import_file(name: str, source: typing.Union[str, bytes]):
+        try:
+            # The file may have been removed or become unreadable since it was found.
+            key = await trio.to_thread.run_sync(source_key, name, source)
+            if key in seen:
+                return
+            seen.add(key)
+            stream = await trio.to_thread.run_sync(_open_source, source)
+            with stream:
+                scan_id, file_stats = await run_pool_pipeline(
+                    db,
+                    stream,
+                    pool,
+                    queue_size=pool.workers if pool else DEFAULT_QUEUE_SIZE,
+                    piece_size=piece_size,
+                    source=key,
+                    batch_size=batch_size,
+                )
+        except Exception:
+            logger.exception("Failed to load %s", name)
+            stats.failed += 1
+            return
+        finally:
+            slots.release()
+
+        if file_stats.duplicate:
+            logger.info("Skipped %s: already imported (scan %s)", name, scan_id)
+            stats.skipped += 1
+            return
+        stats.files += 1
+        stats.hosts += file_stats.write.items
+        stats.elapsed = time.perf_counter() - start
+        logger.info(
+            "[%d files, %.1f files/sec] Imported %s: %d hosts (scan %s)%s",
+            stats.files,
+            stats.files_per_sec,
+            name,
+            file_stats.resumed + file_stats.write.items,
+            scan_id,
+            f", resumed after {file_stats.resumed} hosts" if file_stats.resumed else "",
+        )
+
+    async with trio.open_nursery() as nursery:
+        while True:
+            item = await trio.to_thread.run_sync(next, sources, None)
+            if item is None:
+                break
+            name, source = item
+            await slots.acquire()
+            nursery.start_soon(import_file, name, source)
+    stats.elapsed = time.perf_counter() - start
+    return stats
+
+
+def _open_source(source: typing.Union[str, bytes]) -> typing.BinaryIO:
+    return open_bytes(source) if isinstance(source, bytes) else open_scan(source)
+
+
+def source_key(name: str, source: typing.Union[str, bytes]) -> str:
+    """
+    Identify a scan file for checkpoints, see :meth:`ScanDb.start_scan`.
+
+    A file that has been modified since it was imported has a different key.
+    """
+    if isinstance(source, bytes):
+        return f"{os.path.abspath(name)}:{len(source)}"
+    stat = os.stat(source)
+    return f"{os.path.abspath(source)}:{stat.st_size}:{stat.st_mtime_ns}"
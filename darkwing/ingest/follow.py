@@ -0,0 +1,130 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+import logging
+import typing
+
+import trio
+
+from ..database.scan import ScanDb
+from ..nmap.documents import host_document
+from ..nmap.loader import convert_nmaprun, convert_progress
+from ..nmap.parser import (
+    Finished as NmapFinished,
+    Host as NmapHost,
+    NmapRun,
+    NmapXmlParser,
+    TaskProgress as NmapTaskProgress,
+)
+
+if typing.TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+
+logger = logging.getLogger(__name__)
+
+
+async def follow_scan(
+    db: AsyncIOMotorClient,
+    path: trio.Path,
+    poll_interval: float = 1.0,
+    chunk_size: int = 1 << 16,
+    engine: str = "sax",
+    idle_timeout: typing.Optional[float] = None,
+) -> typing.Optional[str]:
+    """
+    Ingest an nmap XML file while nmap is still writing it, like ``tail -f``.
+
+    New bytes are fed to the parser as they appear in the file. The scan document is
+    created as soon as <nmaprun> is parsed, each completed host is inserted into the
+    database as soon as its </host> has been written, and the scan's progress is
+    updated from nmap's <taskprogress> elements. This returns after <finished> has been
+    parsed, or after ``idle_timeout`` seconds without any new data.
+
+    Progress is only written to the file if nmap is run with ``--stats-every``.
+
+    :param db: The database client.
+    :param path: The path to the growing ``-oX`` file. If it does not exist yet, this
+        waits for it to be created.
+    :param poll_interval: The number of seconds to wait when no new data is available.
+    :param chunk_size: The maximum number of bytes to read at a time.
+    :param engine: The XML engine to use, see :class:`NmapXmlParser`.
+    :param idle_timeout: If set, give up after this many seconds without new data,
+        e.g. because nmap was killed before it wrote <finished>. The scan is kept with
+        the hosts that were ingested, but it is marked as incomplete.
+    :returns: The scan ID, or None if the timeout expired before the scan started.
+    """
+    idle_since = trio.current_time()
+
+    def timed_out() -> bool:
+        if idle_timeout is None:
+            return False
+        return trio.current_time() - idle_since >= idle_timeout
+
+    while not await path.exists():
+        if timed_out():
+            logger.warning("Gave up waiting for %s to be created", path)
+            return None
+        logger.info("Waiting for %s to be created…", path)
+        await trio.sleep(poll_interval)
+
+    parser = NmapXmlParser(engine)
+    scan_id: typing.Optional[str] = None
+    host_count = 0
+    async with await path.open("rb") as file:
+        while True:
+            chunk = await file.read(chunk_size)
+            if not chunk:
+                if timed_out():
+                    logger.warning(
+                        "No new data in %s for %.0f sec: giving up", path, idle_timeout
+                    )
+                    if scan_id is not None:
+                        await ScanDb.abandon_scan(db, scan_id)
+                    return scan_id
+                await trio.sleep(poll_interval)
+                continue
+            idle_since = trio.current_time()
+            parser.feed(chunk)
+
+            hosts = list()
+            finished = None
+            progress = None
+            for event in parser.events():
+                if isinstance(event, NmapRun):
+                    scan_id = await ScanDb.start_scan(db, convert_nmaprun(event))
+                    logger.info("Following scan %s from %s", scan_id, path)
+                elif isinstance(event, NmapHost):
+                    hosts.append(host_document(event))
+                elif isinstance(event, NmapTaskProgress):
+                    progress = event
+                elif isinstance(event, NmapFinished):
+                    finished = event
+
+            if scan_id is None:
+                continue
+            if hosts:
+                await ScanDb.insert_host_documents(db, scan_id, hosts)
+                host_count += len(hosts)
+                logger.info("Scan %s: inserted %d hosts", scan_id, host_count)
+            if finished is not None:
+                await ScanDb.finish_scan(db, scan_id, finished.finished)
+                logger.info("Scan %s finished: %s", scan_id, finished.summary)
+                return scan_id
+            if progress is not None:
+                # Only the latest progress in each chunk is worth writing.
+                await ScanDb.update_progress(db, scan_id, convert_progress(progress))
@@ -0,0 +1,518 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+A staged ingest pipeline: parse → convert → write.
+
+Each stage runs in its own task and the stages are connected by bounded trio memory
+channels, so parsing later hosts overlaps with converting and inserting earlier ones,
+and a slow stage applies backpressure to the stages before it instead of letting work
+pile up in memory. The CPU-bound work in the parse and convert stages runs in worker
+threads so that the event loop stays free to talk to the database, or in a
+:class:`ParsePool` of worker processes if one is configured.
+"""
+
+from __future__ import annotations
+from base64 import b64decode
+from dataclasses import dataclass, field
+import hashlib
+import logging
+import time
+import typing
+
+import bson
+from bson.raw_bson import RawBSONDocument
+import trio
+
+from ..database.scan import DuplicateScanError, ScanDb
+from ..model.scan import HostScan
+from ..nmap.documents import encode_hosts
+from ..nmap.loader import DEFAULT_BATCH_SIZE, convert_nmaprun
+from ..nmap.parallel import HostRangeReader, parse_envelope
+from ..nmap.parser import (
+    Finished as NmapFinished,
+    Host as NmapHost,
+    NmapRun,
+    NmapXmlParseException,
+    NmapXmlParser,
+)
+from ..nmap.stream import DEFAULT_CHUNK_SIZE, open_bytes
+from .workers import ParsePool, encode_range
+
+if typing.TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+
+logger = logging.getLogger(__name__)
+
+# The default number of items that each channel between two stages can hold.
+DEFAULT_QUEUE_SIZE = 4
+
+# The default number of bytes of XML in each job sent to a ParsePool.
+DEFAULT_PIECE_SIZE = 1 << 22
+
+
+@dataclass
+class StageStats:
+    """
+    Counters for one pipeline stage.
+
+    ``busy`` is time spent doing the stage's own work, ``blocked`` is time spent waiting
+    for the next stage to accept output (i.e. backpressure), and the queue depths are
+    sampled from the stage's output channel each time it sends. A stage that is always
+    busy while the stages before it are blocked is the bottleneck.
+    """
+
+    name: str
+    items: int = 0
+    busy: float = 0.0
+    blocked: float = 0.0
+    sends: int = 0
+    queue_total: int = 0
+    queue_max: int = 0
+
+    @property
+    def throughput(self) -> float:
+        """ Items processed per second of busy time. """
+        return self.items / self.busy if self.busy else 0.0
+
+    @property
+    def queue_mean(self) -> float:
+        """ The average depth of the output queue. """
+        return self.queue_total / self.sends if self.sends else 0.0
+
+    async def send(self, channel: trio.MemorySendChannel, value: typing.Any):
+        """ Send ``value`` downstream, recording backpressure and queue depth. """
+        start = time.perf_counter()
+        await channel.send(value)
+        self.blocked += time.perf_counter() - start
+        depth = channel.statistics().current_buffer_used
+        self.sends += 1
+        self.queue_total += depth
+        self.queue_max = max(self.queue_max, depth)
+
+    def to_json(self) -> dict:
+        return {
+            "items": self.items,
+            "busy": round(self.busy, 3),
+            "blocked": round(self.blocked, 3),
+            "throughput": round(self.throughput, 1),
+            "queue_mean": round(self.queue_mean, 2),
+            "queue_max": self.queue_max,
+        }
+
+
+@dataclass
+class PipelineStats:
+    """ Counters for a whole pipeline run. """
+
+    parse: StageStats = field(default_factory=lambda: StageStats("parse"))
+    convert: StageStats = field(default_factory=lambda: StageStats("convert"))
+    write: StageStats = field(default_factory=lambda: StageStats("write"))
+    elapsed: float = 0.0
+    duplicate: bool = False
+    # The number of hosts committed before a checkpointed ingest was resumed.
+    resumed: int = 0
+
+    def to_json(self) -> dict:
+        return {
+            "elapsed": round(self.elapsed, 3),
+            "duplicate": self.duplicate,
+            "resumed": self.resumed,
+            "stages": {
+                s.name: s.to_json() for s in (self.parse, self.convert, self.write)
+            },
+        }
+
+
+async def ingest_base64(
+    db: AsyncIOMotorClient,
+    data: str,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    pool: typing.Optional[ParsePool] = None,
+    source: typing.Optional[str] = None,
+) -> typing.Tuple[str, PipelineStats]:
+    """
+    Ingest a base64-encoded nmap XML scan, as sent to the ``upload_scan`` RPC.
+
+    Without a pool or a source, the payload is decoded one chunk at a time by the parse
+    stage rather than all at once up front, see :func:`run_pipeline`. Otherwise, it is
+    decoded in one piece so that it can be split up, see :func:`run_pool_pipeline`.
+
+    Uploads are deduplicated by the SHA-256 hash of the decoded scan. The hash is
+    computed in a streaming pass over the payload before anything is parsed, and if the
+    same scan has already been stored, its ID is returned with ``duplicate`` set in the
+    statistics. Two identical uploads that run at the same time both pass this check,
+    so the hash is also checked when the scan is finished, see :func:`run_pipeline`.
+
+    :param source: If set, the ingest is checkpointed so that a retry with the same
+        source resumes it, see :func:`run_pool_pipeline`.
+    """
+    start = time.perf_counter()
+    digest = await trio.to_thread.run_sync(
+        content_hash, base64_chunks(data, chunk_size)
+    )
+    existing = await ScanDb.find_scan_by_hash(db, digest)
+    if existing is not None:
+        stats = PipelineStats(duplicate=True)
+        stats.elapsed = time.perf_counter() - start
+        logger.info("Scan is a duplicate of scan %s", existing)
+        return existing, stats
+    if pool is None and source is None:
+        return await run_pipeline(
+            db, base64_chunks(data, chunk_size), batch_size, queue_size, digest
+        )
+    scan_data = await trio.to_thread.run_sync(b64decode, data)
+    return await run_pool_pipeline(
+        db,
+        scan_data,
+        pool,
+        queue_size,
+        source=source,
+        batch_size=batch_size,
+        digest=digest,
+    )
+
+
+def content_hash(chunks: typing.Iterable[bytes]) -> str:
+    """ Return the SHA-256 hex digest of a scan, hashing it one chunk at a time. """
+    sha256 = hashlib.sha256()
+    for chunk in chunks:
+        sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+async def run_pipeline(
+    db: AsyncIOMotorClient,
+    chunks: typing.Iterator[bytes],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+    digest: typing.Optional[str] = None,
+) -> typing.Tuple[str, PipelineStats]:
+    """
+    Ingest an nmap XML scan through the staged pipeline.
+
+    If the ingest fails or is cancelled, the partial scan and its hosts are deleted.
+
+    :param db: The database client.
+    :param chunks: The scan's bytes. The iterator is advanced in a worker thread, so it
+        may do blocking work such as reading or decoding.
+    :param batch_size: The number of hosts in each insert.
+    :param queue_size: The capacity of each channel between two stages.
+    :param digest: The scan's content hash, see :func:`content_hash`, which is stored
+        when the scan is finished. If another scan with the same hash was finished
+        first, this one is deleted and that scan's ID is returned.
+    :returns: The scan ID and the pipeline's statistics.
+    """
+    stats = PipelineStats()
+    start = time.perf_counter()
+    event_send, event_recv = trio.open_memory_channel(queue_size)
+    doc_send, doc_recv = trio.open_memory_channel(queue_size)
+    writing: typing.List[bson.ObjectId] = list()
+    scan_id = None
+    try:
+        async with trio.open_nursery() as nursery:
+            # The scan document must exist before any hosts can be written, so the
+            # parse stage reports the scan header as soon as it has parsed it.
+            scan = await nursery.start(_parse_stage, chunks, event_send, stats.parse)
+            scan_id = await ScanDb.start_scan(db, scan)
+            nursery.start_soon(
+                _convert_stage, event_recv, doc_send, batch_size, stats.convert
+            )
+            nursery.start_soon(
+                _write_stage, db, scan_id, doc_recv, stats.write, writing
+            )
+        await ScanDb.finish_scan(db, scan_id, scan.completed, digest)
+    except DuplicateScanError as dse:
+        await _delete_partial_scan(db, scan_id, writing)
+        stats.duplicate = True
+        logger.info("Scan is a duplicate of scan %s", dse.scan_id)
+        return dse.scan_id, stats
+    except BaseException:
+        await _delete_partial_scan(db, scan_id, writing)
+        raise
+    stats.elapsed = time.perf_counter() - start
+    logger.info("Ingested scan %s: %r", scan_id, stats.to_json())
+    return scan_id, stats
+
+
+async def run_pool_pipeline(
+    db: AsyncIOMotorClient,
+    data: typing.Union[bytes, typing.BinaryIO],
+    pool: typing.Optional[ParsePool],
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+    piece_size: int = DEFAULT_PIECE_SIZE,
+    source: typing.Optional[str] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    digest: typing.Optional[str] = None,
+) -> typing.Tuple[str, PipelineStats]:
+    """
+    Ingest an nmap XML scan, parsing and converting it in a pool of worker processes.
+
+    The scan is split into pieces of about ``piece_size`` bytes at <host> boundaries,
+    see :class:`HostRangeReader`. Each piece is parsed, converted, and encoded to BSON
+    by one job in the pool, so the parse stage's statistics cover all three. Up to
+    ``queue_size`` jobs per upload are queued ahead of the writer, and their results
+    are inserted in document order.
+
+    If ``source`` is given, the ingest is checkpointed after each piece. If an earlier
+    ingest of the same source was interrupted, this one resumes from its last
+    checkpoint: the pieces before it are read but not parsed, and no host is inserted
+    twice. A source must not be ingested by two tasks at once. Without a source, a
+    failed or cancelled ingest deletes the partial scan and its hosts instead.
+
+    :param db: The database client.
+    :param data: The scan, as bytes or a binary stream. Either may be compressed.
+    :param pool: The worker pool, which may be shared with other uploads. If None, the
+        pieces are parsed in worker threads instead.
+    :param queue_size: The number of jobs to queue ahead of the writer.
+    :param piece_size: The approximate number of bytes in each job.
+    :param source: Identifies the scan for checkpoints, see :meth:`ScanDb.start_scan`.
+        If a scan from this source has already been ingested, its ID is returned with
+        ``duplicate`` set in the statistics.
+    :param batch_size: The maximum number of hosts in each insert.
+    :param digest: The scan's content hash, see :func:`run_pipeline`.
+    :returns: The scan ID and the pipeline's statistics.
+    """
+    stats = PipelineStats()
+    start = time.perf_counter()
+    stream = open_bytes(data) if isinstance(data, bytes) else data
+    reader = await trio.to_thread.run_sync(HostRangeReader, stream, piece_size)
+
+    checkpoint = None
+    if source is not None:
+        existing = await ScanDb.find_scan_by_source(db, source)
+        if existing is not None:
+            stats.duplicate = True
+            return existing, stats
+        checkpoint = await ScanDb.resume_checkpoint(db, source)
+    if checkpoint is not None:
+        scan_id = checkpoint.scan_id
+        stats.resumed = checkpoint.hosts
+        logger.info(
+            "Resuming scan %s at byte %d after %d hosts",
+            scan_id,
+            checkpoint.offset,
+            checkpoint.hosts,
+        )
+        await trio.to_thread.run_sync(reader.skip_to, checkpoint.offset)
+    else:
+        try:
+            scan_id = await ScanDb.start_scan(
+                db, parse_envelope(reader.header, b""), source
+            )
+        except DuplicateScanError as dse:
+            stats.duplicate = True
+            return dse.scan_id, stats
+
+    job_send, job_recv = trio.open_memory_channel(queue_size)
+
+    async def submit_jobs():
+        async with job_send:
+            while True:
+                piece = await trio.to_thread.run_sync(next, reader, None)
+                if piece is None:
+                    break
+                _, piece_end, piece_data = piece
+                if pool is None:
+                    job = await trio.to_thread.run_sync(
+                        encode_range, reader.header, piece_data
+                    )
+                else:
+                    job = pool.submit(encode_range, reader.header, piece_data)
+                await stats.parse.send(job_send, (piece_end, job))
+
+    writing: typing.List[bson.ObjectId] = list()
+
+    async def write_results():
+        async with job_recv:
+            async for piece_end, job in job_recv:
+                result = job if pool is None else await pool.wait(job)
+                busy, host_ids, raw_docs, summary = result
+                stats.parse.busy += busy
+                stats.parse.items += len(raw_docs)
+                docs = [RawBSONDocument(raw) for raw in raw_docs]
+                write_start = time.perf_counter()
+                if source is None:
+                    writing[:] = host_ids
+                    await ScanDb.insert_host_documents(
+                        db, scan_id, docs, host_ids, summary
+                    )
+                    writing.clear()
+                else:
+                    for offset in range(0, len(docs), batch_size):
+                        end = offset + batch_size
+                        await ScanDb.stage_host_documents(
+                            db, scan_id, docs[offset:end], host_ids[offset:end]
+                        )
+                    await ScanDb.commit_checkpoint(
+                        db, scan_id, host_ids, summary, piece_end
+                    )
+                stats.write.busy += time.perf_counter() - write_start
+                stats.write.items += len(docs)
+
+    try:
+        async with trio.open_nursery() as nursery:
+            nursery.start_soon(submit_jobs)
+            nursery.start_soon(write_results)
+        scan = parse_envelope(reader.header, reader.footer)
+        await ScanDb.finish_scan(db, scan_id, scan.completed, digest)
+    except DuplicateScanError as dse:
+        await _delete_partial_scan(db, scan_id, writing)
+        stats.duplicate = True
+        logger.info("Scan is a duplicate of scan %s", dse.scan_id)
+        return dse.scan_id, stats
+    except BaseException:
+        # A checkpointed scan is kept so that it can be resumed.
+        if source is None:
+            await _delete_partial_scan(db, scan_id, writing)
+        raise
+    stats.elapsed = time.perf_counter() - start
+    logger.info("Ingested scan %s: %r", scan_id, stats.to_json())
+    return scan_id, stats
+
+
+def base64_chunks(
+    data: str, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> typing.Iterator[bytes]:
+    """
+    Decode base64 text lazily, yielding about ``chunk_size`` decoded bytes at a time.
+    """
+    if any(c in data for c in " \t\r\n"):
+        # Chunks must be split on 4 character boundaries, so remove line breaks first.
+        data = "".join(data.split())
+    step = max(4, chunk_size // 3 * 4)
+    for offset in range(0, len(data), step):
+        yield b64decode(data[offset : offset + step])
+
+
+async def _delete_partial_scan(
+    db: AsyncIOMotorClient,
+    scan_id: typing.Optional[str],
+    host_ids: typing.List[bson.ObjectId],
+):
+    """
+    Delete a scan whose ingest did not finish, so that it does not show up in listings.
+    This is shielded from cancellation, since it usually runs because of one.
+    """
+    if scan_id is None:
+        return
+    with trio.CancelScope(shield=True):
+        try:
+            await ScanDb.delete_scan(db, scan_id, host_ids)
+        except Exception:
+            logger.exception("Failed to delete partial scan %s", scan_id)
+
+
+async def _parse_stage(
+    chunks: typing.Iterator[bytes],
+    send: trio.MemorySendChannel,
+    stats: StageStats,
+    task_status=trio.TASK_STATUS_IGNORED,
+):
+    """
+    Parse chunks of XML and send lists of host events downstream.
+
+    :raises NmapXmlParseException: If the scan header is missing.
+    """
+    parser = NmapXmlParser()
+    scan: typing.Optional[HostScan] = None
+
+    def parse_next() -> typing.Optional[typing.List[typing.Any]]:
+        chunk = next(chunks, None)
+        if chunk is None:
+            return None
+        parser.feed(chunk)
+        return list(parser.events())
+
+    async with send:
+        while True:
+            start = time.perf_counter()
+            events = await trio.to_thread.run_sync(parse_next)
+            stats.busy += time.perf_counter() - start
+            if events is None:
+                break
+            hosts = list()
+            for event in events:
+                if isinstance(event, NmapHost):
+                    hosts.append(event)
+                elif isinstance(event, NmapRun):
+                    scan = convert_nmaprun(event)
+                    task_status.started(scan)
+                elif scan and isinstance(event, NmapFinished):
+                    scan.completed = event.finished
+            if hosts and scan:
+                stats.items += len(hosts)
+                await stats.send(send, hosts)
+
+    if scan is None:
+        raise NmapXmlParseException("The scan has no <nmaprun> header")
+
+
+async def _convert_stage(
+    recv: trio.MemoryReceiveChannel,
+    send: trio.MemorySendChannel,
+    batch_size: int,
+    stats: StageStats,
+):
+    """
+    Regroup host events into batches and convert them to raw BSON documents. Each batch
+    is sent downstream with its host IDs and summary, see :func:`encode_hosts`.
+    """
+
+    def convert(batch):
+        host_ids, raw_docs, summary = encode_hosts(batch)
+        return host_ids, [RawBSONDocument(raw) for raw in raw_docs], summary
+
+    async def flush(batch):
+        start = time.perf_counter()
+        host_ids, docs, summary = await trio.to_thread.run_sync(convert, batch)
+        stats.busy += time.perf_counter() - start
+        stats.items += len(docs)
+        await stats.send(send, (host_ids, docs, summary))
+
+    async with recv, send:
+        batch: typing.List[NmapHost] = list()
+        async for hosts in recv:
+            batch.extend(hosts)
+            while len(batch) >= batch_size:
+                await flush(batch[:batch_size])
+                batch = batch[batch_size:]
+        if batch:
+            await flush(batch)
+
+
+async def _write_stage(
+    db: AsyncIOMotorClient,
+    scan_id: str,
+    recv: trio.MemoryReceiveChannel,
+    stats: StageStats,
+    writing: typing.List[bson.ObjectId],
+):
+    """
+    Insert batches of host documents. ``writing`` holds the IDs of the batch that is
+    being inserted, so that they can be deleted if the insert fails.
+    """
+    async with recv:
+        async for host_ids, docs, summary in recv:
+            start = time.perf_counter()
+            writing[:] = host_ids
+            await ScanDb.insert_host_documents(db, scan_id, docs, host_ids, summary)
+            writing.clear()
+            stats.busy += time.perf_counter() - start
+            stats.items += len(docs)
@@ -0,0 +1,231 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+import json
+import logging
+import math
+import os
+import pathlib
+import typing
+
+import bson
+import pymongo.errors
+import trio
+
+from ..database.scan import ScanDb
+from .pipeline import ingest_base64
+
+if typing.TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from .workers import ParsePool
+
+
+logger = logging.getLogger(__name__)
+
+
+class Spool:
+    """
+    A durable, on-disk queue of uploaded scans.
+
+    An upload is acknowledged as soon as it has been written to the spool and synced
+    to disk, and background workers ingest queued uploads into the database one at a
+    time each. Upload latency therefore stays flat during bursts, and an upload is not
+    lost if the database is slow or down: workers retry until the database accepts it.
+    Each upload is checkpointed with its upload ID as the source, so a retry resumes
+    the same scan rather than starting another one.
+
+    The spool directory contains:
+
+    * ``incoming/``: uploads that are still being written. Anything left here after a
+      crash was never acknowledged, so it is deleted on startup.
+    * ``pending/``: acknowledged uploads waiting to be ingested. These are queued
+      again on startup, so the spool survives restarts.
+    * ``done/``: a small JSON record of each ingested upload's scan ID and pipeline
+      statistics.
+    * ``failed/``: uploads that could not be parsed, with a JSON record of the error.
+
+    Uploads are named by ObjectIds, so they are drained in the order they arrived.
+    """
+
+    def __init__(
+        self,
+        directory: typing.Union[str, os.PathLike],
+        workers: int = 1,
+        retry_delay: float = 30.0,
+    ):
+        """
+        Constructor.
+
+        :param directory: The spool directory, which is created if necessary.
+        :param workers: The number of uploads to ingest concurrently.
+        :param retry_delay: Seconds to wait before retrying an upload after a database
+            error.
+        """
+        self._dir = pathlib.Path(directory)
+        self._workers = workers
+        self._retry_delay = retry_delay
+        self._send, self._recv = trio.open_memory_channel(math.inf)
+
+    async def put(self, data: str) -> str:
+        """
+        Durably queue a base64-encoded scan.
+
+        :returns: The upload ID, see :meth:`status`.
+        """
+        upload_id = str(bson.ObjectId())
+        await trio.to_thread.run_sync(self._write_pending, upload_id, data)
+        self._send.send_nowait(upload_id)
+        return upload_id
+
+    async def status(self, upload_id: str) -> typing.Optional[dict]:
+        """
+        Return the state of an upload, or None if the ID is not known.
+        """
+        if not bson.ObjectId.is_valid(upload_id):
+            return None
+        return await trio.to_thread.run_sync(self._read_status, upload_id)
+
+    async def run(
+        self,
+        db: AsyncIOMotorClient,
+        pool: typing.Optional[ParsePool] = None,
+        task_status=trio.TASK_STATUS_IGNORED,
+    ):
+        """
+        Drain the spool. This runs until cancelled.
+
+        :param db: The database client.
+        :param pool: Worker processes for parsing, see :func:`ingest_base64`.
+        """
+        pending = await trio.to_thread.run_sync(self._recover)
+        if pending:
+            logger.info("Spool has %d pending uploads", len(pending))
+        for upload_id in pending:
+            self._send.send_nowait(upload_id)
+        async with trio.open_nursery() as nursery:
+            for _ in range(self._workers):
+                nursery.start_soon(self._drain, db, pool)
+            task_status.started()
+
+    async def _drain(self, db: AsyncIOMotorClient, pool: typing.Optional[ParsePool]):
+        """ Ingest queued uploads one at a time. """
+        async for upload_id in self._recv:
+            path = self._dir / "pending" / f"{upload_id}.b64"
+            data = await trio.to_thread.run_sync(path.read_text, "ascii")
+            while True:
+                try:
+                    scan_id, stats = await ingest_base64(
+                        db, data, pool=pool, source=upload_id
+                    )
+                except pymongo.errors.PyMongoError:
+                    logger.exception(
+                        "Database error ingesting upload %s: retrying in %.0f sec",
+                        upload_id,
+                        self._retry_delay,
+                    )
+                    await trio.sleep(self._retry_delay)
+                    continue
+                except Exception as exc:
+                    logger.exception("Failed to ingest upload %s", upload_id)
+                    await self._discard_scan(db, upload_id)
+                    record: typing.Dict[str, typing.Any] = {
+                        "state": "failed",
+                        "error": str(exc),
+                    }
+                    await trio.to_thread.run_sync(
+                        self._finish, upload_id, "failed", record
+                    )
+                    break
+                if stats.duplicate:
+                    # A retry can find that an identical upload finished in the
+                    # meantime, which leaves this upload's partial scan behind.
+                    await self._discard_scan(db, upload_id)
+                record = {
+                    "state": "done",
+                    "scan_id": scan_id,
+                    "duplicate": stats.duplicate,
+                    "stats": stats.to_json(),
+                }
+                await trio.to_thread.run_sync(self._finish, upload_id, "done", record)
+                logger.info("Ingested upload %s as scan %s", upload_id, scan_id)
+                break
+
+    async def _discard_scan(self, db: AsyncIOMotorClient, upload_id: str):
+        """ Delete the partial scan left behind by an upload that did not finish. """
+        try:
+            checkpoint = await ScanDb.resume_checkpoint(db, upload_id)
+            if checkpoint is not None:
+                await ScanDb.delete_scan(db, checkpoint.scan_id)
+        except pymongo.errors.PyMongoError:
+            logger.exception("Failed to delete partial scan for upload %s", upload_id)
+
+    def _recover(self) -> typing.List[str]:
+        """ Create the spool directories and return the pending upload IDs. """
+        for name in ("incoming", "pending", "done", "failed"):
+            (self._dir / name).mkdir(parents=True, exist_ok=True)
+        for path in (self._dir / "incoming").iterdir():
+            logger.warning("Removing incomplete upload %s", path.name)
+            path.unlink()
+        return sorted(p.stem for p in (self._dir / "pending").glob("*.b64"))
+
+    def _write_pending(self, upload_id: str, data: str):
+        """ Write an upload and make sure that it survives a crash. """
+        incoming = self._dir / "incoming" / f"{upload_id}.b64"
+        pending = self._dir / "pending" / f"{upload_id}.b64"
+        _write_synced(incoming, data.encode("ascii"))
+        # The rename is atomic, so pending/ only ever contains complete uploads.
+        os.rename(incoming, pending)
+        _sync_dir(pending.parent)
+
+    def _finish(self, upload_id: str, state: str, record: dict):
+        """ Record the outcome of an upload and remove it from the queue. """
+        pending = self._dir / "pending" / f"{upload_id}.b64"
+        _write_synced(
+            self._dir / state / f"{upload_id}.json", json.dumps(record).encode("utf8")
+        )
+        if state == "failed":
+            # Keep the upload so that it can be inspected.
+            os.rename(pending, self._dir / "failed" / pending.name)
+        else:
+            pending.unlink()
+        _sync_dir(pending.parent)
+
+    def _read_status(self, upload_id: str) -> typing.Optional[dict]:
+        for state in ("done", "failed"):
+            path = self._dir / state / f"{upload_id}.json"
+            if path.exists():
+                return json.loads(path.read_text("utf8"))
+        if (self._dir / "pending" / f"{upload_id}.b64").exists():
+            return {"state": "pending"}
+        return None
+
+
+def _write_synced(path: pathlib.Path, data: bytes):
+    """ Write a file and flush it to disk. """
+    with path.open("wb") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def _sync_dir(path: pathlib.Path):
+    """ Flush a directory's entries to disk, e.g. after a rename. """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,107 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+from concurrent.futures import Future, ProcessPoolExecutor
+import logging
+import multiprocessing
+import time
+import typing
+
+import bson
+import trio
+
+from ..nmap.documents import encode_hosts
+from ..nmap.parser import Host as NmapHost, NmapXmlParser
+
+
+logger = logging.getLogger(__name__)
+
+
+class ParsePool:
+    """
+    A pool of worker processes for CPU-bound parsing and conversion.
+
+    XML parsing holds the GIL, so concurrent uploads parsed in threads all compete for
+    one core, along with the event loop itself. Jobs submitted to this pool run in
+    separate processes instead. The pool is shared by all connections and its size is
+    set by ``DARKWING_PARSE_WORKERS``.
+
+    Workers are started with the ``spawn`` method, because forking a process that is
+    running an event loop and database threads is not safe.
+    """
+
+    def __init__(self, workers: int):
+        """
+        Constructor.
+
+        :param workers: The number of worker processes.
+        """
+        self.workers = workers
+        self._executor = ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def submit(self, fn: typing.Callable, *args) -> Future:
+        """
+        Schedule ``fn(*args)`` in a worker process. The function and its arguments must
+        be picklable.
+        """
+        return self._executor.submit(fn, *args)
+
+    @staticmethod
+    async def wait(future: Future) -> typing.Any:
+        """ Wait for a job's result without blocking the event loop. """
+        try:
+            return await trio.to_thread.run_sync(future.result, cancellable=True)
+        except trio.Cancelled:
+            future.cancel()
+            raise
+
+    async def run_sync(self, fn: typing.Callable, *args) -> typing.Any:
+        """ Run ``fn(*args)`` in a worker process and return its result. """
+        return await self.wait(self.submit(fn, *args))
+
+    def shutdown(self):
+        """ Stop the worker processes, abandoning any jobs that have not started. """
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def encode_range(
+    header: bytes, data: bytes
+) -> typing.Tuple[float, typing.List[bson.ObjectId], typing.List[bytes], dict]:
+    """
+    Parse a range of <host> elements and encode them as BSON host documents. This runs
+    in a worker process.
+
+    Results are returned as plain BSON bytes, which are much cheaper to send back to the
+    parent process than pickled objects.
+
+    :param header: The document's prologue, see
+        :func:`darkwing.nmap.parallel.find_host_ranges`.
+    :param data: The bytes of the range.
+    :returns: The time spent in the worker, followed by the documents' IDs, the
+        encoded documents, and their summary, see
+        :func:`darkwing.nmap.documents.encode_hosts`.
+    """
+    start = time.perf_counter()
+    parser = NmapXmlParser()
+    parser.feed(header)
+    parser.feed(data)
+    host_ids, docs, summary = encode_hosts(
+        event for event in parser.events() if isinstance(event, NmapHost)
+    )
+    return time.perf_counter() - start, host_ids, docs, summary
@@ -0,0 +1,276 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+from collections import OrderedDict
+from datetime import datetime
+from ipaddress import ip_address
+import io
+import json
+import os
+import typing
+
+from lxml import etree
+
+from ..model.host import Host, HostState, Port, PortState, Service, Transport
+from ..model.scan import HostScan
+from ..nmap.stream import open_scan
+
+
+# The maximum number of hosts that are held in memory while records are grouped.
+DEFAULT_WINDOW = 65536
+
+
+class MasscanParseException(Exception):
+    """ Indicates an error while parsing masscan output. """
+
+
+class MasscanRecord(typing.NamedTuple):
+    """ One port on one host, which is the unit that masscan reports. """
+
+    address: str
+    timestamp: int
+    port: int
+    protocol: str
+    state: typing.Optional[str]
+    reason: typing.Optional[str]
+    service: typing.Optional[str]
+
+
+def load_masscan(
+    path: typing.Union[str, os.PathLike], window: int = DEFAULT_WINDOW
+) -> HostScan:
+    """
+    Load a masscan output file into a scan. See :func:`iter_masscan`.
+
+    This accumulates every host in memory. For very large files, iterate over the hosts
+    with :func:`iter_masscan` instead.
+    """
+    scan, hosts = iter_masscan(path, window)
+    scan.hosts.extend(hosts)
+    return scan
+
+
+def iter_masscan(
+    path: typing.Union[str, os.PathLike], window: int = DEFAULT_WINDOW
+) -> typing.Tuple[HostScan, typing.Iterator[Host]]:
+    """
+    Stream hosts from a masscan output file.
+
+    Both the XML (``-oX``) and JSON (``-oJ`` or ``-oD``, i.e. one record per line)
+    formats are supported, optionally compressed with gzip, bzip2, or xz. The format is
+    detected from the file's content.
+
+    masscan writes one record per open port, in no particular order. Records are grouped
+    into hosts as they are read, and up to ``window`` hosts are held in memory at a time.
+    When the window is full, the host that was seen least recently is emitted. If a
+    host's records are spread further apart than the window, that host is emitted more
+    than once, each time with a subset of its ports.
+
+    :returns: A scan header and an iterator of hosts. The header's ``hosts`` list is
+        left empty, and its start and completion times are filled in as the iterator
+        is consumed. The file is only open while the iterator is running, and it is
+        closed if the iterator is closed or discarded before it is exhausted.
+    """
+    scan = HostScan("masscan", None)
+    with open_scan(path) as stream:
+        # Every stream that open_scan() returns is buffered and supports peek().
+        first = typing.cast(io.BufferedReader, stream).peek(64).lstrip()[:1]
+    read: typing.Callable[[typing.BinaryIO, HostScan], typing.Iterator[MasscanRecord]]
+    if first == b"<":
+        read = _read_xml
+    elif first in (b"[", b"{"):
+        read = _read_json
+    else:
+        raise MasscanParseException(f"Unrecognized masscan format: {path}")
+    return scan, _iter_hosts(path, read, scan, window)
+
+
+def _iter_hosts(
+    path: typing.Union[str, os.PathLike],
+    read: typing.Callable[[typing.BinaryIO, HostScan], typing.Iterator[MasscanRecord]],
+    scan: HostScan,
+    window: int,
+) -> typing.Iterator[Host]:
+    """ Open the file and group its records into hosts. """
+    with open_scan(path) as stream:
+        yield from _group_hosts(read(stream, scan), window)
+
+
+def _group_hosts(
+    records: typing.Iterator[MasscanRecord], window: int
+) -> typing.Iterator[Host]:
+    """ Group records into hosts, holding at most ``window`` hosts at a time. """
+    open_hosts: typing.OrderedDict[str, Host] = OrderedDict()
+    ports: typing.Dict[str, typing.Dict[typing.Tuple[int, str], Port]] = dict()
+    last_timestamp, time = None, datetime.min
+    for record in records:
+        if record.timestamp != last_timestamp:
+            # Consecutive records usually share a timestamp, and converting it is
+            # comparatively expensive.
+            last_timestamp = record.timestamp
+            time = datetime.utcfromtimestamp(record.timestamp)
+        host = open_hosts.get(record.address)
+        if host is None:
+            if len(open_hosts) >= window:
+                address, oldest = open_hosts.popitem(last=False)
+                oldest.ports = list(ports.pop(address).values())
+                yield oldest
+            host = Host(
+                started=time,
+                completed=time,
+                state=HostState.UP,
+                addresses=[ip_address(record.address)],
+            )
+            open_hosts[record.address] = host
+            ports[record.address] = dict()
+        else:
+            open_hosts.move_to_end(record.address)
+            if host.started is None or time < host.started:
+                host.started = time
+            if host.completed is None or time > host.completed:
+                host.completed = time
+        _merge_port(ports[record.address], record)
+
+    for address, host in open_hosts.items():
+        host.ports = list(ports[address].values())
+        yield host
+
+
+def _merge_port(
+    ports: typing.Dict[typing.Tuple[int, str], Port], record: MasscanRecord
+):
+    """
+    Add a record to a host's ports. A port can be reported twice, once for its state and
+    once for its banner, so the two records are merged.
+    """
+    transport = _TRANSPORTS.get(record.protocol)
+    if transport is None:
+        # masscan also reports ICMP and SCTP, which the host model does not support.
+        return
+    key = (record.port, record.protocol)
+    port = ports.get(key)
+    if port is None:
+        port = Port(record.port, transport)
+        ports[key] = port
+    if record.state is not None:
+        try:
+            port.state = _PORT_STATES[record.state]
+        except KeyError:
+            raise MasscanParseException(f"Invalid masscan port state: {record.state}")
+        port.state_reason = record.reason
+    elif port.state is None:
+        # A banner implies that the port is open.
+        port.state = PortState.OPEN
+    if record.service is not None and port.service is None:
+        port.service = Service(record.service)
+
+
+_TRANSPORTS = {"tcp": Transport.TCP, "udp": Transport.UDP}
+_PORT_STATES = {
+    "open": PortState.OPEN,
+    "closed": PortState.CLOSED,
+    "filtered": PortState.FILTERED,
+}
+
+
+def _read_json(
+    stream: typing.BinaryIO, scan: HostScan
+) -> typing.Iterator[MasscanRecord]:
+    """
+    Read records from masscan's JSON output.
+
+    masscan's ``-oJ`` output is a JSON array with one record per line, and ``-oD`` is
+    one record per line without the array, so both are read line by line. Some masscan
+    versions end the array with a non-JSON ``{finished: 1}`` line, which is skipped.
+    """
+    first: typing.Optional[int] = None
+    last: typing.Optional[int] = None
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip().strip(b",")
+        if line in (b"", b"[", b"]") or line.startswith(b"{finished"):
+            continue
+        try:
+            doc = json.loads(line)
+        except ValueError as ve:
+            raise MasscanParseException(
+                f"Invalid masscan JSON on line {line_number}: {ve}"
+            ) from ve
+        timestamp = int(doc["timestamp"])
+        # Compare the raw timestamps, and only convert the ones that widen the scan.
+        if first is None or timestamp < first:
+            first = timestamp
+            scan.started = datetime.utcfromtimestamp(timestamp)
+        if last is None or timestamp > last:
+            last = timestamp
+            scan.completed = datetime.utcfromtimestamp(timestamp)
+        for port in doc.get("ports", ()):
+            service = port.get("service")
+            yield MasscanRecord(
+                doc["ip"],
+                timestamp,
+                int(port["port"]),
+                port["proto"],
+                port.get("status"),
+                port.get("reason"),
+                service.get("name") if service else None,
+            )
+
+
+def _read_xml(
+    stream: typing.BinaryIO, scan: HostScan
+) -> typing.Iterator[MasscanRecord]:
+    """ Read records from masscan's XML output. """
+    context = etree.iterparse(
+        stream,
+        events=("start", "end"),
+        tag=("nmaprun", "host", "finished"),
+        resolve_entities=False,
+        huge_tree=True,
+    )
+    for event, element in context:
+        if element.tag == "host":
+            if event == "end":
+                yield from _xml_host_records(element)
+                # Discard finished hosts so that the tree does not grow.
+                element.clear()
+                parent = element.getparent()
+                if parent is not None:
+                    parent.remove(element)
+        elif event == "start" and element.tag == "nmaprun":
+            scan.scanner_version = element.get("version")
+            if element.get("start"):
+                scan.started = datetime.utcfromtimestamp(int(element.get("start")))
+        elif event == "start" and element.tag == "finished":
+            scan.completed = datetime.utcfromtimestamp(int(element.get("time")))
+
+
+def _xml_host_records(element) -> typing.Iterator[MasscanRecord]:
+    """ Read records from a masscan <host> element. """
+    address = element.find("address").get("addr")
+    timestamp = int(element.get("endtime"))
+    for port in element.iterfind("ports/port"):
+        state = port.find("state")
+        service = port.find("service")
+        yield MasscanRecord(
+            address,
+            timestamp,
+            int(port.get("portid")),
+            port.get("protocol"),
+            state.get("state") if state is not None else None,
+            state.get("reason") if state is not None else None,
+            service.get("name") if service is not None else None,
+        )
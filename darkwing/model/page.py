@@ -25,12 +25,17 @@ T = typing.TypeVar("T")
 class PageRequest:
     """
     Represents a request for a page from a result set.
+
+    A page is either selected by its number, or by ``after``: the ``next_token`` of
+    the previous page. The token stays fast no matter how deep the page is, and when
+    it is set, ``page_number`` is ignored.
     """
 
     page_number: int
     items_per_page: int
     sort_column: str
     sort_ascending: bool
+    after: typing.Optional[str] = None
 
     @staticmethod
     def from_json(json: dict):
@@ -39,6 +44,7 @@ class PageRequest:
             json["items_per_page"],
             json["sort_column"],
             json["sort_ascending"],
+            json.get("after"),
         )
 
 
@@ -50,9 +56,11 @@ class PageResult:
 
     total_count: int
     items: typing.List[typing.Any]
+    next_token: typing.Optional[str] = None
 
     def serialize(self, serialize_fn) -> dict:
         return {
             "total_count": self.total_count,
             "items": [serialize_fn(i) for i in self.items],
+            "next_token": self.next_token,
         }
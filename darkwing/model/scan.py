@@ -22,10 +22,19 @@ import typing
 from .host import Host
 
 
+@dataclass
+class ScanProgress:
+    task: str
+    time: datetime
+    percent: float
+    remaining: typing.Optional[int] = None
+    est_completion: typing.Optional[datetime] = None
+
+
 @dataclass
 class HostScan:
     scanner: str
-    scanner_version: str
+    scanner_version: typing.Optional[str]
     command_line: typing.Optional[str] = None
     started: typing.Optional[datetime] = None
     completed: typing.Optional[datetime] = None
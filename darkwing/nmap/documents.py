@@ -0,0 +1,161 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Convert nmap parser events directly into MongoDB documents.
+
+This is the fast path for ingesting scans. It produces exactly the same documents as
+converting events to :mod:`darkwing.model` objects with :func:`loader.convert_host`
+and then serializing those objects in :mod:`darkwing.database.scan`, but without
+building the intermediate objects.
+"""
+
+import typing
+
+import bson
+from bson.raw_bson import RawBSONDocument
+
+from ..database.address import address_key
+from ..database.host import host_summary, hosts_summary
+from ..model.host import HostState, PortState, Transport
+from .parser import Host as NmapHost, Port as NmapPort
+
+
+_HOST_STATES = {"up": HostState.UP.name, "down": HostState.DOWN.name}
+_TRANSPORTS = {"tcp": Transport.TCP.name, "udp": Transport.UDP.name}
+_PORT_STATES = {
+    "open": PortState.OPEN.name,
+    "closed": PortState.CLOSED.name,
+    "filtered": PortState.FILTERED.name,
+}
+
+
+def host_document(event: NmapHost) -> dict:
+    """ Convert a parser host event to a host document. """
+    status = event.status
+    if status is None:
+        raise Exception("Nmap is missing host state")
+    try:
+        state = _HOST_STATES[status.state]
+    except KeyError:
+        raise Exception(f'Invalid nmap host state: "{status.state}"')
+
+    address = event.address
+    ports = [port_document(p) for p in event.ports]
+    return {
+        "started": event.starttime,
+        "completed": event.endtime,
+        "state": state,
+        "state_reason": status.reason,
+        "addresses": [str(address)] if address else [],
+        "address_keys": [address_key(address)] if address else [],
+        "hostnames": list(event.hostnames),
+        "ports": ports,
+        "summary": host_summary(ports),
+    }
+
+
+def raw_host_document(event: NmapHost) -> RawBSONDocument:
+    """
+    Convert a parser host event to a host document that is already encoded as BSON.
+
+    See :func:`encode_document`.
+    """
+    return encode_document(host_document(event))
+
+
+def encode_hosts(
+    events: typing.Iterable[NmapHost],
+) -> typing.Tuple[typing.List[bson.ObjectId], typing.List[bytes], dict]:
+    """
+    Convert parser host events to host documents and encode them as BSON.
+
+    The documents' IDs and their summary for the scan are returned alongside their
+    BSON. Reading them back out of the raw documents would decode each document, and
+    that would happen on the event loop.
+
+    :returns: The IDs and the encoded documents, in the same order, and the summary,
+        see :func:`darkwing.database.host.hosts_summary`.
+    """
+    host_ids = list()
+    docs = list()
+    dicts = list()
+    for event in events:
+        doc = host_document(event)
+        docs.append(bytes(encode_document(doc).raw))
+        host_ids.append(doc["_id"])
+        dicts.append(doc)
+    return host_ids, docs, hosts_summary(dicts)
+
+
+def encode_document(doc: dict) -> RawBSONDocument:
+    """
+    Encode a document to BSON ahead of inserting it.
+
+    The driver passes raw documents through unchanged, so calling this in the worker
+    thread that converts hosts moves the cost of BSON encoding out of the database
+    write. The document is assigned an ``_id`` first, because the driver cannot add
+    one to a raw document.
+    """
+    if "_id" not in doc:
+        doc["_id"] = bson.ObjectId()
+    return RawBSONDocument(bson.encode(doc))
+
+
+def port_document(event: NmapPort) -> dict:
+    """ Convert a parser port event to a port document. """
+    try:
+        transport = _TRANSPORTS[event.protocol]
+    except KeyError:
+        raise Exception(f'Invalid Nmap transport: "{event.protocol}"')
+
+    state: typing.Optional[str] = None
+    state_reason: typing.Optional[str] = None
+    if event.state:
+        try:
+            state = _PORT_STATES[event.state.state]
+        except KeyError:
+            raise Exception(f"Invalid Nmap port state: {event.state.state}")
+        state_reason = event.state.reason
+
+    service: typing.Dict[str, typing.Any]
+    svc = event.service
+    if svc:
+        service = {
+            "name": svc.name,
+            "product": svc.product,
+            "version": svc.version,
+            "method": None,
+            "confidence": None,
+            "cpes": [],
+        }
+    else:
+        service = {
+            "name": None,
+            "product": None,
+            "version": None,
+            "method": None,
+            "confidence": None,
+            "cpes": None,
+        }
+
+    return {
+        "number": event.portid,
+        "transport": transport,
+        "state": state,
+        "state_reason": state_reason,
+        "service": service,
+    }
@@ -14,44 +14,124 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import io
+import os
 import typing
 
 from ..model.host import Host, HostState, Port, PortState, Service, Transport
-from ..model.scan import HostScan
+from ..model.scan import HostScan, ScanProgress
 from .parser import (
     Finished as NmapFinished,
     Host as NmapHost,
     NmapXmlParser,
+    NmapXmlParseException,
     NmapRun,
+    ParseFilter,
     Port as NmapPort,
+    TaskProgress as NmapTaskProgress,
 )
+from .stream import parse_path, parse_stream
 
 
-def load_scan(data: str) -> HostScan:
-    parser = NmapXmlParser()
+# The default number of hosts in each batch yielded by iter_scan() and iter_path().
+DEFAULT_BATCH_SIZE = 1000
+
+
+def load_scan(data: str, parse_filter: typing.Optional[ParseFilter] = None) -> HostScan:
+    parser = NmapXmlParser(parse_filter=parse_filter)
     parser.feed(data)
+    return _build_scan(parser.events())
+
+
+def load_path(
+    path: typing.Union[str, os.PathLike],
+    engine: str = "sax",
+    parse_filter: typing.Optional[ParseFilter] = None,
+) -> HostScan:
+    """
+    Load a scan from an nmap XML file, which may be compressed with gzip, bzip2, or xz.
+    """
+    return _build_scan(parse_path(path, engine=engine, parse_filter=parse_filter))
+
+
+def iter_scan(
+    data: bytes,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    parse_filter: typing.Optional[ParseFilter] = None,
+    convert: typing.Optional[typing.Callable[[NmapHost], typing.Any]] = None,
+) -> typing.Tuple[HostScan, typing.Iterator[typing.List[typing.Any]]]:
+    """
+    Stream hosts from nmap XML in batches, see :func:`iter_path`.
+    """
+    events = parse_stream(io.BytesIO(data), parse_filter=parse_filter)
+    return _iter_batches(events, batch_size, convert or convert_host)
+
+
+def iter_path(
+    path: typing.Union[str, os.PathLike],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    engine: str = "sax",
+    parse_filter: typing.Optional[ParseFilter] = None,
+    convert: typing.Optional[typing.Callable[[NmapHost], typing.Any]] = None,
+) -> typing.Tuple[HostScan, typing.Iterator[typing.List[typing.Any]]]:
+    """
+    Stream hosts from an nmap XML file in batches.
+
+    Unlike :func:`load_path`, the scan's hosts are never all in memory at once: each
+    batch is converted as soon as enough hosts have been parsed, so memory use is
+    bounded by ``batch_size`` rather than by the size of the scan.
+
+    :returns: A scan header and an iterator of host batches. The header's ``hosts``
+        list is left empty, and its completion time is filled in once the iterator is
+        exhausted.
+
+    :param convert: The function that converts each parser host event, by default
+        :func:`convert_host`. Pass :func:`darkwing.nmap.documents.host_document` to
+        get database documents instead of host models.
+    """
+    events = parse_path(path, engine=engine, parse_filter=parse_filter)
+    return _iter_batches(events, batch_size, convert or convert_host)
+
+
+def _iter_batches(
+    events: typing.Iterator[typing.Any],
+    batch_size: int,
+    convert: typing.Callable[[NmapHost], typing.Any],
+) -> typing.Tuple[HostScan, typing.Iterator[typing.List[typing.Any]]]:
+    """ Read the scan header from ``events``, then batch up the remaining hosts. """
+    for event in events:
+        if isinstance(event, NmapRun):
+            scan = convert_nmaprun(event)
+            break
+    else:
+        raise NmapXmlParseException("The scan has no <nmaprun> header")
+
+    def batches() -> typing.Iterator[typing.List[typing.Any]]:
+        batch: typing.List[typing.Any] = list()
+        for event in events:
+            if isinstance(event, NmapHost):
+                batch.append(convert(event))
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = list()
+            elif isinstance(event, NmapFinished):
+                scan.completed = event.finished
+        if batch:
+            yield batch
+
+    return scan, batches()
+
+
+def _build_scan(events: typing.Iterable[typing.Any]) -> HostScan:
+    """ Build a scan from a sequence of parser events. """
     scan: typing.Optional[HostScan] = None
-    for event in parser.events():
+    for event in events:
         if isinstance(event, NmapRun):
-            scan = HostScan(event.scanner, event.scanner_version)
-            scan.command_line = event.command_line
-            scan.started = event.started
+            scan = convert_nmaprun(event)
         elif scan and isinstance(event, NmapFinished):
             scan.completed = event.finished
         elif scan and isinstance(event, NmapHost):
-            host = Host()
-            host.started = event.starttime
-            host.completed = event.endtime
-            if event.status:
-                host.state = _convert_host_state(event.status.state)
-                host.state_reason = event.status.reason
-            else:
-                raise Exception("Nmap is missing host state")
-            if event.address:
-                host.addresses.append(event.address)
-            host.hostnames = list(event.hostnames)
-            host.ports = [_convert_port(p) for p in event.ports]
-            scan.hosts.append(host)
+            scan.hosts.append(convert_host(event))
 
     if scan is None:
         # TODO clean up
@@ -60,6 +140,38 @@ def load_scan(data: str) -> HostScan:
         return scan
 
 
+def convert_nmaprun(event: NmapRun) -> HostScan:
+    """ Convert an <nmaprun> event to a scan without hosts. """
+    scan = HostScan(event.scanner, event.scanner_version)
+    scan.command_line = event.command_line
+    scan.started = event.started
+    return scan
+
+
+def convert_progress(event: NmapTaskProgress) -> ScanProgress:
+    """ Convert a <taskprogress> event to a progress model. """
+    return ScanProgress(
+        event.task, event.time, event.percent, event.remaining, event.est_completion
+    )
+
+
+def convert_host(event: NmapHost) -> Host:
+    """ Convert a parser host event to a host model. """
+    host = Host()
+    host.started = event.starttime
+    host.completed = event.endtime
+    if event.status:
+        host.state = _convert_host_state(event.status.state)
+        host.state_reason = event.status.reason
+    else:
+        raise Exception("Nmap is missing host state")
+    if event.address:
+        host.addresses.append(event.address)
+    host.hostnames = list(event.hostnames)
+    host.ports = [_convert_port(p) for p in event.ports]
+    return host
+
+
 def _convert_host_state(state: str) -> HostState:
     """
     Convert Nmap host state to host state enum.
@@ -100,4 +212,3 @@ def _convert_port_state(state: str) -> PortState:
         }[state]
     except KeyError:
         raise Exception(f"Invalid Nmap port state: {state}")
-
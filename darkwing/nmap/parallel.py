@@ -0,0 +1,274 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import io
+import logging
+import mmap
+import os
+import typing
+
+from ..model.host import Host
+from ..model.scan import HostScan
+from .loader import convert_host, convert_nmaprun, load_path
+from .parser import (
+    Finished as NmapFinished,
+    Host as NmapHost,
+    NmapXmlParser,
+    NmapRun,
+    ParseFilter,
+)
+from .stream import open_scan
+
+
+logger = logging.getLogger(__name__)
+
+_HOST_STARTS = (b"<host ", b"<host>")
+_HOST_END = b"</host>"
+
+
+def load_scan_parallel(
+    source: typing.Union[bytes, str, os.PathLike],
+    workers: typing.Optional[int] = None,
+    pieces: typing.Optional[int] = None,
+    engine: str = "sax",
+    parse_filter: typing.Optional[ParseFilter] = None,
+) -> HostScan:
+    """
+    Load a large scan using a pool of worker processes.
+
+    The document is split into byte ranges that each contain a run of complete <host>
+    elements. Each worker parses its ranges independently, using the document's own
+    prologue (everything up to the first <host>) so that the fragment is well-formed,
+    and the hosts are merged back in document order. The header and footer, i.e.
+    <nmaprun> and <finished>, are parsed in this process.
+
+    This relies on nmap's output never containing a literal ``</host>`` except as an
+    end tag, which holds because nmap escapes markup characters in attribute values and
+    text.
+
+    :param source: The scan, either as bytes or as a path to an uncompressed file.
+        Workers read their ranges from the file directly. A compressed file cannot be
+        split, so it is loaded serially.
+    :param workers: The number of worker processes (default: number of CPUs).
+    :param pieces: The number of byte ranges to split the hosts into (default: 4 per
+        worker, so that uneven ranges are balanced across workers).
+    :param engine: The XML engine to use, see :class:`NmapXmlParser`.
+    :param parse_filter: Optionally skip parts of the scan, see :class:`ParseFilter`.
+    """
+    workers = workers or os.cpu_count() or 1
+    pieces = pieces or workers * 4
+
+    if isinstance(source, bytes):
+        return _load_buffer(source, None, workers, pieces, engine, parse_filter)
+
+    with open_scan(source) as stream:
+        if not isinstance(stream, io.BufferedReader):
+            logger.info("Cannot split compressed file %s: loading serially", source)
+            return load_path(source, engine=engine, parse_filter=parse_filter)
+        if os.fstat(stream.fileno()).st_size == 0:
+            raise Exception("Failed to load scan")
+        with mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return _load_buffer(
+                mapped, os.fspath(source), workers, pieces, engine, parse_filter
+            )
+
+
+def find_host_ranges(
+    buffer: typing.Union[bytes, mmap.mmap], pieces: int
+) -> typing.Tuple[int, int, typing.List[typing.Tuple[int, int]]]:
+    """
+    Find byte ranges that split the <host> elements in an nmap document.
+
+    :returns: A tuple of (header end, footer start, ranges). The header is everything
+        before the first <host>, the footer is everything after the last </host>, and
+        each range starts at a host boundary and ends just after a </host>. If the
+        document has no hosts, the ranges are empty.
+    """
+    starts = [i for i in (buffer.find(s) for s in _HOST_STARTS) if i >= 0]
+    last_end = buffer.rfind(_HOST_END)
+    if not starts or last_end < 0:
+        return len(buffer), len(buffer), []
+    first_start = min(starts)
+    last_end += len(_HOST_END)
+
+    ranges = list()
+    size = max(1, (last_end - first_start) // max(1, pieces))
+    range_start = first_start
+    while range_start < last_end:
+        search_from = min(range_start + size, last_end - len(_HOST_END))
+        range_end = buffer.find(_HOST_END, search_from) + len(_HOST_END)
+        ranges.append((range_start, range_end))
+        range_start = range_end
+    return first_start, last_end, ranges
+
+
+class HostRangeReader:
+    """
+    Split a stream of nmap XML into pieces that each contain a run of complete <host>
+    elements, like :func:`find_host_ranges` but without reading the whole document into
+    memory, so that it also works for compressed files.
+
+    Offsets count bytes of the decompressed document. Each piece ends just after a
+    </host>, so the end of a piece is a safe place to resume from: parse
+    :attr:`header` followed by everything after that offset. The footer is available
+    once every piece has been read.
+    """
+
+    def __init__(self, stream: typing.BinaryIO, piece_size: int):
+        """
+        Constructor. This reads the stream up to the first <host>.
+
+        :param stream: The document.
+        :param piece_size: The approximate number of bytes in each piece.
+        """
+        self._stream = stream
+        self._piece_size = piece_size
+        self._buffer = bytearray()
+        self._eof = False
+        # The offset of the start of the buffer.
+        self.offset = 0
+        self.footer = b""
+        while True:
+            starts = [i for i in (self._buffer.find(s) for s in _HOST_STARTS) if i >= 0]
+            if starts:
+                self.header = self._take(min(starts))
+                break
+            if not self._read():
+                self.header = self._take(len(self._buffer))
+                break
+
+    def skip_to(self, offset: int):
+        """
+        Discard the document up to ``offset``, e.g. to resume from a checkpoint. The
+        discarded bytes are read but not parsed.
+        """
+        if offset <= self.offset:
+            return
+        remaining = offset - self.offset
+        while remaining > len(self._buffer):
+            remaining -= len(self._buffer)
+            self._buffer.clear()
+            if not self._read():
+                raise Exception(f"Offset {offset} is past the end of the scan")
+        del self._buffer[:remaining]
+        self.offset = offset
+
+    def __iter__(self) -> HostRangeReader:
+        return self
+
+    def __next__(self) -> typing.Tuple[int, int, bytes]:
+        """ Return the next piece as a tuple of (start, end, data). """
+        while True:
+            if self._eof or len(self._buffer) >= self._piece_size:
+                end = self._buffer.rfind(_HOST_END)
+                if end >= 0:
+                    start = self.offset
+                    data = self._take(end + len(_HOST_END))
+                    return start, self.offset, data
+                if self._eof:
+                    # Everything after the last </host> is the footer.
+                    if self._buffer:
+                        self.footer = self._take(len(self._buffer))
+                    raise StopIteration
+            self._read()
+
+    def _read(self) -> bool:
+        """ Append the next chunk of the stream to the buffer. """
+        chunk = self._stream.read(self._piece_size)
+        if chunk:
+            self._buffer += chunk
+        else:
+            self._eof = True
+        return bool(chunk)
+
+    def _take(self, size: int) -> bytes:
+        """ Remove ``size`` bytes from the front of the buffer. """
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        self.offset += size
+        return data
+
+
+def parse_envelope(header: bytes, footer: bytes, engine: str = "sax") -> HostScan:
+    """
+    Parse the scan header and footer that :func:`find_host_ranges` splits off.
+
+    :returns: A scan without hosts.
+    """
+    parser = NmapXmlParser(engine)
+    parser.feed(header)
+    parser.feed(footer)
+    scan: typing.Optional[HostScan] = None
+    for event in parser.events():
+        if isinstance(event, NmapRun):
+            scan = convert_nmaprun(event)
+        elif scan and isinstance(event, NmapFinished):
+            scan.completed = event.finished
+    if scan is None:
+        raise Exception("Failed to load scan")
+    return scan
+
+
+def _load_buffer(
+    buffer: typing.Union[bytes, mmap.mmap],
+    path: typing.Optional[str],
+    workers: int,
+    pieces: int,
+    engine: str,
+    parse_filter: typing.Optional[ParseFilter],
+) -> HostScan:
+    """ Load a scan from a buffer, farming out its host ranges to worker processes. """
+    header_end, footer_start, ranges = find_host_ranges(buffer, pieces)
+    header = bytes(buffer[:header_end])
+    scan = parse_envelope(header, bytes(buffer[footer_start:]), engine)
+
+    parse_range = partial(_parse_range, header, engine, parse_filter)
+    tasks: typing.Iterable[typing.Union[bytes, typing.Tuple[str, int, int]]]
+    if path is None:
+        tasks = (buffer[start:end] for start, end in ranges)
+    else:
+        tasks = ((path, start, end) for start, end in ranges)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for hosts in executor.map(parse_range, tasks):
+            scan.hosts.extend(hosts)
+    return scan
+
+
+def _parse_range(
+    header: bytes,
+    engine: str,
+    parse_filter: typing.Optional[ParseFilter],
+    task: typing.Union[bytes, typing.Tuple[str, int, int]],
+) -> typing.List[Host]:
+    """
+    Parse one range of hosts. This runs in a worker process.
+
+    :param task: Either the bytes of the range, or a tuple of (path, start, end).
+    """
+    if isinstance(task, bytes):
+        data = task
+    else:
+        path, start, end = task
+        with open(path, "rb") as file:
+            file.seek(start)
+            data = file.read(end - start)
+    parser = NmapXmlParser(engine, parse_filter)
+    parser.feed(header)
+    parser.feed(data)
+    return [convert_host(e) for e in parser.events() if isinstance(e, NmapHost)]
@@ -16,12 +16,14 @@
 
 from __future__ import annotations
 from collections import deque
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
 from datetime import datetime
 from ipaddress import IPv4Address, IPv6Address
 import typing
 import xml.sax
 
+from lxml import etree
+
 
 class NmapXmlParseException(Exception):
     """ Indicates an error while parsing Nmap XML. """
@@ -35,22 +37,79 @@ class NmapXmlParser(xml.sax.handler.ContentHandler):
     can be used to parse very large nmap files efficiently, to parse nmap files in
     real-time while the scanner is still running, or to parse a file while concurrently
     streaming it over a network connection.
+
+    Two XML engines are available. The ``sax`` engine uses the standard library's SAX
+    parser. The ``lxml`` engine uses lxml's incremental parser with a parser target, so
+    libxml2 calls directly into this class without building an element tree or going
+    through the SAX reader layer, which makes it the faster choice for large files. Both
+    engines produce identical events.
+
+    Element handlers are methods named ``_start_<tag>`` and ``_stop_<tag>``. They are
+    looked up once per parser and stored in a table keyed by tag name, so dispatching an
+    element is a single dictionary lookup.
+
+    A :class:`ParseFilter` can be supplied to skip parts of the scan that the caller
+    does not need. Skipped subtrees are still tokenized by the XML engine, but no event
+    objects are created for them.
+
+    Attribute values with low cardinality, such as port states, reasons, protocols, and
+    service names, are interned in a pool that belongs to this parser. A large scan
+    repeats these values millions of times, and the pool makes every occurrence share
+    one string object, which is then shared by the models and documents built from the
+    events as well. The pool is bounded by ``intern_limit``; once it is full, new values
+    are no longer added but existing ones are still shared.
     """
 
-    def __init__(self):
+    ENGINES = ("sax", "lxml")
+
+    def __init__(
+        self,
+        engine: str = "sax",
+        parse_filter: typing.Optional[ParseFilter] = None,
+        intern_limit: int = 4096,
+    ):
         """
         Constructor.
+
+        :param engine: The XML engine to use: "sax" or "lxml".
+        :param parse_filter: Optionally skip hosts, ports, scripts, or CPEs.
+        :param intern_limit: The maximum number of distinct strings to intern, or 0 to
+            disable interning.
         """
-        self._capture_text = None
+        self._capture_text: typing.Optional[typing.List[str]] = None
         self._current_host = None
         self._current_port = None
+        self._current_port_attrs = None
         self._current_script = None
         self._current_script_name = None
         self._current_script_key = None
-        self._events = deque()
-        self._stack = list()
-        self._parser = xml.sax.make_parser()
-        self._parser.setContentHandler(self)
+        self._events: typing.Deque[typing.Any] = deque()
+        self._stack: typing.List[str] = list()
+        self._on_start = self._find_handlers("_start_")
+        self._on_stop = self._find_handlers("_stop_")
+        self._skip_depth = 0
+        self._strings: typing.Dict[typing.Optional[str], typing.Optional[str]] = dict()
+        self._intern_limit = intern_limit
+        self._host_states = None
+        self._port_states = None
+        if parse_filter is not None:
+            self._host_states = parse_filter.host_states
+            self._port_states = parse_filter.port_states
+            if not parse_filter.scripts:
+                self._on_start["script"] = self._skip_element
+            if not parse_filter.cpes:
+                self._on_start["cpe"] = self._skip_element
+        if engine == "sax":
+            self._parser = xml.sax.make_parser()
+            self._parser.setContentHandler(self)
+        elif engine == "lxml":
+            # huge_tree lifts libxml2's limits on the size of a single feed() and of
+            # text nodes, which large scans easily exceed.
+            self._parser = etree.XMLParser(
+                target=_LxmlTarget(self), resolve_entities=False, huge_tree=True
+            )
+        else:
+            raise NmapXmlParseException(f"Invalid parser engine: {engine}")
 
     def feed(self, data):
         """
@@ -58,32 +117,45 @@ class NmapXmlParser(xml.sax.handler.ContentHandler):
         """
         self._parser.feed(data)
 
+    def _find_handlers(self, prefix: str) -> typing.Dict[str, typing.Callable]:
+        """ Build a table of bound handler methods keyed by element name. """
+        return {
+            name[len(prefix) :]: getattr(self, name)
+            for name in dir(type(self))
+            if name.startswith(prefix)
+        }
+
     def startElement(self, name, attrs):
         """
         This event indicates the start of an XML element. (Part of SAX API)
         """
-        try:
-            callback = getattr(self, f"_start_{name}")
-        except AttributeError:
+        if self._skip_depth:
+            self._skip_depth += 1
             return
-        callback(attrs)
+        callback = self._on_start.get(name)
+        if callback is not None:
+            callback(attrs)
 
     def endElement(self, name):
         """
         This event indicates the end of an XML element. (Part of SAX API)
         """
-        try:
-            callback = getattr(self, f"_stop_{name}")
-        except AttributeError:
+        if self._skip_depth:
+            self._skip_depth -= 1
             return
-        callback()
+        callback = self._on_stop.get(name)
+        if callback is not None:
+            callback()
 
     def characters(self, content):
         """
         Capture data from text nodes if capture currently enabled. (Part of SAX API)
+
+        The XML engines may split a text node into many pieces, so pieces are buffered
+        in a list and joined once when the capture stops.
         """
         if self._capture_text is not None:
-            self._capture_text += content
+            self._capture_text.append(content)
 
     def start_text_capture(self):
         """ Start capturing data from text nodes. """
@@ -91,7 +163,7 @@ class NmapXmlParser(xml.sax.handler.ContentHandler):
             raise NmapXmlParseException(
                 "start_text_capture() called but capture is already on!"
             )
-        self._capture_text = ""
+        self._capture_text = list()
 
     def stop_text_capture(self):
         """ Stop capturing data from text nodes and return the current capture. """
@@ -99,10 +171,30 @@ class NmapXmlParser(xml.sax.handler.ContentHandler):
             raise NmapXmlParseException(
                 "stop_text_capture() called but capture is already off!"
             )
-        text = self._capture_text
+        text = "".join(self._capture_text)
         self._capture_text = None
         return text
 
+    def intern(self, value: typing.Optional[str]) -> typing.Optional[str]:
+        """ Return the pooled copy of a string, adding it if the pool has room. """
+        if len(self._strings) < self._intern_limit:
+            return self._strings.setdefault(value, value)
+        return self._strings.get(value, value)
+
+    def skip(self, levels: int = 1):
+        """
+        Ignore everything up to and including the end tag of the current element.
+
+        This should be called from a start handler. If ``levels`` is greater than 1, the
+        end tags of that many enclosing elements are consumed, e.g. a handler for a
+        child element can skip the rest of its parent.
+        """
+        self._skip_depth = levels
+
+    def _skip_element(self, attrs):
+        """ A start handler that skips an entire element. """
+        self.skip()
+
     def events(self):
         """
         This generator yields high-level events from the parsed XML stream.
@@ -139,11 +231,15 @@ class NmapXmlParser(xml.sax.handler.ContentHandler):
         """
         Create a TaskProgress from a <taskprogress> element.
         """
+        remaining = attrs.get("remaining")
+        etc = attrs.get("etc")
         self._events.append(
             TaskProgress(
-                attrs["task"],
+                self.intern(attrs["task"]),
                 datetime.utcfromtimestamp(int(attrs["time"])),
                 float(attrs["percent"]),
+                int(remaining) if remaining is not None else None,
+                datetime.utcfromtimestamp(int(etc)) if etc is not None else None,
             )
         )
 
@@ -162,8 +258,17 @@ class NmapXmlParser(xml.sax.handler.ContentHandler):
         self._current_host = None
 
     def _start_status(self, attrs):
-        """ Create a Status object from a <status> element. """
-        self._current_host.status = Status(attrs["state"], attrs["reason"])
+        """
+        Create a Status object from a <status> element, or skip the rest of the host if
+        its state is filtered out.
+        """
+        state = attrs["state"]
+        if self._host_states is not None and state not in self._host_states:
+            self._current_host = None
+            self.skip(2)
+        else:
+            intern = self.intern
+            self._current_host.status = Status(intern(state), intern(attrs["reason"]))
 
     def _start_address(self, attrs):
         """ Set the host address from an <address> element. """
@@ -181,11 +286,18 @@ class NmapXmlParser(xml.sax.handler.ContentHandler):
 
     def _start_extraports(self, attrs):
         """ Create an ExtraPorts from an <extraports> element. """
-        self._current_host.extraports = ExtraPorts(attrs["state"], int(attrs["count"]))
+        self._current_host.extraports = ExtraPorts(
+            self.intern(attrs["state"]), int(attrs["count"])
+        )
 
     def _start_port(self, attrs):
-        """ Start a Port object from a <port> element. """
-        self._current_port = Port(attrs["protocol"], int(attrs["portid"]),)
+        """
+        Start a <port> element.
+
+        The Port object is not created until its <state> is known, so that ports which
+        are filtered out are never allocated.
+        """
+        self._current_port_attrs = attrs
 
     def _stop_port(self):
         """ Finish a Port object. """
@@ -193,13 +305,30 @@ class NmapXmlParser(xml.sax.handler.ContentHandler):
         self._current_port = None
 
     def _start_state(self, attrs):
-        """ Create a PortState object from a <state> element. """
-        self._current_port.state = PortState(attrs["state"], attrs["reason"])
+        """
+        Create a Port object with a PortState from a <state> element, or skip the rest
+        of the port if its state is filtered out.
+        """
+        state = attrs["state"]
+        if self._port_states is not None and state not in self._port_states:
+            self.skip(2)
+        else:
+            port_attrs = self._current_port_attrs
+            intern = self.intern
+            self._current_port = Port(
+                intern(port_attrs["protocol"]),
+                int(port_attrs["portid"]),
+                PortState(intern(state), intern(attrs["reason"])),
+            )
+        self._current_port_attrs = None
 
     def _start_service(self, attrs):
         """ Set Port.service from a <service> element. """
+        intern = self.intern
         self._current_port.service = Service(
-            attrs["name"], attrs.get("product"), attrs.get("version")
+            intern(attrs["name"]),
+            intern(attrs.get("product")),
+            intern(attrs.get("version")),
         )
 
     def _start_cpe(self, attrs):
@@ -209,23 +338,30 @@ class NmapXmlParser(xml.sax.handler.ContentHandler):
     def _stop_cpe(self):
         """ Add captured text from </cpe> to current port's CPE's. """
         cpe = self.stop_text_capture().strip()
-        self._current_port.cpes.append(cpe)
+        port = self._current_port
+        if port.cpes is None:
+            port.cpes = [cpe]
+        else:
+            port.cpes.append(cpe)
 
     def _start_script(self, attrs):
         """ Start a dictionary containing script data from a <script>. """
-        self._current_script_name = attrs["id"]
+        self._current_script_name = self.intern(attrs["id"])
         self._current_script = {"output": attrs["output"]}
 
     def _stop_script(self):
         """ Finish a dictionary containing script data from a </script>. """
         # print(f"adding key={self._current_script_name} value={self._current_script}")
-        self._current_port.script[self._current_script_name] = self._current_script
+        port = self._current_port
+        if port.script is None:
+            port.script = dict()
+        port.script[self._current_script_name] = self._current_script
         self._current_script = None
         self._current_script_name = None
 
     def _start_elem(self, attrs):
         """ Start an item for a script dictionary from an <elem>. """
-        self._current_script_key = attrs["key"]
+        self._current_script_key = self.intern(attrs["key"])
         self.start_text_capture()
 
     def _stop_elem(self):
@@ -245,6 +381,55 @@ class NmapXmlParser(xml.sax.handler.ContentHandler):
         )
 
 
+@dataclass
+class ParseFilter:
+    """
+    Selects which parts of a scan :class:`NmapXmlParser` should build.
+
+    ``None`` for a set of states means that all states are accepted.
+    """
+
+    host_states: typing.Optional[typing.FrozenSet[str]] = None
+    port_states: typing.Optional[typing.FrozenSet[str]] = None
+    scripts: bool = True
+    cpes: bool = True
+
+
+class _LxmlTarget:
+    """
+    Adapts an :class:`NmapXmlParser` to lxml's parser target interface.
+
+    lxml looks up these methods once when the parser is created, so they are bound
+    directly to the SAX-style callbacks.
+    """
+
+    def __init__(self, handler: NmapXmlParser):
+        self.start = handler.startElement
+        self.end = handler.endElement
+        self.data = handler.characters
+
+    def close(self):
+        return None
+
+
+def _slotted(cls):
+    """
+    Rebuild a dataclass with ``__slots__``.
+
+    Large scans produce millions of event objects, and slots remove the per-instance
+    ``__dict__``. (This is what ``dataclass(slots=True)`` does on Python 3.10+.)
+    """
+    names = tuple(f.name for f in fields(cls))
+    namespace = {
+        key: value
+        for key, value in cls.__dict__.items()
+        if key not in names and key not in ("__dict__", "__weakref__")
+    }
+    namespace["__slots__"] = names
+    return type(cls)(cls.__name__, cls.__bases__, namespace)
+
+
+@_slotted
 @dataclass
 class NmapRun:
     """ A model for the <nmaprun> element. """
@@ -255,6 +440,7 @@ class NmapRun:
     started: datetime
 
 
+@_slotted
 @dataclass
 class ScanInfo:
     """ A model for the <scaninfo> element. """
@@ -265,6 +451,7 @@ class ScanInfo:
     services: str
 
 
+@_slotted
 @dataclass
 class TaskProgress:
     """ A model for the <taskprogress> element. """
@@ -276,6 +463,7 @@ class TaskProgress:
     est_completion: typing.Optional[datetime] = None
 
 
+@_slotted
 @dataclass
 class Status:
     """ A model for the <status> element. """
@@ -284,12 +472,14 @@ class Status:
     reason: str
 
 
+@_slotted
 @dataclass
 class ExtraPorts:
     state: str
     count: int
 
 
+@_slotted
 @dataclass
 class Host:
     """ A model for a <host> element. """
@@ -304,6 +494,7 @@ class Host:
     extraports: typing.Optional[ExtraPorts] = None
 
 
+@_slotted
 @dataclass
 class PortState:
     """ A model for a <state> element. """
@@ -312,6 +503,7 @@ class PortState:
     reason: str
 
 
+@_slotted
 @dataclass
 class Service:
     """ A model for a <service> element. """
@@ -321,18 +513,25 @@ class Service:
     version: str
 
 
+@_slotted
 @dataclass
 class Port:
-    """ A model for a <port> element. """
+    """
+    A model for a <port> element.
+
+    Most ports have no CPEs or scripts, so those containers are ``None`` until the
+    first item is added.
+    """
 
     protocol: str
     portid: int
     state: typing.Optional[PortState] = None
     service: typing.Optional[Service] = None
-    cpes: typing.List[str] = field(default_factory=list)
-    script: typing.Dict[str, typing.Dict[str, str]] = field(default_factory=dict)
+    cpes: typing.Optional[typing.List[str]] = None
+    script: typing.Optional[typing.Dict[str, typing.Dict[str, str]]] = None
 
 
+@_slotted
 @dataclass
 class Finished:
     """ A model for a <finished> element. """
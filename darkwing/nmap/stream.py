@@ -0,0 +1,140 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+import bz2
+import gzip
+import io
+import lzma
+import mmap
+import os
+import typing
+
+from .parser import NmapXmlParser, ParseFilter
+
+
+# The default number of bytes to read from a stream at a time.
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+# Compressed formats are identified by their magic bytes rather than the file
+# extension, so that a misnamed archive still loads.
+_DECOMPRESSORS: typing.List[typing.Tuple[bytes, typing.Callable]] = [
+    (b"\x1f\x8b", gzip.open),
+    (b"BZh", bz2.open),
+    (b"\xfd7zXZ\x00", lzma.open),
+]
+
+
+def parse_stream(
+    stream: typing.BinaryIO,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    engine: str = "sax",
+    parse_filter: typing.Optional[ParseFilter] = None,
+) -> typing.Iterator[typing.Any]:
+    """
+    Parse nmap XML from a binary stream and yield parser events.
+
+    The stream is read in fixed-size chunks, so memory use does not depend on the size
+    of the stream, and each event is yielded as soon as the chunk that completes it has
+    been parsed.
+
+    :param stream: A file-like object opened in binary mode.
+    :param chunk_size: The number of bytes to read at a time.
+    :param engine: The XML engine to use, see :class:`NmapXmlParser`.
+    :param parse_filter: Optionally skip parts of the scan, see :class:`ParseFilter`.
+    """
+    parser = NmapXmlParser(engine, parse_filter)
+    while chunk := stream.read(chunk_size):
+        parser.feed(chunk)
+        yield from parser.events()
+
+
+def parse_path(
+    path: typing.Union[str, os.PathLike],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    engine: str = "sax",
+    use_mmap: bool = False,
+    parse_filter: typing.Optional[ParseFilter] = None,
+) -> typing.Iterator[typing.Any]:
+    """
+    Parse an nmap XML file and yield parser events.
+
+    Files compressed with gzip, bzip2, or xz are decompressed on the fly.
+
+    :param path: The path to the file.
+    :param chunk_size: The number of bytes to parse at a time.
+    :param engine: The XML engine to use, see :class:`NmapXmlParser`.
+    :param use_mmap: If True, map an uncompressed file into memory instead of reading
+        it, and the kernel pages it in as the parser advances. With the ``sax`` engine,
+        each chunk is passed to the parser as a view of the mapping, so the file is not
+        copied through a read buffer. lxml only accepts bytes, so each chunk is still
+        copied. It has no effect on compressed files.
+    :param parse_filter: Optionally skip parts of the scan, see :class:`ParseFilter`.
+    """
+    with open_scan(path) as stream:
+        if use_mmap and isinstance(stream, io.BufferedReader):
+            yield from _parse_mmap(stream, chunk_size, engine, parse_filter)
+        else:
+            yield from parse_stream(stream, chunk_size, engine, parse_filter)
+
+
+def open_scan(path: typing.Union[str, os.PathLike]) -> typing.BinaryIO:
+    """
+    Open a scan file for reading in binary mode, decompressing it if necessary.
+    """
+    with open(path, "rb") as probe:
+        magic = probe.read(6)
+    for prefix, open_fn in _DECOMPRESSORS:
+        if magic.startswith(prefix):
+            return open_fn(path, "rb")
+    return open(path, "rb")
+
+
+def open_bytes(data: bytes) -> typing.BinaryIO:
+    """
+    Open a scan that is already in memory as a binary stream, decompressing it if
+    necessary.
+    """
+    stream = io.BytesIO(data)
+    for prefix, open_fn in _DECOMPRESSORS:
+        if data.startswith(prefix):
+            return open_fn(stream, "rb")
+    return stream
+
+
+def _parse_mmap(
+    stream: typing.BinaryIO,
+    chunk_size: int,
+    engine: str,
+    parse_filter: typing.Optional[ParseFilter],
+) -> typing.Iterator[typing.Any]:
+    """ Parse a regular file through a read-only memory map. """
+    if os.fstat(stream.fileno()).st_size == 0:
+        return
+    parser = NmapXmlParser(engine, parse_filter)
+    with mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        if engine == "lxml":
+            # lxml cannot parse from a buffer, so slicing the map copies each chunk.
+            for offset in range(0, len(mapped), chunk_size):
+                parser.feed(mapped[offset : offset + chunk_size])
+                yield from parser.events()
+            return
+        # Views must be released before the map can be closed.
+        with memoryview(mapped) as view:
+            for offset in range(0, len(view), chunk_size):
+                with view[offset : offset + chunk_size] as chunk:
+                    parser.feed(chunk)
+                yield from parser.events()
@@ -35,6 +35,8 @@ import trio_websocket
 if typing.TYPE_CHECKING:
     import configparser
     from motor.motor_asyncio import AsyncIOMotorClient
+    from ..ingest.spool import Spool
+    from ..ingest.workers import ParsePool
 
 
 # Import the server handler modules after dispatch is defined so that they can use the
@@ -50,6 +52,8 @@ logger = logging.getLogger(__name__)
 class DispatchContext:
     config: configparser.ConfigParser
     db: AsyncIOMotorClient
+    parse_pool: typing.Optional[ParsePool] = None
+    spool: typing.Optional[Spool] = None
     # token_signer: TimedJSONWebSignatureSerializer
     user: typing.Optional[str] = None
 
@@ -14,12 +14,16 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+from ipaddress import ip_network
 import logging
+import typing
 
+import bson
 from pymaybe import maybe
+from trio_jsonrpc import JsonRpcInvalidParamsError
 
 from . import dispatch
-from ..database.host import HostDb
+from ..database.host import HOST_FIELDS, MAX_GET_HOSTS, HostDb
 from ..model.page import PageRequest
 
 
@@ -27,7 +31,7 @@ logger = logging.getLogger(__name__)
 
 
 @dispatch.handler
-async def list_hosts(page: dict) -> dict:
+async def list_hosts(page: dict, network: typing.Optional[str] = None) -> dict:
     def jsonify_host_item(host):
         return {
             "host_id": host.host_id,
@@ -38,45 +42,103 @@ async def list_hosts(page: dict) -> dict:
             "addresses": [str(addr) for addr in host.addresses],
             "hostnames": host.hostnames,
             "cover_image": None,
+            "summary": jsonify_summary(host.summary) if host.summary else None,
         }
 
-    result = await HostDb.list_hosts(dispatch.ctx.db, PageRequest.from_json(page))
+    def jsonify_summary(summary):
+        return {
+            "open_ports": summary.open_ports,
+            "closed_ports": summary.closed_ports,
+            "filtered_ports": summary.filtered_ports,
+            "services": summary.services,
+        }
+
+    if network is not None:
+        try:
+            ip_network(network, strict=False)
+        except ValueError as ve:
+            raise JsonRpcInvalidParamsError(str(ve))
+
+    try:
+        result = await HostDb.list_hosts(
+            dispatch.ctx.db, PageRequest.from_json(page), network
+        )
+    except ValueError as ve:
+        raise JsonRpcInvalidParamsError(str(ve))
     return result.serialize(jsonify_host_item)
 
 
 @dispatch.handler
 async def get_host(host_id: str) -> dict:
-    def jsonify_host(host):
-        return {
-            "host_id": host.host_id,
-            "started": maybe(host.started).isoformat().or_else(None),
-            "completed": maybe(host.completed).isoformat().or_else(None),
-            "state": host.state,
-            "state_reason": host.state_reason,
-            "addresses": [str(addr) for addr in host.addresses],
-            "hostnames": host.hostnames,
-            "cover_image": None,
-            "ports": [jsonify_port(p) for p in host.ports],
-        }
+    host = await HostDb.get_host(dispatch.ctx.db, host_id)
+    return _jsonify_host(host)
 
-    def jsonify_port(port):
-        return {
-            "number": port.number,
-            "transport": port.transport.name,
-            "state": port.state.name,
-            "state_reason": port.state_reason,
-            "service": jsonify_service(port.service),
-        }
 
-    def jsonify_service(service):
-        return {
-            "name": service.name,
-            "product": service.product,
-            "version": service.version,
-            "method": service.method,
-            "confidence": service.confidence,
-            "cpes": service.cpes,
+@dispatch.handler
+async def get_hosts(
+    host_ids: typing.List[str], fields: typing.Optional[typing.List[str]] = None
+) -> list:
+    """
+    Get multiple hosts in one request. The result has one item per host ID, in the
+    same order, and the item is null if the host does not exist.
+
+    If ``fields`` is set, each host only has its ``host_id`` and those fields. At most
+    :data:`MAX_GET_HOSTS` hosts can be requested at once.
+    """
+    if len(host_ids) > MAX_GET_HOSTS:
+        raise JsonRpcInvalidParamsError(
+            f"Cannot get more than {MAX_GET_HOSTS} hosts at once"
+        )
+    for host_id in host_ids:
+        if not bson.ObjectId.is_valid(host_id):
+            raise JsonRpcInvalidParamsError(f"Invalid host ID: {host_id}")
+    if fields is not None:
+        unknown = set(fields) - set(HOST_FIELDS)
+        if unknown:
+            raise JsonRpcInvalidParamsError(
+                f"Unknown host fields: {', '.join(sorted(unknown))}"
+            )
+    hosts = await HostDb.get_hosts(dispatch.ctx.db, host_ids, fields)
+    return [_jsonify_host(host, fields) if host else None for host in hosts]
+
+
+def _jsonify_host(host, fields=None):
+    host_json = {
+        "host_id": host.host_id,
+        "started": maybe(host.started).isoformat().or_else(None),
+        "completed": maybe(host.completed).isoformat().or_else(None),
+        "state": host.state,
+        "state_reason": host.state_reason,
+        "addresses": [str(addr) for addr in host.addresses],
+        "hostnames": host.hostnames,
+        "cover_image": None,
+        "ports": [_jsonify_port(p) for p in host.ports],
+    }
+    if fields is not None:
+        host_json = {
+            key: value
+            for key, value in host_json.items()
+            if key == "host_id" or key in fields
         }
+    return host_json
 
-    host = await HostDb.get_host(dispatch.ctx.db, host_id)
-    return jsonify_host(host)
+
+def _jsonify_port(port):
+    return {
+        "number": port.number,
+        "transport": port.transport.name,
+        "state": port.state.name,
+        "state_reason": port.state_reason,
+        "service": _jsonify_service(port.service),
+    }
+
+
+def _jsonify_service(service):
+    return {
+        "name": service.name,
+        "product": service.product,
+        "version": service.version,
+        "method": service.method,
+        "confidence": service.confidence,
+        "cpes": service.cpes,
+    }
@@ -15,7 +15,6 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from __future__ import annotations
-from base64 import b64decode
 from datetime import datetime
 from dataclasses import dataclass
 from ipaddress import IPv4Address, IPv6Address
@@ -25,11 +24,12 @@ import typing
 from lxml import etree
 from pymaybe import maybe
 import trio
+from trio_jsonrpc import JsonRpcInvalidParamsError
 
 from . import dispatch
 from ..database.scan import ScanDb
+from ..ingest.pipeline import ingest_base64
 from ..model.page import PageRequest, PageResult
-from ..nmap.loader import load_scan
 
 
 logger = logging.getLogger(__name__)
@@ -37,10 +37,41 @@ logger = logging.getLogger(__name__)
 
 @dispatch.handler
 async def upload_scan(base64_data: str) -> dict:
-    data = b64decode(base64_data.encode("utf8"))
-    scan = await trio.to_thread.run_sync(load_scan, data)
-    scan_id = await ScanDb.insert_scan(dispatch.ctx.db, scan)
-    return {"scan_id": scan_id}
+    """
+    Ingest a base64-encoded nmap XML scan.
+
+    The response includes the ingest pipeline's statistics, which show whether parsing
+    or the database was the bottleneck. If uploads are spooled, the scan is ingested in
+    the background, and its ID and statistics are returned by ``get_upload`` instead.
+    """
+    if dispatch.ctx.spool is not None:
+        # Acknowledge the upload once it is on disk: it is ingested in the background.
+        upload_id = await dispatch.ctx.spool.put(base64_data)
+        return {
+            "upload_id": upload_id,
+            "scan_id": None,
+            "duplicate": False,
+            "stats": None,
+        }
+    scan_id, stats = await ingest_base64(
+        dispatch.ctx.db, base64_data, pool=dispatch.ctx.parse_pool
+    )
+    return {
+        "upload_id": None,
+        "scan_id": scan_id,
+        "duplicate": stats.duplicate,
+        "stats": stats.to_json(),
+    }
+
+
+@dispatch.handler
+async def get_upload(upload_id: str) -> dict:
+    status = None
+    if dispatch.ctx.spool is not None:
+        status = await dispatch.ctx.spool.status(upload_id)
+    if status is None:
+        raise JsonRpcInvalidParamsError(f"Upload not found: {upload_id}")
+    return status
 
 
 @dispatch.handler
@@ -54,9 +85,16 @@ async def list_scans(page: dict) -> dict:
             "started": maybe(scan.started).isoformat().or_else(None),
             "completed": maybe(scan.completed).isoformat().or_else(None),
             "host_count": scan.host_count,
+            "hosts_up": scan.hosts_up,
+            "hosts_down": scan.hosts_down,
+            "open_ports": scan.open_ports,
+            "services": scan.services,
         }
 
-    result = await ScanDb.list_scans(dispatch.ctx.db, PageRequest.from_json(page))
+    try:
+        result = await ScanDb.list_scans(dispatch.ctx.db, PageRequest.from_json(page))
+    except ValueError as ve:
+        raise JsonRpcInvalidParamsError(str(ve))
     return result.serialize(jsonify_scan)
 
 
@@ -0,0 +1,97 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from ipaddress import ip_address
+
+import pytest
+
+from darkwing.database.address import (
+    address_key,
+    key_address,
+    network_query,
+    network_range,
+)
+
+
+ADDRESSES = [
+    "0.0.0.0",
+    "10.19.255.255",
+    "10.20.0.0",
+    "10.20.7.9",
+    "10.20.255.255",
+    "10.21.0.0",
+    "255.255.255.255",
+    "::1",
+    "2001:db8::1",
+    "2001:db8:ffff::",
+    "fe80::1",
+]
+
+
+@pytest.mark.parametrize("address", ADDRESSES)
+def test_address_key_round_trip(address):
+    key = address_key(address)
+    assert len(key) == 16
+    assert key_address(key) == ip_address(address)
+
+
+def test_address_key_accepts_address_objects():
+    assert address_key(ip_address("10.20.7.9")) == address_key("10.20.7.9")
+
+
+def test_ipv4_keys_are_ipv4_mapped():
+    assert address_key("10.20.7.9") == address_key("::ffff:10.20.7.9")
+
+
+def test_address_keys_sort_like_addresses():
+    """ Byte order of the keys must match numeric order within each family. """
+    ipv4 = [a for a in ADDRESSES if "." in a]
+    ipv6 = [a for a in ADDRESSES if "." not in a]
+    for family in (ipv4, ipv6):
+        keys = [address_key(a) for a in family]
+        assert keys == sorted(keys)
+
+
+def test_network_range_ipv4():
+    low, high = network_range("10.20.0.0/16")
+    inside = [address_key(a) for a in ("10.20.0.0", "10.20.7.9", "10.20.255.255")]
+    outside = [address_key(a) for a in ("10.19.255.255", "10.21.0.0", "fe80::1")]
+    assert all(low <= key <= high for key in inside)
+    assert not any(low <= key <= high for key in outside)
+
+
+def test_network_range_ipv6():
+    low, high = network_range("2001:db8::/32")
+    assert low <= address_key("2001:db8::1") <= high
+    assert low <= address_key("2001:db8:ffff::") <= high
+    assert not low <= address_key("::ffff:10.20.7.9") <= high
+    assert not low <= address_key("fe80::1") <= high
+
+
+def test_network_range_host_bits_set():
+    assert network_range("10.20.7.9/16") == network_range("10.20.0.0/16")
+
+
+def test_network_range_invalid():
+    with pytest.raises(ValueError):
+        network_range("10.20.0.0/33")
+
+
+def test_network_query():
+    low, high = network_range("10.20.0.0/16")
+    assert network_query("10.20.0.0/16") == {
+        "address_keys": {"$elemMatch": {"$gte": low, "$lte": high}}
+    }
@@ -0,0 +1,110 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import pytest
+
+from darkwing.database.counts import CountCache
+
+
+class FakeCollection:
+    def __init__(self, name, count):
+        self.name = name
+        self.count = count
+        self.counted = 0
+        self.estimated = 0
+
+    async def count_documents(self, query):
+        self.counted += 1
+        return self.count
+
+    async def estimated_document_count(self):
+        self.estimated += 1
+        return self.count
+
+
+@pytest.mark.trio
+async def test_count_is_cached():
+    cache = CountCache()
+    host = FakeCollection("host", 10)
+    assert await cache.count(host, {}) == 10
+    host.count = 11
+    assert await cache.count(host, {}) == 10
+    assert host.counted == 1
+    assert await cache.count(host, {"addresses": "10.0.0.1"}) == 11
+    assert host.counted == 2
+
+
+@pytest.mark.trio
+async def test_count_expires():
+    cache = CountCache(ttl=0)
+    host = FakeCollection("host", 10)
+    await cache.count(host, {})
+    host.count = 11
+    assert await cache.count(host, {}) == 11
+    assert host.counted == 2
+
+
+@pytest.mark.trio
+async def test_add_updates_unfiltered_count():
+    cache = CountCache()
+    host = FakeCollection("host", 10)
+    scan = FakeCollection("scan", 2)
+    await cache.count(host, {})
+    await cache.count(host, {"addresses": "10.0.0.1"})
+    await cache.count(scan, {})
+    cache.add("host", 5)
+    cache.add("host", -2)
+    assert await cache.count(host, {}) == 13
+    assert host.counted == 2
+    # Filtered counts can't be adjusted, so they are counted again.
+    await cache.count(host, {"addresses": "10.0.0.1"})
+    assert host.counted == 3
+    assert await cache.count(scan, {}) == 2
+    assert scan.counted == 1
+    cache.invalidate("host")
+    await cache.count(host, {})
+    assert host.counted == 4
+
+
+@pytest.mark.trio
+async def test_estimated_count():
+    cache = CountCache(estimated=True)
+    host = FakeCollection("host", 10)
+    await cache.count(host, {})
+    await cache.count(host, {"addresses": "10.0.0.1"})
+    assert host.estimated == 1
+    assert host.counted == 1
+
+
+@pytest.mark.trio
+async def test_cache_size_is_bounded(monkeypatch):
+    now = 0.0
+    monkeypatch.setattr("darkwing.database.counts.time.monotonic", lambda: now)
+    cache = CountCache(ttl=60, max_size=3)
+    host = FakeCollection("host", 10)
+    for i in range(5):
+        await cache.count(host, {"addresses": f"10.0.0.{i}"})
+    assert len(cache._counts) == 3
+    # The oldest counts were dropped, and the newest are still cached.
+    await cache.count(host, {"addresses": "10.0.0.4"})
+    assert host.counted == 5
+    await cache.count(host, {"addresses": "10.0.0.0"})
+    assert host.counted == 6
+
+    # Expired counts are dropped when another count is fetched.
+    now = 61.0
+    await cache.count(host, {})
+    assert list(cache._counts.values()) == [(10, 61.0)]
@@ -0,0 +1,226 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from types import SimpleNamespace
+
+import bson
+import pytest
+import trio_asyncio
+
+from darkwing.database.address import address_key, network_range
+from darkwing.database.host import (
+    MAX_GET_HOSTS,
+    Host,
+    HostDb,
+    HostSummary,
+    host_summary,
+    hosts_summary,
+)
+
+
+def port(state, service=None):
+    return {"number": 1, "state": state, "service": {"name": service}}
+
+
+def test_host_summary():
+    ports = [
+        port("OPEN", "http"),
+        port("OPEN", "ssh"),
+        port("OPEN", "http"),
+        port("OPEN", None),
+        port("FILTERED", "telnet"),
+        port("CLOSED"),
+        port(None),
+    ]
+    summary = host_summary(ports)
+    assert summary == {
+        "open_ports": 4,
+        "closed_ports": 1,
+        "filtered_ports": 1,
+        "services": ["http", "ssh"],
+    }
+    assert HostSummary.from_db(summary).services == ["http", "ssh"]
+
+
+def test_host_summary_top_services():
+    ports = [port("OPEN", f"svc{i}") for i in range(10)] + [port("OPEN", "svc9")]
+    assert host_summary(ports)["services"] == ["svc9", "svc0", "svc1", "svc2", "svc3"]
+    assert host_summary([])["services"] == []
+
+
+def test_hosts_summary_includes_all_services():
+    # A host with more services than its own summary lists.
+    names = ["ssh", "http", "https", "smtp", "domain", "ldap", "ms-sql-s"]
+    ports = [port("OPEN", name) for name in names]
+    ports += [port("CLOSED", "discard"), port("OPEN", None)]
+    assert len(host_summary(ports)["services"]) < len(names)
+    docs = [
+        {"state": "UP", "ports": ports},
+        {"state": "DOWN", "ports": []},
+        {"state": "UP", "ports": [port("OPEN", "ssh"), port("FILTERED", "x11")]},
+    ]
+    assert hosts_summary(docs) == {
+        "hosts_up": 2,
+        "hosts_down": 1,
+        "open_ports": len(names) + 2,
+        "services": sorted(names),
+    }
+
+
+def test_host_from_projection():
+    # get_hosts() can leave fields out, e.g. the ports.
+    doc = {"_id": bson.ObjectId(), "addresses": ["10.0.0.1"], "hostnames": ["a"]}
+    host = Host.from_db(doc)
+    assert host.host_id == str(doc["_id"])
+    assert [str(a) for a in host.addresses] == ["10.0.0.1"]
+    assert host.ports == []
+    assert host.state is None
+
+
+class FakeHostCollection:
+    """ Serves find() queries by ID and records their arguments. """
+
+    def __init__(self, docs):
+        self.docs = {doc["_id"]: doc for doc in docs}
+        self.queries = list()
+
+    def find(self, query, projection=None):
+        self.queries.append((query, projection))
+        return self._cursor(query["_id"]["$in"], projection)
+
+    async def _cursor(self, ids, projection):
+        for id_ in ids:
+            doc = self.docs.get(id_)
+            if doc is None:
+                continue
+            if projection is not None:
+                doc = {
+                    key: value
+                    for key, value in doc.items()
+                    if key == "_id" or projection.get(key)
+                }
+            yield doc
+
+
+def fake_host_db(count):
+    docs = [
+        {
+            "_id": bson.ObjectId(),
+            "state": "UP",
+            "addresses": [f"10.0.0.{i}"],
+            "hostnames": [f"host{i}"],
+        }
+        for i in range(count)
+    ]
+    return SimpleNamespace(darkwing=SimpleNamespace(host=FakeHostCollection(docs)))
+
+
+@pytest.mark.trio
+async def test_get_hosts():
+    db = fake_host_db(3)
+    ids = [str(id_) for id_ in db.darkwing.host.docs]
+    missing = str(bson.ObjectId())
+    request = [ids[2], missing, ids[0], ids[2], ids[1]]
+    async with trio_asyncio.open_loop():
+        hosts = await HostDb.get_hosts(db, request)
+
+    # The hosts are in request order, with None for the missing ID.
+    assert [maybe_host and maybe_host.host_id for maybe_host in hosts] == [
+        ids[2],
+        None,
+        ids[0],
+        ids[2],
+        ids[1],
+    ]
+    assert hosts[0].hostnames == ["host2"]
+    assert hosts[0] == hosts[3]
+
+    # Duplicate IDs are only queried once.
+    ((query, projection),) = db.darkwing.host.queries
+    assert sorted(query["_id"]["$in"]) == sorted(
+        {bson.ObjectId(id_) for id_ in request}
+    )
+    assert projection is None
+
+
+@pytest.mark.trio
+async def test_get_hosts_projection():
+    db = fake_host_db(2)
+    ids = [str(id_) for id_ in db.darkwing.host.docs]
+    async with trio_asyncio.open_loop():
+        hosts = await HostDb.get_hosts(db, ids, ["hostnames"])
+
+    ((_, projection),) = db.darkwing.host.queries
+    assert projection == {"hostnames": True}
+    assert [host.hostnames for host in hosts] == [["host0"], ["host1"]]
+    assert all(host.addresses == [] and host.state is None for host in hosts)
+
+
+@pytest.mark.trio
+async def test_get_hosts_limit():
+    db = fake_host_db(0)
+    ids = [str(bson.ObjectId()) for _ in range(MAX_GET_HOSTS + 1)]
+    async with trio_asyncio.open_loop():
+        assert await HostDb.get_hosts(db, ids[:MAX_GET_HOSTS]) == [None] * MAX_GET_HOSTS
+        with pytest.raises(ValueError, match="more than"):
+            await HostDb.get_hosts(db, ids)
+    assert len(db.darkwing.host.queries) == 1
+
+
+class FakeBackfillCollection:
+    """ Serves a find() for hosts without address keys and records bulk writes. """
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.writes = list()
+
+    def find(self, query, projection=None):
+        assert query == {"address_keys": {"$exists": False}}
+        return self._cursor()
+
+    async def _cursor(self):
+        for doc in self.docs:
+            if "address_keys" not in doc:
+                yield doc
+
+    async def bulk_write(self, requests, ordered=True):
+        self.writes.append(requests)
+        for request in requests:
+            doc = next(d for d in self.docs if d["_id"] == request._filter["_id"])
+            doc.update(request._doc["$set"])
+
+
+@pytest.mark.trio
+async def test_backfill_address_keys():
+    docs = [
+        {"_id": bson.ObjectId(), "addresses": [f"10.0.0.{i}"]} for i in range(5)
+    ] + [
+        {"_id": bson.ObjectId(), "addresses": ["::1"], "address_keys": ["done"]},
+        {"_id": bson.ObjectId()},
+    ]
+    coll = FakeBackfillCollection(docs)
+    db = SimpleNamespace(darkwing=SimpleNamespace(host=coll))
+    async with trio_asyncio.open_loop():
+        assert await HostDb.backfill_address_keys(db, batch_size=2) == 6
+        assert await HostDb.backfill_address_keys(db) == 0
+
+    assert [len(requests) for requests in coll.writes] == [2, 2, 2]
+    assert docs[0]["address_keys"] == [address_key("10.0.0.0")]
+    assert docs[5]["address_keys"] == ["done"]
+    assert docs[6]["address_keys"] == []
+    # The backfilled hosts now match a network filter.
+    low, high = network_range("10.0.0.0/30")
+    assert sum(low <= doc["address_keys"][0] <= high for doc in docs[:5]) == 4
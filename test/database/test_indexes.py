@@ -0,0 +1,35 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import pymongo
+
+from darkwing.database.indexes import INDEXES, IndexSpec
+
+
+def test_index_name_matches_mongodb_default():
+    spec = IndexSpec("host", (("ports.number", pymongo.ASCENDING), ("ports.state", -1)))
+    assert spec.name == "ports.number_1_ports.state_-1"
+    assert spec.to_model().document["name"] == spec.name
+
+
+def test_index_registry():
+    names = [(spec.collection, spec.name) for spec in INDEXES]
+    assert len(names) == len(set(names))
+    indexed = {(spec.collection, spec.keys[0][0]) for spec in INDEXES}
+    for field in ("started", "completed", "hosts", "content_hash"):
+        assert ("scan", field) in indexed
+    for field in ("address_keys", "addresses", "hostnames", "ports.number"):
+        assert ("host", field) in indexed
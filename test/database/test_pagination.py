@@ -0,0 +1,76 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import bson
+import pytest
+
+from darkwing.database.host import HOST_SORT_FIELDS
+from darkwing.database.pagination import encode_token, keyset_query, sort_spec
+
+
+ID = bson.ObjectId("5f5b6e9c8a1e4c3d2b1a0f9e")
+
+
+def test_sort_spec():
+    assert sort_spec(HOST_SORT_FIELDS, "open_ports", False) == [
+        ("summary.open_ports", -1),
+        ("_id", -1),
+    ]
+    assert sort_spec(HOST_SORT_FIELDS, "todo", True) == [("_id", 1)]
+
+
+def test_keyset_query():
+    sort = sort_spec(HOST_SORT_FIELDS, "open_ports", True)
+    token = encode_token(sort, {"_id": ID, "summary": {"open_ports": 3}})
+    assert keyset_query(sort, token) == {
+        "$or": [
+            {"summary.open_ports": 3, "_id": {"$gt": ID}},
+            {"summary.open_ports": {"$gt": 3}},
+        ]
+    }
+
+    sort = sort_spec(HOST_SORT_FIELDS, "todo", False)
+    token = encode_token(sort, {"_id": ID})
+    assert keyset_query(sort, token) == {"_id": {"$lt": ID}}
+
+
+def test_keyset_query_null():
+    # Nulls and missing fields sort first, so they come last in descending order.
+    sort = sort_spec(HOST_SORT_FIELDS, "open_ports", False)
+    token = encode_token(sort, {"_id": ID, "summary": {"open_ports": 3}})
+    assert {"summary.open_ports": None} in keyset_query(sort, token)["$or"]
+    token = encode_token(sort, {"_id": ID})
+    assert keyset_query(sort, token) == {"summary.open_ports": None, "_id": {"$lt": ID}}
+
+    sort = sort_spec(HOST_SORT_FIELDS, "open_ports", True)
+    token = encode_token(sort, {"_id": ID})
+    assert keyset_query(sort, token) == {
+        "$or": [
+            {"summary.open_ports": None, "_id": {"$gt": ID}},
+            {"summary.open_ports": {"$ne": None}},
+        ]
+    }
+
+
+def test_invalid_token():
+    sort = sort_spec(HOST_SORT_FIELDS, "started", True)
+    token = encode_token(sort, {"_id": ID})
+    with pytest.raises(ValueError):
+        keyset_query(sort_spec(HOST_SORT_FIELDS, "started", False), token)
+    with pytest.raises(ValueError):
+        keyset_query(sort, "not a token")
+    with pytest.raises(ValueError):
+        keyset_query(sort, token[:10])
@@ -0,0 +1,121 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+
+import bson
+import pytest
+import trio_asyncio
+
+from darkwing.database.host import hosts_summary
+from darkwing.database.scan import ScanDb, _add_hosts_update, _host_to_dict
+from darkwing.model.scan import HostScan, ScanProgress
+from darkwing.nmap.documents import host_document
+from darkwing.nmap.loader import convert_host
+from darkwing.nmap.parser import Host, NmapXmlParser
+
+
+FIXTURE_PATH = Path(__file__).absolute().parent.parent / "nmap" / "test-scan.xml"
+
+
+def fixture_hosts():
+    parser = NmapXmlParser()
+    parser.feed(FIXTURE_PATH.read_bytes())
+    return [e for e in parser.events() if isinstance(e, Host)]
+
+
+def test_add_hosts_update():
+    docs = [host_document(event) for event in fixture_hosts()]
+    host_ids = [bson.ObjectId() for _ in docs]
+    summary = hosts_summary(docs)
+    update = _add_hosts_update(host_ids, summary)
+    assert update["$push"]["hosts"]["$each"] == host_ids
+    assert update["$inc"] == {
+        "summary.host_count": 27,
+        "summary.hosts_up": 27,
+        "summary.hosts_down": 0,
+        "summary.open_ports": 13,
+    }
+    services = update["$addToSet"]["summary.services"]["$each"]
+    assert services == sorted(set(services))
+    assert {"ssh", "http", "domain"} <= set(services)
+    top_services = set()
+    for doc in docs:
+        top_services.update(doc["summary"]["services"])
+    assert top_services <= set(services)
+
+    # The model path produces the same summary.
+    dict_docs = [_host_to_dict(convert_host(event)) for event in fixture_hosts()]
+    assert hosts_summary(dict_docs) == summary
+
+
+class FakeCollection:
+    """ Records the writes that ScanDb makes. """
+
+    def __init__(self):
+        self.docs = list()
+        self.updates = list()
+
+    async def insert_one(self, doc):
+        doc["_id"] = bson.ObjectId()
+        self.docs.append(doc)
+        return SimpleNamespace(inserted_id=doc["_id"])
+
+    async def insert_many(self, docs):
+        for doc in docs:
+            doc.setdefault("_id", bson.ObjectId())
+        self.docs.extend(docs)
+
+    async def update_one(self, query, update):
+        self.updates.append((query, update))
+
+
+@pytest.mark.trio
+async def test_incremental_scan():
+    """ The methods that follow mode uses to build a scan while it is running. """
+    db = SimpleNamespace(
+        darkwing=SimpleNamespace(scan=FakeCollection(), host=FakeCollection())
+    )
+    scan_coll, host_coll = db.darkwing.scan, db.darkwing.host
+    scan = HostScan("nmap", "7.80", started=datetime(2020, 4, 21, 14, 35, 12))
+    async with trio_asyncio.open_loop():
+        scan_id = await ScanDb.start_scan(db, scan)
+        assert scan_coll.docs[0]["hosts"] == []
+        assert scan_coll.docs[0]["completed"] is None
+
+        docs = [host_document(event) for event in fixture_hosts()[:3]]
+        host_ids = await ScanDb.insert_host_documents(db, scan_id, docs)
+        assert host_ids == [doc["_id"] for doc in host_coll.docs]
+        query, update = scan_coll.updates[-1]
+        assert query == {"_id": bson.ObjectId(scan_id)}
+        assert update["$push"]["hosts"]["$each"] == host_ids
+
+        progress = ScanProgress("SYN Stealth Scan", datetime(2020, 4, 21, 14, 40), 50.0)
+        await ScanDb.update_progress(db, scan_id, progress)
+        _, update = scan_coll.updates[-1]
+        assert update["$set"]["progress"]["percent"] == 50.0
+
+        await ScanDb.abandon_scan(db, scan_id)
+        _, update = scan_coll.updates[-1]
+        assert update == {"$set": {"incomplete": True}, "$unset": {"progress": ""}}
+
+        completed = datetime(2020, 4, 21, 14, 58, 7)
+        await ScanDb.finish_scan(db, scan_id, completed)
+        _, update = scan_coll.updates[-1]
+        assert update["$set"] == {"completed": completed}
+        assert "progress" in update["$unset"]
@@ -0,0 +1,145 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import bson
+import pytest
+
+from darkwing.database.host import hosts_summary
+from darkwing.database.scan import Checkpoint, DuplicateScanError, ScanDb
+from darkwing.ingest.workers import ParsePool
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    """ Replace the ScanDb methods used for ingest with in-memory fakes. """
+    db = {"scans": {}, "hosts": []}
+
+    async def start_scan(_db, scan, source=None):
+        for scan_id, existing in db["scans"].items():
+            if source and existing["source"] == source:
+                raise DuplicateScanError(scan_id)
+        scan_id = str(bson.ObjectId())
+        db["scans"][scan_id] = {
+            "scan": scan,
+            "completed": None,
+            "hosts": [],
+            "summary": {
+                "hosts_up": 0,
+                "hosts_down": 0,
+                "open_ports": 0,
+                "services": set(),
+            },
+            "content_hash": None,
+            "source": source,
+            "checkpoint": {"offset": 0, "hosts": 0, "staged": []} if source else None,
+        }
+        return scan_id
+
+    async def find_scan_by_source(_db, source):
+        for scan_id, scan in db["scans"].items():
+            if scan["source"] == source and scan["checkpoint"] is None:
+                return scan_id
+        return None
+
+    async def find_scan_by_hash(_db, content_hash):
+        for scan_id, scan in db["scans"].items():
+            if scan["content_hash"] == content_hash:
+                return scan_id
+        return None
+
+    async def resume_checkpoint(_db, source):
+        for scan_id, scan in db["scans"].items():
+            checkpoint = scan["checkpoint"]
+            if scan["source"] == source and checkpoint is not None:
+                staged = set(checkpoint["staged"])
+                db["hosts"] = [doc for doc in db["hosts"] if doc["_id"] not in staged]
+                checkpoint["staged"] = []
+                return Checkpoint(scan_id, checkpoint["offset"], checkpoint["hosts"])
+        return None
+
+    async def stage_host_documents(_db, scan_id, docs, host_ids):
+        assert host_ids == [doc["_id"] for doc in docs]
+        db["scans"][scan_id]["checkpoint"]["staged"].extend(host_ids)
+        db["hosts"].extend(docs)
+
+    def add_summary(scan, summary):
+        for key in ("hosts_up", "hosts_down", "open_ports"):
+            scan["summary"][key] += summary[key]
+        scan["summary"]["services"].update(summary["services"])
+
+    async def commit_checkpoint(_db, scan_id, host_ids, summary, offset):
+        scan = db["scans"][scan_id]
+        assert set(host_ids) <= set(scan["checkpoint"]["staged"])
+        scan["hosts"].extend(host_ids)
+        add_summary(scan, summary)
+        scan["checkpoint"]["offset"] = offset
+        scan["checkpoint"]["hosts"] += len(host_ids)
+        scan["checkpoint"]["staged"] = []
+
+    async def insert_host_documents(_db, scan_id, docs, host_ids=None, summary=None):
+        for doc in docs:
+            # Like the driver, add an ID to plain dicts that don't have one.
+            if isinstance(doc, dict):
+                doc.setdefault("_id", bson.ObjectId())
+        if host_ids is None:
+            host_ids = [doc["_id"] for doc in docs]
+        assert host_ids == [doc["_id"] for doc in docs]
+        db["hosts"].extend(docs)
+        db["scans"][scan_id]["hosts"].extend(host_ids)
+        add_summary(db["scans"][scan_id], summary or hosts_summary(docs))
+
+    async def update_progress(_db, scan_id, progress):
+        db["scans"][scan_id]["progress"] = progress
+
+    async def finish_scan(_db, scan_id, completed, content_hash=None):
+        for other_id, other in db["scans"].items():
+            if content_hash and other["content_hash"] == content_hash:
+                raise DuplicateScanError(other_id)
+        db["scans"][scan_id]["content_hash"] = content_hash
+        db["scans"][scan_id]["completed"] = completed
+        db["scans"][scan_id]["checkpoint"] = None
+        db["scans"][scan_id].pop("progress", None)
+
+    async def delete_scan(_db, scan_id, host_ids=()):
+        scan = db["scans"].pop(scan_id)
+        ids = set(host_ids) | set(scan["hosts"])
+        if scan["checkpoint"]:
+            ids.update(scan["checkpoint"]["staged"])
+        db["hosts"] = [doc for doc in db["hosts"] if doc["_id"] not in ids]
+
+    async def abandon_scan(_db, scan_id):
+        db["scans"][scan_id]["incomplete"] = True
+        db["scans"][scan_id].pop("progress", None)
+
+    monkeypatch.setattr(ScanDb, "start_scan", start_scan)
+    monkeypatch.setattr(ScanDb, "find_scan_by_source", find_scan_by_source)
+    monkeypatch.setattr(ScanDb, "find_scan_by_hash", find_scan_by_hash)
+    monkeypatch.setattr(ScanDb, "resume_checkpoint", resume_checkpoint)
+    monkeypatch.setattr(ScanDb, "stage_host_documents", stage_host_documents)
+    monkeypatch.setattr(ScanDb, "commit_checkpoint", commit_checkpoint)
+    monkeypatch.setattr(ScanDb, "insert_host_documents", insert_host_documents)
+    monkeypatch.setattr(ScanDb, "update_progress", update_progress)
+    monkeypatch.setattr(ScanDb, "finish_scan", finish_scan)
+    monkeypatch.setattr(ScanDb, "abandon_scan", abandon_scan)
+    monkeypatch.setattr(ScanDb, "delete_scan", delete_scan)
+    return db
+
+
+@pytest.fixture
+def parse_pool():
+    pool = ParsePool(2)
+    yield pool
+    pool.shutdown()
@@ -0,0 +1,162 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import gzip
+import io
+from pathlib import Path
+import tarfile
+
+import pytest
+
+from darkwing.database.scan import ScanDb
+from darkwing.ingest import archive, pipeline
+from darkwing.ingest.archive import import_scans, iter_sources
+from darkwing.ingest.workers import encode_range
+
+
+FIXTURE_PATH = Path(__file__).absolute().parent.parent / "nmap" / "test-scan.xml"
+
+
+@pytest.fixture
+def scan_dir(tmp_path):
+    """ A directory with a few scans, a compressed scan, and unrelated files. """
+    data = FIXTURE_PATH.read_bytes()
+    (tmp_path / "2019").mkdir()
+    (tmp_path / "2019" / "a.xml").write_bytes(data)
+    (tmp_path / "2019" / "b.xml.gz").write_bytes(gzip.compress(data))
+    (tmp_path / "2019" / "notes.txt").write_text("not a scan")
+    (tmp_path / "2020").mkdir()
+    (tmp_path / "2020" / "c.xml").write_bytes(data)
+    return tmp_path
+
+
+def make_tar(path, members):
+    with tarfile.open(path, "w:gz") as archive:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+
+
+def test_iter_sources_directory(scan_dir):
+    names = [name for name, _ in iter_sources([str(scan_dir)])]
+    assert names == [
+        str(scan_dir / "2019" / "a.xml"),
+        str(scan_dir / "2019" / "b.xml.gz"),
+        str(scan_dir / "2020" / "c.xml"),
+    ]
+
+
+def test_iter_sources_glob(scan_dir):
+    names = [name for name, _ in iter_sources([str(scan_dir / "*" / "*.xml")])]
+    assert names == [str(scan_dir / "2019" / "a.xml"), str(scan_dir / "2020" / "c.xml")]
+
+
+def test_iter_sources_tar(tmp_path):
+    data = FIXTURE_PATH.read_bytes()
+    archive = tmp_path / "scans.tar.gz"
+    make_tar(
+        archive,
+        {"x/one.xml": data, "x/two.xml.gz": gzip.compress(data), "README": b"hi"},
+    )
+    sources = list(iter_sources([str(archive)]))
+    assert [name for name, _ in sources] == [
+        f"{archive}:x/one.xml",
+        f"{archive}:x/two.xml.gz",
+    ]
+    assert all(isinstance(source, bytes) for _, source in sources)
+
+
+def test_iter_sources_missing(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        list(iter_sources([str(tmp_path / "missing.xml")]))
+
+
+@pytest.mark.trio
+@pytest.mark.parametrize("use_pool", [False, True])
+async def test_import_scans(scan_dir, fake_db, parse_pool, use_pool):
+    (scan_dir / "2020" / "broken.xml").write_bytes(b"<nmaprun")
+    stats = await import_scans(
+        None, [str(scan_dir)], parse_pool if use_pool else None, batch_size=10
+    )
+    assert stats.files == 3
+    assert stats.failed == 1
+    assert stats.hosts == 81
+    assert len(fake_db["scans"]) == 3
+    assert len(fake_db["hosts"]) == 81
+    for scan in fake_db["scans"].values():
+        assert len(scan["hosts"]) == 27
+        assert scan["completed"] is not None
+
+
+@pytest.mark.trio
+async def test_import_scans_missing_file(scan_dir, fake_db, monkeypatch):
+    """ A file that disappears after it was found is counted as failed. """
+    sources = list(iter_sources([str(scan_dir)]))
+    (scan_dir / "2019" / "a.xml").unlink()
+    monkeypatch.setattr(archive, "iter_sources", lambda paths: iter(sources))
+    stats = await import_scans(None, [str(scan_dir)], batch_size=10)
+    assert stats.files == 2
+    assert stats.failed == 1
+
+
+@pytest.mark.trio
+async def test_import_scans_resumes(tmp_path, fake_db, monkeypatch):
+    """ An interrupted import should resume from its last checkpoint. """
+    (tmp_path / "scan.xml").write_bytes(FIXTURE_PATH.read_bytes())
+    commit_checkpoint = ScanDb.commit_checkpoint
+    commits = 0
+
+    async def crashing_commit_checkpoint(db, scan_id, host_ids, summary, offset):
+        # Stage the third piece's hosts but crash before committing them.
+        nonlocal commits
+        commits += 1
+        if commits == 3:
+            raise Exception("Simulated crash")
+        await commit_checkpoint(db, scan_id, host_ids, summary, offset)
+
+    monkeypatch.setattr(ScanDb, "commit_checkpoint", crashing_commit_checkpoint)
+    stats = await import_scans(None, [str(tmp_path)], piece_size=5000)
+    assert stats.failed == 1
+    (scan,) = fake_db["scans"].values()
+    committed = len(scan["hosts"])
+    assert scan["checkpoint"]["hosts"] == committed
+    assert len(fake_db["hosts"]) > committed
+
+    parsed = list()
+
+    def counting_encode_range(header, data):
+        parsed.append(data)
+        return encode_range(header, data)
+
+    monkeypatch.setattr(pipeline, "encode_range", counting_encode_range)
+    stats = await import_scans(None, [str(tmp_path)], piece_size=5000)
+    assert stats.files == 1
+    assert stats.hosts == 27 - committed
+    assert len(parsed) == 8
+    (scan,) = fake_db["scans"].values()
+    assert scan["checkpoint"] is None
+    assert scan["completed"] is not None
+    assert len(scan["hosts"]) == len(set(scan["hosts"])) == 27
+    assert [doc["_id"] for doc in fake_db["hosts"]] == scan["hosts"]
+    # Each host was counted in the scan's summary once.
+    assert scan["summary"]["hosts_up"] == 27
+    assert scan["summary"]["open_ports"] == 13
+
+    stats = await import_scans(None, [str(tmp_path)], piece_size=5000)
+    assert stats.files == 0
+    assert stats.skipped == 1
+    assert len(parsed) == 8
@@ -0,0 +1,86 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+import trio
+
+from darkwing.ingest.follow import follow_scan
+
+
+FIXTURE_PATH = Path(__file__).absolute().parent.parent / "nmap" / "test-scan.xml"
+
+
+async def grow_file(path, data, pieces, delay=1.0):
+    """ Write ``data`` to a file in ``pieces`` equal parts, ``delay`` seconds apart. """
+    size = -(-len(data) // pieces)
+    with path.open("wb") as file:
+        for offset in range(0, len(data), size):
+            file.write(data[offset : offset + size])
+            file.flush()
+            await trio.sleep(delay)
+
+
+@pytest.mark.trio
+async def test_follow_scan(fake_db, tmp_path, autojump_clock):
+    data = FIXTURE_PATH.read_bytes()
+    path = tmp_path / "scan.xml"
+    async with trio.open_nursery() as nursery:
+
+        async def write_later():
+            # The file does not exist yet when following starts.
+            await trio.sleep(3)
+            await grow_file(path, data, pieces=10)
+
+        nursery.start_soon(write_later)
+        scan_id = await follow_scan(None, trio.Path(path), poll_interval=0.5)
+
+    scan = fake_db["scans"][scan_id]
+    assert scan["scan"].scanner_version == "7.80"
+    assert scan["completed"] == datetime(2020, 4, 21, 14, 58, 7)
+    assert len(scan["hosts"]) == len(fake_db["hosts"]) == 27
+    assert "incomplete" not in scan
+
+
+@pytest.mark.trio
+async def test_follow_scan_idle_timeout(fake_db, tmp_path, autojump_clock):
+    """ If nmap dies before writing <finished>, the scan is marked incomplete. """
+    data = FIXTURE_PATH.read_bytes()
+    data = data[: data.index(b"</host>", len(data) // 2) + len(b"</host>")]
+    path = tmp_path / "scan.xml"
+    start = trio.current_time()
+    async with trio.open_nursery() as nursery:
+        nursery.start_soon(grow_file, path, data, 5)
+        await trio.sleep(0)
+        scan_id = await follow_scan(
+            None, trio.Path(path), poll_interval=1, idle_timeout=30
+        )
+
+    scan = fake_db["scans"][scan_id]
+    assert scan["incomplete"]
+    assert scan["completed"] is None
+    assert 0 < len(scan["hosts"]) < 27
+    # The timeout counts from the last new data, not from the start.
+    assert trio.current_time() - start >= 30 + 4
+
+
+@pytest.mark.trio
+async def test_follow_scan_never_created(fake_db, tmp_path, autojump_clock):
+    path = trio.Path(tmp_path / "scan.xml")
+    assert await follow_scan(None, path, idle_timeout=10) is None
+    assert fake_db["scans"] == {}
@@ -0,0 +1,225 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from base64 import b64encode
+from datetime import datetime
+from pathlib import Path
+
+import bson
+import pytest
+import trio
+
+from darkwing.database.host import hosts_summary
+from darkwing.database.scan import ScanDb
+from darkwing.ingest.pipeline import (
+    base64_chunks,
+    content_hash,
+    ingest_base64,
+    run_pipeline,
+    run_pool_pipeline,
+)
+from darkwing.nmap.documents import host_document
+from darkwing.nmap.parser import Host, NmapXmlParseException, NmapXmlParser
+
+
+FIXTURE_PATH = Path(__file__).absolute().parent.parent / "nmap" / "test-scan.xml"
+
+
+def expected_documents():
+    parser = NmapXmlParser()
+    parser.feed(FIXTURE_PATH.read_bytes())
+    return [host_document(e) for e in parser.events() if isinstance(e, Host)]
+
+
+def expected_summary():
+    summary = hosts_summary(expected_documents())
+    summary["services"] = set(summary["services"])
+    return summary
+
+
+def test_base64_chunks():
+    data = bytes(range(256)) * 40
+    encoded = b64encode(data).decode("ascii")
+    chunks = list(base64_chunks(encoded, chunk_size=1000))
+    assert len(chunks) == 11
+    assert all(len(c) == 999 for c in chunks[:-1])
+    assert b"".join(chunks) == data
+
+    wrapped = "\n".join(encoded[i : i + 76] for i in range(0, len(encoded), 76))
+    assert b"".join(base64_chunks(wrapped, chunk_size=1000)) == data
+
+
+@pytest.mark.trio
+async def test_ingest_base64(fake_db):
+    encoded = b64encode(FIXTURE_PATH.read_bytes()).decode("ascii")
+    scan_id, stats = await ingest_base64(
+        None, encoded, batch_size=4, queue_size=1, chunk_size=4096
+    )
+    scan = fake_db["scans"][scan_id]
+    assert scan["scan"].scanner_version == "7.80"
+    assert scan["completed"] == datetime(2020, 4, 21, 14, 58, 7)
+    assert scan["hosts"] == [doc["_id"] for doc in fake_db["hosts"]]
+    assert scan["summary"] == expected_summary()
+
+    expected = expected_documents()
+    assert len(fake_db["hosts"]) == len(expected) == 27
+    for raw, doc in zip(fake_db["hosts"], expected):
+        doc["_id"] = raw["_id"]
+        assert raw.raw == bson.encode(doc)
+
+    assert stats.parse.items == stats.convert.items == stats.write.items == 27
+    assert stats.convert.sends == 7
+    assert stats.convert.queue_max <= 1
+    assert stats.to_json()["stages"]["write"]["items"] == 27
+
+
+@pytest.mark.trio
+async def test_pool_pipeline(fake_db, parse_pool):
+    scan_id, stats = await run_pool_pipeline(
+        None, FIXTURE_PATH.read_bytes(), parse_pool, queue_size=1, piece_size=8192
+    )
+    scan = fake_db["scans"][scan_id]
+    assert scan["completed"] == datetime(2020, 4, 21, 14, 58, 7)
+    assert scan["hosts"] == [doc["_id"] for doc in fake_db["hosts"]]
+    assert scan["summary"] == expected_summary()
+
+    expected = expected_documents()
+    assert len(fake_db["hosts"]) == len(expected)
+    for raw, doc in zip(fake_db["hosts"], expected):
+        doc["_id"] = raw["_id"]
+        assert raw.raw == bson.encode(doc)
+
+    assert stats.parse.items == stats.write.items == 27
+    assert stats.parse.sends > 1
+
+
+@pytest.mark.trio
+async def test_ingest_base64_with_pool(fake_db, parse_pool):
+    encoded = b64encode(FIXTURE_PATH.read_bytes()).decode("ascii")
+    scan_id, stats = await ingest_base64(None, encoded, pool=parse_pool)
+    assert len(fake_db["scans"][scan_id]["hosts"]) == 27
+
+
+@pytest.mark.trio
+async def test_pipeline_missing_header(fake_db):
+    data = b"<?xml version='1.0'?><scan><runstats></runstats></scan>"
+    with pytest.raises(NmapXmlParseException, match="no <nmaprun> header"):
+        await run_pipeline(None, iter([data]))
+    assert fake_db["scans"] == {}
+
+
+@pytest.mark.trio
+@pytest.mark.parametrize("use_pool", [False, True])
+async def test_duplicate_upload(fake_db, parse_pool, monkeypatch, use_pool):
+    pool = parse_pool if use_pool else None
+    encoded = b64encode(FIXTURE_PATH.read_bytes()).decode("ascii")
+    scan_id, stats = await ingest_base64(None, encoded, pool=pool)
+    assert not stats.duplicate
+    assert fake_db["scans"][scan_id]["content_hash"] == content_hash(
+        [FIXTURE_PATH.read_bytes()]
+    )
+
+    inserted = list()
+    insert_host_documents = ScanDb.insert_host_documents
+
+    async def record_insert(db, scan_id, host_docs, *args, **kwargs):
+        inserted.extend(host_docs)
+        await insert_host_documents(db, scan_id, host_docs, *args, **kwargs)
+
+    monkeypatch.setattr(ScanDb, "insert_host_documents", record_insert)
+
+    # Line breaks in the base64 text do not change the hash.
+    wrapped = "\n".join(encoded[i : i + 76] for i in range(0, len(encoded), 76))
+    dup_id, dup_stats = await ingest_base64(None, wrapped, pool=pool)
+    assert dup_id == scan_id
+    assert dup_stats.duplicate
+    # The duplicate is found before it is parsed, so none of its hosts are inserted.
+    assert inserted == []
+    assert dup_stats.parse.items == 0
+    assert len(fake_db["scans"]) == 1
+    assert len(fake_db["hosts"]) == 27
+
+
+@pytest.mark.trio
+async def test_duplicate_upload_race(fake_db):
+    """ If identical uploads run at the same time, the first to finish is kept. """
+    data = FIXTURE_PATH.read_bytes()
+    results = list()
+
+    async def upload():
+        results.append(
+            await run_pipeline(
+                None, iter([data]), batch_size=5, digest=content_hash([data])
+            )
+        )
+
+    async with trio.open_nursery() as nursery:
+        nursery.start_soon(upload)
+        nursery.start_soon(upload)
+
+    (first_id, first_stats), (second_id, second_stats) = results
+    assert second_id == first_id
+    assert not first_stats.duplicate
+    assert second_stats.duplicate
+    assert list(fake_db["scans"]) == [first_id]
+    assert len(fake_db["hosts"]) == 27
+
+
+@pytest.mark.trio
+@pytest.mark.parametrize("use_pool", [False, True])
+async def test_failed_upload_is_deleted(fake_db, parse_pool, monkeypatch, use_pool):
+    """ A failed upload leaves no partial scan or hosts behind, and can be retried. """
+    encoded = b64encode(FIXTURE_PATH.read_bytes()).decode("ascii")
+    pool = parse_pool if use_pool else None
+    insert_host_documents = ScanDb.insert_host_documents
+    inserts = 0
+    # The pool pipeline inserts the whole fixture at once.
+    fail_at = 1 if use_pool else 2
+
+    async def fail_insert(db, scan_id, docs, host_ids=None, summary=None):
+        nonlocal inserts
+        inserts += 1
+        if inserts == fail_at:
+            # Part of the batch was written before the error.
+            fake_db["hosts"].extend(docs[:2])
+            raise RuntimeError("database went away")
+        await insert_host_documents(db, scan_id, docs, host_ids, summary)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(ScanDb, "insert_host_documents", fail_insert)
+        with pytest.raises(RuntimeError):
+            await ingest_base64(None, encoded, batch_size=5, pool=pool, chunk_size=4096)
+    assert fake_db["scans"] == {}
+    assert fake_db["hosts"] == []
+
+    scan_id, stats = await ingest_base64(None, encoded, pool=pool)
+    assert not stats.duplicate
+    assert len(fake_db["scans"][scan_id]["hosts"]) == 27
+
+
+@pytest.mark.trio
+async def test_cancelled_upload_is_deleted(fake_db, monkeypatch):
+    insert_host_documents = ScanDb.insert_host_documents
+
+    async def slow_insert(db, scan_id, docs, host_ids=None, summary=None):
+        await insert_host_documents(db, scan_id, docs, host_ids, summary)
+        await trio.sleep(1)
+
+    monkeypatch.setattr(ScanDb, "insert_host_documents", slow_insert)
+    with trio.move_on_after(0.5):
+        await run_pipeline(None, iter([FIXTURE_PATH.read_bytes()]), batch_size=5)
+    assert fake_db["scans"] == {}
+    assert fake_db["hosts"] == []
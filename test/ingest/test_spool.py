@@ -0,0 +1,175 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from base64 import b64encode
+from pathlib import Path
+
+import pymongo.errors
+import pytest
+import trio
+
+from darkwing.database.scan import ScanDb
+from darkwing.ingest.spool import Spool
+
+
+FIXTURE_PATH = Path(__file__).absolute().parent.parent / "nmap" / "test-scan.xml"
+
+
+def fixture_base64():
+    return b64encode(FIXTURE_PATH.read_bytes()).decode("ascii")
+
+
+async def wait_for_state(spool, upload_id, state):
+    with trio.fail_after(10):
+        while True:
+            status = await spool.status(upload_id)
+            if status and status["state"] == state:
+                return status
+            await trio.sleep(0.01)
+
+
+@pytest.mark.trio
+async def test_spool_put_and_drain(fake_db, tmp_path):
+    spool = Spool(tmp_path)
+    async with trio.open_nursery() as nursery:
+        await nursery.start(spool.run, None)
+        upload_id = await spool.put(fixture_base64())
+        status = await wait_for_state(spool, upload_id, "done")
+        nursery.cancel_scope.cancel()
+
+    assert status["scan_id"] in fake_db["scans"]
+    assert status["duplicate"] is False
+    assert status["stats"]["stages"]["write"]["items"] == 27
+    assert len(fake_db["scans"][status["scan_id"]]["hosts"]) == len(fake_db["hosts"])
+    assert not (tmp_path / "pending" / f"{upload_id}.b64").exists()
+    assert await spool.status("0" * 24) is None
+    assert await spool.status("../../etc/passwd") is None
+
+
+@pytest.mark.trio
+async def test_spool_recovers_after_restart(fake_db, tmp_path):
+    # Queue uploads without draining them, as if the server stopped.
+    spool = Spool(tmp_path)
+    await trio.to_thread.run_sync(spool._recover)
+    first_id = await spool.put(fixture_base64())
+    second_id = await spool.put(fixture_base64())
+    (tmp_path / "incoming" / "partial.b64").write_text("PG5tYXBy")
+    assert (await spool.status(first_id)) == {"state": "pending"}
+
+    spool = Spool(tmp_path)
+    async with trio.open_nursery() as nursery:
+        await nursery.start(spool.run, None)
+        first = await wait_for_state(spool, first_id, "done")
+        second = await wait_for_state(spool, second_id, "done")
+        nursery.cancel_scope.cancel()
+
+    assert not first["duplicate"]
+    assert second["duplicate"]
+    assert second["scan_id"] == first["scan_id"]
+    assert not list((tmp_path / "incoming").iterdir())
+
+
+@pytest.mark.trio
+async def test_spool_retries_database_errors(fake_db, tmp_path, monkeypatch):
+    start_scan = ScanDb.start_scan
+    failures = 2
+
+    async def flaky_start_scan(db, scan, source=None):
+        nonlocal failures
+        if failures:
+            failures -= 1
+            raise pymongo.errors.ServerSelectionTimeoutError("database is down")
+        return await start_scan(db, scan, source)
+
+    monkeypatch.setattr(ScanDb, "start_scan", flaky_start_scan)
+    spool = Spool(tmp_path, retry_delay=0)
+    async with trio.open_nursery() as nursery:
+        await nursery.start(spool.run, None)
+        upload_id = await spool.put(fixture_base64())
+        status = await wait_for_state(spool, upload_id, "done")
+        nursery.cancel_scope.cancel()
+
+    assert failures == 0
+    assert status["scan_id"] in fake_db["scans"]
+
+
+@pytest.mark.trio
+async def test_spool_resumes_after_database_error(fake_db, tmp_path, monkeypatch):
+    # Fail after the hosts have been staged, so the retry has to clean them up.
+    start_scan = ScanDb.start_scan
+    commit_checkpoint = ScanDb.commit_checkpoint
+    started = 0
+    failures = 1
+
+    async def counting_start_scan(db, scan, source=None):
+        nonlocal started
+        started += 1
+        return await start_scan(db, scan, source)
+
+    async def flaky_commit_checkpoint(db, scan_id, host_ids, summary, offset):
+        nonlocal failures
+        if failures:
+            failures -= 1
+            raise pymongo.errors.AutoReconnect("connection reset")
+        await commit_checkpoint(db, scan_id, host_ids, summary, offset)
+
+    monkeypatch.setattr(ScanDb, "start_scan", counting_start_scan)
+    monkeypatch.setattr(ScanDb, "commit_checkpoint", flaky_commit_checkpoint)
+    spool = Spool(tmp_path, retry_delay=0)
+    async with trio.open_nursery() as nursery:
+        await nursery.start(spool.run, None)
+        upload_id = await spool.put(fixture_base64())
+        status = await wait_for_state(spool, upload_id, "done")
+        nursery.cancel_scope.cancel()
+
+    assert failures == 0
+    assert started == 1
+    assert list(fake_db["scans"]) == [status["scan_id"]]
+    scan = fake_db["scans"][status["scan_id"]]
+    assert scan["checkpoint"] is None
+    assert len(scan["hosts"]) == len(fake_db["hosts"]) == 27
+
+
+@pytest.mark.trio
+async def test_spool_deletes_scan_of_failed_upload(fake_db, tmp_path, monkeypatch):
+    async def broken_commit_checkpoint(db, scan_id, host_ids, summary, offset):
+        raise ValueError("cannot commit")
+
+    monkeypatch.setattr(ScanDb, "commit_checkpoint", broken_commit_checkpoint)
+    spool = Spool(tmp_path)
+    async with trio.open_nursery() as nursery:
+        await nursery.start(spool.run, None)
+        upload_id = await spool.put(fixture_base64())
+        await wait_for_state(spool, upload_id, "failed")
+        nursery.cancel_scope.cancel()
+
+    assert not fake_db["scans"]
+    assert not fake_db["hosts"]
+
+
+@pytest.mark.trio
+async def test_spool_moves_bad_upload_to_failed(fake_db, tmp_path):
+    spool = Spool(tmp_path)
+    async with trio.open_nursery() as nursery:
+        await nursery.start(spool.run, None)
+        upload_id = await spool.put(b64encode(b"this is not a scan").decode("ascii"))
+        status = await wait_for_state(spool, upload_id, "failed")
+        nursery.cancel_scope.cancel()
+
+    assert status["error"]
+    assert (tmp_path / "failed" / f"{upload_id}.b64").exists()
+    assert not (tmp_path / "pending" / f"{upload_id}.b64").exists()
+    assert not fake_db["scans"]
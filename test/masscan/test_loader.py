@@ -0,0 +1,157 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from datetime import datetime
+import gzip
+from ipaddress import IPv4Address
+
+import pytest
+
+from darkwing.masscan import loader
+from darkwing.masscan.loader import (
+    MasscanParseException,
+    iter_masscan,
+    load_masscan,
+)
+from darkwing.model.host import HostState, PortState, Transport
+
+
+MASSCAN_XML = b"""<?xml version="1.0"?>
+<!-- masscan v1.0 scan -->
+<?xml-stylesheet href="" type="text/xsl"?>
+<nmaprun scanner="masscan" start="1587479712" version="1.0-BETA"  xmloutputversion="1.03">
+<scaninfo type="syn" protocol="tcp" />
+<host endtime="1587479713"><address addr="10.0.0.1" addrtype="ipv4"/><ports><port protocol="tcp" portid="80"><state state="open" reason="syn-ack" reason_ttl="64"/></port></ports></host>
+<host endtime="1587479714"><address addr="10.0.0.2" addrtype="ipv4"/><ports><port protocol="tcp" portid="22"><state state="open" reason="syn-ack" reason_ttl="64"/></port></ports></host>
+<host endtime="1587479715"><address addr="10.0.0.1" addrtype="ipv4"/><ports><port protocol="tcp" portid="443"><state state="open" reason="syn-ack" reason_ttl="64"/></port></ports></host>
+<host endtime="1587479716"><address addr="10.0.0.1" addrtype="ipv4"/><ports><port protocol="tcp" portid="80"><state state="open" reason="response" reason_ttl="64"/><service name="http" banner="nginx"></service></port></ports></host>
+<runstats>
+<finished time="1587479720" timestr="2020-04-21 14:35:20" elapsed="8" />
+<hosts up="2" down="0" total="2" />
+</runstats>
+</nmaprun>
+"""
+
+MASSCAN_JSON = b"""[
+{   "ip": "10.0.0.1",   "timestamp": "1587479713", "ports": [ {"port": 80, "proto": "tcp", "status": "open", "reason": "syn-ack", "ttl": 64} ] },
+{   "ip": "10.0.0.2",   "timestamp": "1587479714", "ports": [ {"port": 53, "proto": "udp", "status": "open", "reason": "none", "ttl": 64} ] },
+{   "ip": "10.0.0.1",   "timestamp": "1587479715", "ports": [ {"port": 443, "proto": "tcp", "status": "open", "reason": "syn-ack", "ttl": 64} ] },
+{   "ip": "10.0.0.1",   "timestamp": "1587479716", "ports": [ {"port": 80, "proto": "tcp", "service": {"name": "http", "banner": "nginx"} } ] },
+{   "ip": "10.0.0.2",   "timestamp": "1587479717", "ports": [ {"port": 0, "proto": "icmp", "status": "open", "reason": "none", "ttl": 64} ] }
+]
+"""
+
+MASSCAN_NDJSON = b"""{"ip": "10.0.0.1", "timestamp": "1587479713", "ports": [{"port": 80, "proto": "tcp", "status": "open", "reason": "syn-ack", "ttl": 64}]}
+{"ip": "10.0.0.2", "timestamp": "1587479714", "ports": [{"port": 53, "proto": "udp", "status": "open", "reason": "none", "ttl": 64}]}
+{"ip": "10.0.0.1", "timestamp": "1587479715", "ports": [{"port": 443, "proto": "tcp", "status": "open", "reason": "syn-ack", "ttl": 64}]}
+{"ip": "10.0.0.1", "timestamp": "1587479716", "ports": [{"port": 80, "proto": "tcp", "service": {"name": "http", "banner": "nginx"}}]}
+{finished: 1}
+"""
+
+
+def write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(gzip.compress(data) if name.endswith(".gz") else data)
+    return path
+
+
+def test_load_masscan_xml(tmp_path):
+    scan = load_masscan(write(tmp_path, "scan.xml", MASSCAN_XML))
+    assert scan.scanner == "masscan"
+    assert scan.scanner_version == "1.0-BETA"
+    assert scan.started == datetime(2020, 4, 21, 14, 35, 12)
+    assert scan.completed == datetime(2020, 4, 21, 14, 35, 20)
+    assert len(scan.hosts) == 2
+
+    host = scan.hosts[0]
+    assert host.addresses == [IPv4Address("10.0.0.2")]
+    assert host.state == HostState.UP
+    assert [p.number for p in host.ports] == [22]
+
+    host = scan.hosts[1]
+    assert host.addresses == [IPv4Address("10.0.0.1")]
+    assert host.started == datetime(2020, 4, 21, 14, 35, 13)
+    assert host.completed == datetime(2020, 4, 21, 14, 35, 16)
+    assert [p.number for p in host.ports] == [80, 443]
+    http = host.ports[0]
+    assert http.transport == Transport.TCP
+    assert http.state == PortState.OPEN
+    assert http.state_reason == "response"
+    assert http.service.name == "http"
+
+
+@pytest.mark.parametrize(
+    "name,data",
+    [
+        ("scan.json", MASSCAN_JSON),
+        ("scan.json.gz", MASSCAN_JSON),
+        ("scan.ndjson", MASSCAN_NDJSON),
+    ],
+)
+def test_load_masscan_json(tmp_path, name, data):
+    scan = load_masscan(write(tmp_path, name, data))
+    assert scan.scanner_version is None
+    assert scan.started == datetime(2020, 4, 21, 14, 35, 13)
+    hosts = {str(h.addresses[0]): h for h in scan.hosts}
+    assert len(hosts) == 2
+
+    host = hosts["10.0.0.1"]
+    assert [p.number for p in host.ports] == [80, 443]
+    http = host.ports[0]
+    assert http.state == PortState.OPEN
+    assert http.state_reason == "syn-ack"
+    assert http.service.name == "http"
+
+    # The ICMP record is not representable and is skipped.
+    host = hosts["10.0.0.2"]
+    assert [(p.number, p.transport) for p in host.ports] == [(53, Transport.UDP)]
+
+
+def test_iter_masscan_window(tmp_path):
+    """ With a window of 1, a host is emitted each time a different host appears. """
+    scan, hosts = iter_masscan(write(tmp_path, "scan.json", MASSCAN_NDJSON), window=1)
+    addresses = [(str(h.addresses[0]), [p.number for p in h.ports]) for h in hosts]
+    assert addresses == [
+        ("10.0.0.1", [80]),
+        ("10.0.0.2", [53]),
+        ("10.0.0.1", [443, 80]),
+    ]
+    assert scan.hosts == []
+
+
+def test_load_masscan_invalid(tmp_path):
+    with pytest.raises(MasscanParseException):
+        load_masscan(write(tmp_path, "scan.txt", b"open tcp 80 10.0.0.1 1587479713"))
+
+
+def test_iter_masscan_closes_file(tmp_path, monkeypatch):
+    """ The file is opened lazily and closed when the iterator is abandoned. """
+    streams = list()
+    original_open_scan = loader.open_scan
+
+    def open_scan(path):
+        stream = original_open_scan(path)
+        streams.append(stream)
+        return stream
+
+    monkeypatch.setattr(loader, "open_scan", open_scan)
+    path = write(tmp_path, "scan.json.gz", MASSCAN_NDJSON)
+    scan, hosts = iter_masscan(path, window=1)
+    assert all(stream.closed for stream in streams)
+    next(hosts)
+    assert not streams[-1].closed
+    hosts.close()
+    assert all(stream.closed for stream in streams)
@@ -0,0 +1,130 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from datetime import datetime
+from ipaddress import IPv6Address
+from pathlib import Path
+
+import bson
+from bson.raw_bson import RawBSONDocument
+import pytest
+
+from darkwing.database.host import hosts_summary
+from darkwing.database.scan import _host_to_dict
+from darkwing.nmap.documents import (
+    encode_document,
+    encode_hosts,
+    host_document,
+    raw_host_document,
+)
+from darkwing.nmap.loader import convert_host
+from darkwing.nmap.parser import (
+    Host,
+    NmapXmlParser,
+    ParseFilter,
+    Port,
+    PortState,
+    Service,
+    Status,
+)
+
+
+FIXTURE_PATH = Path(__file__).absolute().parent / "test-scan.xml"
+
+
+def fixture_hosts(parse_filter=None):
+    parser = NmapXmlParser(parse_filter=parse_filter)
+    parser.feed(FIXTURE_PATH.read_bytes())
+    return [e for e in parser.events() if isinstance(e, Host)]
+
+
+@pytest.mark.parametrize(
+    "parse_filter", [None, ParseFilter(port_states=frozenset({"open"}), cpes=False)]
+)
+def test_documents_match_model_path(parse_filter):
+    hosts = fixture_hosts(parse_filter)
+    assert hosts
+    for event in hosts:
+        assert host_document(event) == _host_to_dict(convert_host(event))
+
+
+def test_documents_match_model_path_edge_cases():
+    """ Ports without state or service, and hosts without an address. """
+    when = datetime(2020, 4, 21, 14, 35, 12)
+    hosts = [
+        Host(
+            when,
+            when,
+            address=IPv6Address("2001:db8::1"),
+            status=Status("down", "no-response"),
+            ports=[
+                Port("udp", 53),
+                Port("tcp", 22, PortState("open", "syn-ack"), Service("ssh", "", "")),
+            ],
+        ),
+        Host(when, when, status=Status("up", "user-set")),
+    ]
+    for event in hosts:
+        assert host_document(event) == _host_to_dict(convert_host(event))
+
+
+def test_document_invalid_values():
+    when = datetime(2020, 4, 21, 14, 35, 12)
+    with pytest.raises(Exception):
+        host_document(Host(when, when))
+    with pytest.raises(Exception):
+        host_document(Host(when, when, status=Status("sideways", "")))
+    with pytest.raises(Exception):
+        host_document(
+            Host(when, when, status=Status("up", ""), ports=[Port("sctp", 80)])
+        )
+    with pytest.raises(Exception):
+        host_document(
+            Host(
+                when,
+                when,
+                status=Status("up", ""),
+                ports=[Port("tcp", 80, PortState("unfiltered", ""))],
+            )
+        )
+
+
+def test_raw_host_document():
+    for event in fixture_hosts():
+        raw = raw_host_document(event)
+        assert isinstance(raw, RawBSONDocument)
+        assert isinstance(raw["_id"], bson.ObjectId)
+        expected = host_document(event)
+        expected["_id"] = raw["_id"]
+        assert raw.raw == bson.encode(expected)
+
+
+def test_encode_document_keeps_id():
+    id_ = bson.ObjectId()
+    raw = encode_document({"_id": id_, "addresses": ["10.0.0.1"]})
+    assert raw["_id"] == id_
+    assert raw["addresses"] == ["10.0.0.1"]
+
+
+def test_encode_hosts():
+    events = fixture_hosts()
+    host_ids, docs, summary = encode_hosts(events)
+    assert len(host_ids) == len(docs) == len(events)
+    assert summary == hosts_summary(host_document(event) for event in events)
+    for event, host_id, raw in zip(events, host_ids, docs):
+        expected = host_document(event)
+        expected["_id"] = host_id
+        assert raw == bson.encode(expected)
@@ -18,13 +18,18 @@ from datetime import datetime
 from ipaddress import IPv4Address
 from pathlib import Path
 
+import pytest
+
 from darkwing.model.host import HostState, PortState, Transport
-from darkwing.nmap.loader import load_scan
+from darkwing.nmap.loader import iter_path, iter_scan, load_scan
+from darkwing.nmap.parser import NmapXmlParseException
+
+
+FIXTURE_PATH = Path(__file__).absolute().parent / "test-scan.xml"
 
 
 def test_load_scan():
-    fixture_path = Path(__file__).absolute().parent / "test-scan.xml"
-    with fixture_path.open("r") as fixture:
+    with FIXTURE_PATH.open("r") as fixture:
         scan = load_scan(fixture.read())
     assert scan.scanner == "nmap"
     assert scan.scanner_version == "7.80"
@@ -55,3 +60,30 @@ def test_load_scan():
     assert port0.service.product is None
     assert port0.service.version is None
 
+
+def test_iter_scan_batches():
+    expected = load_scan(FIXTURE_PATH.read_text())
+    scan, batches = iter_scan(FIXTURE_PATH.read_bytes(), batch_size=10)
+    assert scan.scanner_version == "7.80"
+    assert scan.started == datetime(2020, 4, 21, 14, 35, 12)
+    assert scan.completed is None
+    assert scan.hosts == []
+
+    batches = list(batches)
+    assert [len(batch) for batch in batches] == [10, 10, 7]
+    assert [host for batch in batches for host in batch] == expected.hosts
+    assert scan.completed == datetime(2020, 4, 21, 14, 58, 7)
+
+
+def test_iter_path_batches():
+    expected = load_scan(FIXTURE_PATH.read_text())
+    scan, batches = iter_path(FIXTURE_PATH, batch_size=100)
+    batches = list(batches)
+    assert len(batches) == 1
+    assert batches[0] == expected.hosts
+    assert scan.completed == expected.completed
+
+
+def test_iter_scan_missing_header():
+    with pytest.raises(NmapXmlParseException, match="no <nmaprun> header"):
+        iter_scan(b"<scan><runstats></runstats></scan>")
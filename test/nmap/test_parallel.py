@@ -0,0 +1,105 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import gzip
+import io
+from pathlib import Path
+
+import pytest
+
+from darkwing.nmap.loader import load_scan
+from darkwing.nmap.parallel import (
+    HostRangeReader,
+    find_host_ranges,
+    load_scan_parallel,
+)
+
+
+FIXTURE_PATH = Path(__file__).absolute().parent / "test-scan.xml"
+
+
+@pytest.mark.parametrize("pieces", [1, 2, 5, 1000])
+def test_find_host_ranges(pieces):
+    """ Ranges should be contiguous and each should hold only complete hosts. """
+    data = FIXTURE_PATH.read_bytes()
+    header_end, footer_start, ranges = find_host_ranges(data, pieces)
+    assert data[header_end:].startswith(b"<host ")
+    assert data[:footer_start].endswith(b"</host>")
+    assert ranges[0][0] == header_end
+    assert ranges[-1][1] == footer_start
+    assert len(ranges) <= min(pieces, 27)
+    for (_, end), (start, _) in zip(ranges, ranges[1:]):
+        assert end == start
+    for start, end in ranges:
+        piece = data[start:end]
+        assert piece.count(b"<host ") == piece.count(b"</host>")
+
+
+def test_find_host_ranges_without_hosts():
+    data = b'<nmaprun scanner="nmap"><runstats></runstats></nmaprun>'
+    assert find_host_ranges(data, 4) == (len(data), len(data), [])
+
+
+@pytest.mark.parametrize("piece_size", [1, 5000, 1 << 20])
+def test_host_range_reader(piece_size):
+    """ Pieces should be contiguous and each should hold only complete hosts. """
+    data = FIXTURE_PATH.read_bytes()
+    stream = gzip.GzipFile(fileobj=io.BytesIO(gzip.compress(data)))
+    reader = HostRangeReader(stream, piece_size)
+    pieces = list(reader)
+    assert reader.header + b"".join(p for _, _, p in pieces) + reader.footer == data
+    assert pieces[0][0] == len(reader.header)
+    for start, end, piece in pieces:
+        assert data[start:end] == piece
+        assert piece.endswith(b"</host>")
+        assert piece.count(b"<host ") == piece.count(b"</host>")
+    assert len(pieces) == (27 if piece_size == 1 else 1 if piece_size > 1e6 else 10)
+
+
+def test_host_range_reader_skip_to():
+    data = FIXTURE_PATH.read_bytes()
+    pieces = list(HostRangeReader(io.BytesIO(data), 5000))
+    reader = HostRangeReader(io.BytesIO(data), 5000)
+    reader.skip_to(pieces[4][0])
+    assert list(reader) == pieces[4:]
+    with pytest.raises(Exception):
+        HostRangeReader(io.BytesIO(data), 5000).skip_to(len(data) + 1)
+
+
+def test_host_range_reader_without_hosts():
+    data = b'<nmaprun scanner="nmap"><runstats></runstats></nmaprun>'
+    reader = HostRangeReader(io.BytesIO(data), 4)
+    assert list(reader) == []
+    assert reader.header == data
+
+
+def test_load_scan_parallel_bytes():
+    data = FIXTURE_PATH.read_bytes()
+    assert load_scan_parallel(data, workers=2, pieces=5) == load_scan(data)
+
+
+@pytest.mark.parametrize("engine", ["sax", "lxml"])
+def test_load_scan_parallel_path(engine):
+    scan = load_scan_parallel(FIXTURE_PATH, workers=2, pieces=7, engine=engine)
+    assert scan == load_scan(FIXTURE_PATH.read_bytes())
+
+
+def test_load_scan_parallel_compressed(tmp_path):
+    """ Compressed files cannot be split, but they should still load. """
+    path = tmp_path / "scan.xml.gz"
+    data = FIXTURE_PATH.read_bytes()
+    path.write_bytes(gzip.compress(data))
+    assert load_scan_parallel(path, workers=2) == load_scan(data)
@@ -18,16 +18,24 @@ from datetime import datetime
 from pathlib import Path
 from ipaddress import IPv4Address
 
-from darkwing.nmap.parser import NmapXmlParser
+import pytest
 
+from darkwing.nmap.parser import (
+    Host,
+    NmapXmlParseException,
+    NmapXmlParser,
+    ParseFilter,
+)
 
-def test_incremental_parse():
+
+@pytest.mark.parametrize("engine", NmapXmlParser.ENGINES)
+def test_incremental_parse(engine):
     """
     Feed the nmap parser small increments of XML and check that it generates the proper
     events.
     """
     # The first chunk of XML produces one event for the <nmaprun> element.
-    parser = NmapXmlParser()
+    parser = NmapXmlParser(engine)
     parser.feed(
         """<?xml version="1.0" encoding="utf-8"?>
     <!DOCTYPE nmaprun>
@@ -79,6 +87,7 @@ def test_incremental_parse():
     assert progress.task == "Connect Scan"
     assert progress.time == datetime(2020, 4, 21, 12, 54, 47)
     assert progress.percent == 0.17
+    assert progress.remaining is None
 
     # This chunk produces one Host event at the closing </host> tag.
     parser.feed(
@@ -205,9 +214,10 @@ def test_incremental_parse():
     assert finished.exit == "success"
 
 
-def test_scan_file():
+@pytest.mark.parametrize("engine", NmapXmlParser.ENGINES)
+def test_scan_file(engine):
     """ Test the nmap parser on a larger scan file. """
-    parser = NmapXmlParser()
+    parser = NmapXmlParser(engine)
     fixture_path = Path(__file__).absolute().parent / "test-scan.xml"
     with fixture_path.open("r") as fixture:
         while fixture_data := fixture.read(4096):
@@ -233,6 +243,8 @@ def test_scan_file():
     assert taskprogress1.task == "Connect Scan"
     assert taskprogress1.time == datetime(2020, 4, 21, 14, 53, 26)
     assert taskprogress1.percent == 100
+    assert taskprogress1.remaining == 1
+    assert taskprogress1.est_completion == datetime(2020, 4, 21, 14, 53, 26)
 
     taskprogress2 = next(event)
     assert taskprogress2.task == "Connect Scan"
@@ -276,3 +288,147 @@ def test_scan_file():
     # Check that there are 26 remaining events.
     assert len(list(event)) == 27
 
+
+def test_engines_produce_same_events():
+    """ The SAX and lxml engines should produce identical events. """
+    fixture_path = Path(__file__).absolute().parent / "test-scan.xml"
+    fixture_data = fixture_path.read_bytes()
+    events = dict()
+    for engine in NmapXmlParser.ENGINES:
+        parser = NmapXmlParser(engine)
+        for offset in range(0, len(fixture_data), 1000):
+            parser.feed(fixture_data[offset : offset + 1000])
+        events[engine] = list(parser.events())
+    assert len(events["sax"]) == 32
+    assert events["sax"] == events["lxml"]
+
+
+def test_invalid_engine():
+    with pytest.raises(NmapXmlParseException):
+        NmapXmlParser("expat")
+
+
+@pytest.mark.parametrize("engine", NmapXmlParser.ENGINES)
+def test_text_capture_across_feeds(engine):
+    """
+    Text nodes that arrive in many pieces should be reassembled in order, and elements
+    without handlers should be ignored.
+    """
+    parser = NmapXmlParser(engine)
+    parser.feed(
+        """<nmaprun scanner="nmap" args="nmap" start="1587473684" version="7.80">
+    <host starttime="1587473685" endtime="1587473695">
+        <status state="up" reason="syn-ack" reason_ttl="0" />
+        <address addr="128.220.176.12" addrtype="ipv4" />
+        <unknown-element foo="bar" />
+        <ports>
+        <port protocol="tcp" portid="443">
+            <state state="open" reason="syn-ack" reason_ttl="0" />
+            <service name="https" method="table" conf="3">"""
+    )
+    body = "\n".join(f"line {i} &amp; more" for i in range(200))
+    for char in f"""<cpe> cpe:/a:example </cpe></service>
+            <script id="ssl-cert" output="cert"><elem key="pem">{body}</elem></script>
+        </port>
+        </ports>
+    </host>""":
+        parser.feed(char)
+    events = list(parser.events())
+    port = events[1].ports[0]
+    assert port.cpes == ["cpe:/a:example"]
+    assert port.script["ssl-cert"]["pem"] == body.replace("&amp;", "&")
+
+
+def parse_fixture(engine, parse_filter):
+    parser = NmapXmlParser(engine, parse_filter)
+    fixture_path = Path(__file__).absolute().parent / "test-scan.xml"
+    parser.feed(fixture_path.read_bytes())
+    return [e for e in parser.events() if isinstance(e, Host)]
+
+
+@pytest.mark.parametrize("engine", NmapXmlParser.ENGINES)
+def test_filter_port_states(engine):
+    """ Only open ports should be built, and everything else should be unchanged. """
+    unfiltered = parse_fixture(engine, None)
+    hosts = parse_fixture(engine, ParseFilter(port_states=frozenset({"open"})))
+    assert len(hosts) == len(unfiltered)
+    for host, expected in zip(hosts, unfiltered):
+        assert host.address == expected.address
+        assert host.ports == [p for p in expected.ports if p.state.state == "open"]
+
+
+@pytest.mark.parametrize("engine", NmapXmlParser.ENGINES)
+def test_filter_scripts_and_cpes(engine):
+    hosts = parse_fixture(engine, ParseFilter(scripts=False, cpes=False))
+    port = hosts[0].ports[2]
+    assert port.service.product == "dnsmasq"
+    assert port.cpes is None
+    assert port.script is None
+    assert all(not p.cpes and not p.script for h in hosts for p in h.ports)
+
+
+@pytest.mark.parametrize("engine", NmapXmlParser.ENGINES)
+def test_filter_host_states(engine):
+    """ Hosts that are down should be skipped entirely. """
+    parser = NmapXmlParser(engine, ParseFilter(host_states=frozenset({"up"})))
+    parser.feed(
+        """<nmaprun scanner="nmap" args="nmap" start="1587473684" version="7.80">
+    <host starttime="1587473685" endtime="1587473695">
+        <status state="down" reason="no-response" reason_ttl="0" />
+        <address addr="10.0.0.1" addrtype="ipv4" />
+        <ports><port protocol="tcp" portid="22">
+            <state state="filtered" reason="no-response" reason_ttl="0" />
+        </port></ports>
+    </host>
+    <host starttime="1587473685" endtime="1587473695">
+        <status state="up" reason="syn-ack" reason_ttl="0" />
+        <address addr="10.0.0.2" addrtype="ipv4" />
+    </host>
+    </nmaprun>"""
+    )
+    hosts = [e for e in parser.events() if isinstance(e, Host)]
+    assert len(hosts) == 1
+    assert hosts[0].address == IPv4Address("10.0.0.2")
+
+
+def test_events_are_slotted():
+    """ Event objects should not carry a per-instance __dict__. """
+    for host in parse_fixture("sax", None):
+        assert not hasattr(host, "__dict__")
+        for port in host.ports:
+            assert not hasattr(port, "__dict__")
+            assert not hasattr(port.state, "__dict__")
+            assert port.cpes is None or len(port.cpes) > 0
+            assert port.script is None or len(port.script) > 0
+
+
+def test_intern_pool():
+    """ Repeated attribute values should share one string object. """
+    hosts = parse_fixture("lxml", None)
+    states = [p.state.state for h in hosts for p in h.ports if p.state.state == "open"]
+    assert len(states) > 1
+    assert all(state is states[0] for state in states)
+
+
+def test_intern_pool_limit():
+    """
+    Values are pooled until the pool is full. After that, values already in the pool
+    are still shared, but new values are returned as is.
+    """
+
+    def make(text):
+        # Build a new string object at runtime, so that it is not a compile-time
+        # constant or one of CPython's cached single-character strings.
+        return "".join(list(text))
+
+    parser = NmapXmlParser(intern_limit=2)
+    first, second = parser.intern(make("open")), parser.intern(make("closed"))
+    again = make("open")
+    assert again is not first
+    assert parser.intern(again) is first
+    assert parser.intern(make("closed")) is second
+    third = make("filtered")
+    assert parser.intern(third) is third
+    fourth = make("filtered")
+    assert fourth is not third
+    assert parser.intern(fourth) is fourth
@@ -0,0 +1,108 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import bz2
+import gzip
+import io
+import lzma
+from pathlib import Path
+
+import pytest
+
+from darkwing.nmap.loader import load_path, load_scan
+from darkwing.nmap.parser import Host, NmapXmlParser
+from darkwing.nmap.stream import parse_path, parse_stream
+
+
+FIXTURE_PATH = Path(__file__).absolute().parent / "test-scan.xml"
+
+
+def expected_events():
+    parser = NmapXmlParser()
+    parser.feed(FIXTURE_PATH.read_bytes())
+    return list(parser.events())
+
+
+def test_parse_stream_small_chunks():
+    """ Events should be identical no matter how the stream is chunked. """
+    stream = io.BytesIO(FIXTURE_PATH.read_bytes())
+    assert list(parse_stream(stream, chunk_size=97)) == expected_events()
+
+
+def test_parse_stream_yields_incrementally():
+    """ The first host should be yielded before the whole stream is read. """
+    stream = io.BytesIO(FIXTURE_PATH.read_bytes())
+    events = parse_stream(stream, chunk_size=4096)
+    while not isinstance(next(events), Host):
+        pass
+    assert stream.tell() < len(stream.getvalue())
+
+
+@pytest.mark.parametrize(
+    "suffix,compress",
+    [
+        (".xml", lambda data: data),
+        (".xml.gz", gzip.compress),
+        (".xml.bz2", bz2.compress),
+        (".xml.xz", lzma.compress),
+    ],
+)
+@pytest.mark.parametrize("engine", NmapXmlParser.ENGINES)
+def test_parse_path(tmp_path, suffix, compress, engine):
+    path = tmp_path / f"scan{suffix}"
+    path.write_bytes(compress(FIXTURE_PATH.read_bytes()))
+    assert list(parse_path(path, chunk_size=1000, engine=engine)) == expected_events()
+
+
+@pytest.mark.parametrize("name", ["scan.xml", "scan.xml.gz"])
+@pytest.mark.parametrize("engine", NmapXmlParser.ENGINES)
+def test_parse_path_mmap(tmp_path, name, engine):
+    """ mmap applies to plain files and is ignored for compressed files. """
+    path = tmp_path / name
+    data = FIXTURE_PATH.read_bytes()
+    path.write_bytes(gzip.compress(data) if name.endswith(".gz") else data)
+    events = parse_path(path, chunk_size=1000, engine=engine, use_mmap=True)
+    assert list(events) == expected_events()
+
+
+def test_parse_path_mmap_does_not_copy(tmp_path, monkeypatch):
+    path = tmp_path / "scan.xml"
+    path.write_bytes(FIXTURE_PATH.read_bytes())
+    fed = list()
+    feed = NmapXmlParser.feed
+
+    def recording_feed(self, data):
+        fed.append(type(data))
+        feed(self, data)
+
+    monkeypatch.setattr(NmapXmlParser, "feed", recording_feed)
+    events = parse_path(path, chunk_size=1000, use_mmap=True)
+    next(events)
+    # Closing the generator early must release the views so that the map can close.
+    events.close()
+    assert fed and set(fed) == {memoryview}
+
+
+def test_parse_path_mmap_empty_file(tmp_path):
+    path = tmp_path / "empty.xml"
+    path.write_bytes(b"")
+    assert list(parse_path(path, use_mmap=True)) == []
+
+
+def test_load_path(tmp_path):
+    path = tmp_path / "scan.xml.gz"
+    path.write_bytes(gzip.compress(FIXTURE_PATH.read_bytes()))
+    assert load_path(path) == load_scan(FIXTURE_PATH.read_bytes())
@@ -0,0 +1,98 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from pathlib import Path
+from types import SimpleNamespace
+
+import bson
+import pytest
+from trio_jsonrpc import JsonRpcInvalidParamsError
+
+from darkwing.database.host import MAX_GET_HOSTS, Host, HostDb
+from darkwing.nmap.documents import host_document
+from darkwing.nmap.parser import Host as NmapHost, NmapXmlParser
+from darkwing.server import dispatch
+from darkwing.server.host import _jsonify_host
+
+
+FIXTURE_PATH = Path(__file__).absolute().parent.parent / "nmap" / "test-scan.xml"
+
+
+def fixture_host():
+    parser = NmapXmlParser()
+    parser.feed(FIXTURE_PATH.read_bytes())
+    event = next(e for e in parser.events() if isinstance(e, NmapHost) and e.ports)
+    doc = host_document(event)
+    doc["_id"] = bson.ObjectId()
+    return Host.from_db(doc)
+
+
+def test_jsonify_host():
+    host = fixture_host()
+    host_json = _jsonify_host(host)
+    assert host_json["host_id"] == host.host_id
+    assert host_json["started"] == host.started.isoformat()
+    assert host_json["state"] == host.state
+    assert host_json["addresses"] == [str(addr) for addr in host.addresses]
+    assert len(host_json["ports"]) == len(host.ports)
+    port_json, port = host_json["ports"][0], host.ports[0]
+    assert port_json["number"] == port.number
+    assert port_json["transport"] == port.transport.name
+    assert port_json["state"] == port.state.name
+    assert port_json["service"]["name"] == port.service.name
+
+    assert _jsonify_host(host, ["hostnames", "state"]) == {
+        "host_id": host.host_id,
+        "hostnames": host.hostnames,
+        "state": host.state,
+    }
+
+
+async def call_get_hosts(*args):
+    handler = dispatch.get_handler("get_hosts")
+    async with dispatch.connection_context(SimpleNamespace(db=None)):
+        return await handler(*args)
+
+
+@pytest.mark.trio
+async def test_get_hosts_rpc(monkeypatch):
+    host = fixture_host()
+    calls = list()
+
+    async def get_hosts(db, ids, fields=None):
+        calls.append((ids, fields))
+        return [host if id_ == host.host_id else None for id_ in ids]
+
+    monkeypatch.setattr(HostDb, "get_hosts", get_hosts)
+    missing = str(bson.ObjectId())
+    result = await call_get_hosts([missing, host.host_id], ["ports"])
+    assert calls == [([missing, host.host_id], ["ports"])]
+    assert result == [None, _jsonify_host(host, ["ports"])]
+    assert set(result[1]) == {"host_id", "ports"}
+
+
+@pytest.mark.trio
+async def test_get_hosts_rpc_invalid_params(monkeypatch):
+    async def get_hosts(db, ids, fields=None):
+        raise AssertionError("The database should not be queried")
+
+    monkeypatch.setattr(HostDb, "get_hosts", get_hosts)
+    with pytest.raises(JsonRpcInvalidParamsError, match="Invalid host ID"):
+        await call_get_hosts(["not an ID"])
+    with pytest.raises(JsonRpcInvalidParamsError, match="Unknown host fields"):
+        await call_get_hosts([str(bson.ObjectId())], ["ports", "password"])
+    with pytest.raises(JsonRpcInvalidParamsError, match="more than"):
+        await call_get_hosts([str(bson.ObjectId())] * (MAX_GET_HOSTS + 1))
@@ -0,0 +1,44 @@
+# Darkwing: Let's get IP-rangerous!
+# Copyright (C) 2020 Mark E. Haase <mehaase@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from types import SimpleNamespace
+
+import pytest
+
+from darkwing.ingest.pipeline import PipelineStats
+from darkwing.server import dispatch, scan
+
+
+@pytest.mark.trio
+async def test_upload_scan_returns_stats(monkeypatch):
+    stats = PipelineStats(elapsed=1.5)
+    stats.write.items = 27
+
+    async def ingest_base64(db, data, pool=None):
+        return "0" * 24, stats
+
+    monkeypatch.setattr(scan, "ingest_base64", ingest_base64)
+    handler = dispatch.get_handler("upload_scan")
+    context = SimpleNamespace(db=None, parse_pool=None, spool=None)
+    async with dispatch.connection_context(context):
+        result = await handler("PG5tYXBydW4+")
+    assert result == {
+        "upload_id": None,
+        "scan_id": "0" * 24,
+        "duplicate": False,
+        "stats": stats.to_json(),
+    }
+    assert result["stats"]["stages"]["write"]["items"] == 27